@@ -1,7 +1,9 @@
 import logging
 import os
 
-from pysilpo.client import Silpo
+from pysilpo.account_pool import AccountPool
+from pysilpo.client import AsyncSilpo, Silpo
+from pysilpo.utils.transport import AsyncTransport, Transport
 
 __version__ = "1.0.2"
 
@@ -13,4 +15,4 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-__all__ = ("__version__", "Silpo")
+__all__ = ("__version__", "AccountPool", "AsyncSilpo", "AsyncTransport", "Silpo", "Transport")
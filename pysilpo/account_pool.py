@@ -0,0 +1,208 @@
+from collections import deque
+from collections.abc import Generator, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Callable, Optional
+
+from pysilpo.services.authorization import User
+from pysilpo.services.cheque import Cheque, ChequeModel
+from pysilpo.utils.cache import CacheBackend, TieredCache, get_cache
+from pysilpo.utils.transport import Transport, get_default_transport
+from pysilpo.utils.utils import get_logger
+
+
+@dataclass
+class AccountProgress:
+    """
+    :param phone_number: Phone number of the account
+    :param cheques: How many cheques are fetched
+    :param details: How many details are fetched
+    :param done: Whether all cheques of the account are fetched or the account has failed
+    :param error: Why the account has failed, its remaining cheques are skipped
+    """
+
+    phone_number: str
+    cheques: int = 0
+    details: int = 0
+    done: bool = False
+    error: Optional[Exception] = None
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
+class _Account:
+    """Scheduling state of one account."""
+
+    def __init__(self, cheque: Cheque, chunks: Generator[list[ChequeModel], None, None]):
+        self.cheque = cheque
+        self.chunks = chunks
+        self.progress = AccountProgress(cheque.user.phone_number)
+        # Fetched cheques which wait for their details
+        self.pending: deque[ChequeModel] = deque()
+        self.in_flight = 0
+        self.fetching_chunk = False
+        self.chunks_done = False
+
+
+class AccountPool:
+    """
+    Collects cheques of many logged in accounts with one pool of workers.
+
+    All accounts share one transport, i.e. connection pools, rate limits and retries, and the cached OpenID
+    configuration.
+    Workers are shared fairly: accounts take turns, and one account runs at most `max_per_account` requests at once,
+    so a single account with a long history doesn't hold back the others. Failed accounts are reported
+    in `progress` and don't stop the rest.
+
+    Accounts should be logged in before, e.g. with Silpo(phone_number=...), so their tokens or cookies are in the cache.
+    An account without a cached token, e.g. it has expired since the last run, gets a new one with the cached cookies.
+    """
+
+    logger = get_logger("pysilpo.account_pool.AccountPool")
+
+    def __init__(
+        self,
+        phone_numbers: Iterable[str],
+        transport: Optional[Transport] = None,
+        cache: Optional[CacheBackend] = None,
+        max_workers: int = 16,
+        max_per_account: int = 2,
+    ):
+        """
+        :param phone_numbers: Phone numbers of the accounts in format +380XXYYYYYYY
+        :param transport: HTTP transport shared by all accounts, the process-wide one by default
+        :param cache: Cache backend of tokens and cookies, the process-wide cache by default
+        :param max_workers: How many requests run at once for all accounts
+        :param max_per_account: How many requests run at once for one account
+        """
+        self.phone_numbers = list(dict.fromkeys(phone_numbers))
+        self.transport = transport if transport is not None else get_default_transport()
+        self.cache = cache if cache is not None else get_cache()
+        self.max_workers = max_workers
+        self.max_per_account = max_per_account
+        self.progress: dict[str, AccountProgress] = {}
+
+    @property
+    def failures(self) -> dict[str, Exception]:
+        """Errors of failed accounts by phone number."""
+        return {phone_number: progress.error for phone_number, progress in self.progress.items() if progress.failed}
+
+    def _cheque_service(self, phone_number: str) -> Cheque:
+        # OpenID configuration is kept in the shared cache, so it's fetched once for all accounts
+        return Cheque(User(phone_number, transport=self.transport, cache=self.cache), transport=self.transport)
+
+    def _warm_cache(self):
+        if isinstance(self.cache, TieredCache):
+            # One query loads tokens and cookies of all accounts into the memory tier
+            self.cache.get_many(
+                [f"{prefix}_{phone_number}" for phone_number in self.phone_numbers for prefix in ("token", "cookie")]
+            )
+
+    def _next_task(self, accounts: deque[_Account], records: bool) -> Optional[tuple[_Account, Callable, bool]]:
+        """
+        Pick a request of the next account in turn which has work and a free slot.
+
+        :return: (account, function which sends the request, whether it fetches cheques)
+            or None if all accounts wait for their requests
+        """
+        for _ in range(len(accounts)):
+            account = accounts[0]
+            accounts.rotate(-1)
+            if account.in_flight >= self.max_per_account:
+                continue
+            if account.pending:
+                cheque = account.pending.popleft()
+                return account, partial(self._fetch_detail, account.cheque, cheque, records), False
+            if not account.fetching_chunk and not account.chunks_done:
+                account.fetching_chunk = True
+                return account, partial(next, account.chunks, None), True
+        return None
+
+    @staticmethod
+    def _fetch_detail(cheque_service: Cheque, cheque: ChequeModel, records: bool) -> ChequeModel:
+        return cheque.set_detail(
+            cheque_service.get_detail(
+                cheque.cheque_id, cheque.created, cheque.filial_id, cheque.loyalty_fact_id, records=records
+            )
+        )
+
+    def _complete(
+        self, accounts: deque[_Account], account: _Account, future: Future, is_chunk: bool, with_details: bool
+    ) -> list[ChequeModel]:
+        """
+        Process the finished request of the account.
+
+        :return: Cheques which are ready to be returned
+        """
+        progress = account.progress
+        ready = []
+        if progress.done:
+            return ready  # The account has failed, results of its remaining requests are dropped
+        if future.exception() is not None:
+            progress.error = future.exception()
+            self.logger.warning("[cheques] Account %s failed: %s", progress.phone_number, progress.error)
+        elif is_chunk:
+            account.fetching_chunk = False
+            chunk = future.result()
+            if chunk is None:
+                account.chunks_done = True
+            else:
+                progress.cheques += len(chunk)
+                if with_details:
+                    account.pending.extend(chunk)
+                else:
+                    ready = chunk
+        else:
+            progress.details += 1
+            ready = [future.result()]
+
+        if progress.failed or (account.chunks_done and not account.pending and not account.in_flight):
+            progress.done = True
+            account.pending.clear()
+            accounts.remove(account)
+            self.logger.debug("[cheques] Account %s is done: %s", progress.phone_number, progress)
+        return ready
+
+    def cheques(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        with_details: bool = False,
+        page_size: int = 0,
+        records: bool = False,
+    ) -> Generator[tuple[str, ChequeModel], None, None]:
+        """
+        Fetch cheques of all accounts, see Cheque.all for the arguments.
+
+        Cheques are returned as soon as they are fetched, with details if `with_details` is set,
+        so cheques of different accounts are interleaved.
+
+        :return: (phone number, cheque)
+        """
+        self._warm_cache()
+        accounts: deque[_Account] = deque()
+        for phone_number in self.phone_numbers:
+            cheque_service = self._cheque_service(phone_number)
+            chunks = cheque_service.cheque_chunks(date_from, date_to, page_size=page_size)
+            accounts.append(_Account(cheque_service, chunks))
+        self.progress = {account.progress.phone_number: account.progress for account in accounts}
+
+        in_flight: dict[Future, tuple[_Account, bool]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pysilpo-pool") as executor:
+            while True:
+                while len(in_flight) < self.max_workers and (task := self._next_task(accounts, records)) is not None:
+                    account, fetch, is_chunk = task
+                    account.in_flight += 1
+                    in_flight[executor.submit(fetch)] = account, is_chunk
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    account, is_chunk = in_flight.pop(future)
+                    account.in_flight -= 1
+                    for cheque in self._complete(accounts, account, future, is_chunk, with_details):
+                        yield account.progress.phone_number, cheque
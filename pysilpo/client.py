@@ -1,11 +1,12 @@
 from typing import Literal, Optional
 
 from pysilpo.services.authorization import User
-from pysilpo.services.cheque import Cheque
-from pysilpo.services.product import Product
-from pysilpo.services.store import City, Store
-from pysilpo.utils.cache import SQLiteCache
+from pysilpo.services.cheque import AsyncCheque, Cheque
+from pysilpo.services.product import AsyncProduct, Product
+from pysilpo.services.store import AsyncCity, AsyncStore, City, Store
+from pysilpo.utils.cache import CacheBackend, get_cache
 from pysilpo.utils.exceptions import SilpoAuthorizationException
+from pysilpo.utils.transport import AsyncTransport, Transport, get_default_transport
 
 
 class Silpo:
@@ -17,12 +18,31 @@ class Silpo:
         self,
         phone_number: Optional[str] = None,
         otp_delivery_method: Literal["sms", "viber-sms"] = "sms",
+        transport: Optional[Transport] = None,
+        cache: Optional[CacheBackend] = None,
     ):
+        """
+        :param phone_number: User phone number in format +380XXYYYYYYY, required for cheques
+        :param otp_delivery_method: How to deliver OTP code
+        :param transport: HTTP transport shared by all services, e.g. Transport(pool_size=32, timeout=10)
+        :param cache: Cache backend of tokens and cookies, e.g. RedisCache(...), process-wide cache by default.
+            Responses aren't cached, pass Transport(cache=ResponseCache(cache=...)) to cache them.
+        """
+        self.cache = cache if cache is not None else get_cache()
+        self.transport = transport if transport is not None else get_default_transport()
+        self.product = Product.bind(self.transport)
+        self.store = Store.bind(self.transport)
+        self.city = City.bind(self.transport)
+
         self._user = None
         self._cheque = None
         if phone_number is not None:
-            self._user = User(phone_number=phone_number).request_otp(otp_delivery_method).login()
-            self._cheque = Cheque(self._user)
+            self._user = (
+                User(phone_number=phone_number, transport=self.transport, cache=self.cache)
+                .request_otp(otp_delivery_method)
+                .login()
+            )
+            self._cheque = Cheque(self._user, transport=self.transport)
 
     @property
     def cheque(self) -> Cheque:
@@ -32,6 +52,72 @@ class Silpo:
             )
         return self._cheque
 
-    @classmethod
-    def clear_cache(cls):
-        SQLiteCache().clear()
+    def clear_cache(self):
+        """
+        Clear the cache backend of the client, e.g. cached tokens and cookies.
+        """
+        self.cache.clear()
+
+
+class AsyncSilpo:
+    """
+    Asyncio version of Silpo. Every request goes through AsyncTransport, e.g.:
+
+        async with AsyncSilpo() as silpo:
+            async for product in silpo.product.search("молоко"):
+                print(product.title)
+
+    Authorization by phone number is interactive, so it is done synchronously in the constructor.
+    """
+
+    product = AsyncProduct
+    store = AsyncStore
+    city = AsyncCity
+
+    def __init__(
+        self,
+        phone_number: Optional[str] = None,
+        otp_delivery_method: Literal["sms", "viber-sms"] = "sms",
+        transport: Optional[AsyncTransport] = None,
+        cache: Optional[CacheBackend] = None,
+    ):
+        """
+        :param phone_number: User phone number in format +380XXYYYYYYY, required for cheques
+        :param otp_delivery_method: How to deliver OTP code
+        :param transport: Async HTTP transport shared by all services
+        :param cache: Cache backend of tokens and cookies, e.g. RedisCache(...), process-wide cache by default
+        """
+        self.cache = cache if cache is not None else get_cache()
+        self.transport = transport if transport is not None else AsyncTransport()
+        self.product = AsyncProduct.bind(self.transport)
+        self.store = AsyncStore.bind(self.transport)
+        self.city = AsyncCity.bind(self.transport)
+
+        self._user = None
+        self._cheque = None
+        if phone_number is not None:
+            self._user = User(phone_number=phone_number, cache=self.cache).request_otp(otp_delivery_method).login()
+            self._cheque = AsyncCheque(self._user, transport=self.transport)
+
+    @property
+    def cheque(self) -> AsyncCheque:
+        if self._cheque is None:
+            raise SilpoAuthorizationException(
+                "User is not authorized. Please provide phone number e.g. AsyncSilpo(phone_number='+380123456789')"
+            )
+        return self._cheque
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self) -> "AsyncSilpo":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def clear_cache(self):
+        """
+        Clear the cache backend of the client, e.g. cached tokens and cookies.
+        """
+        self.cache.clear()
@@ -4,8 +4,9 @@ import random
 import re
 import secrets
 import sys
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
 if sys.version_info >= (3, 11):
     from datetime import UTC
@@ -14,20 +15,20 @@ else:
 
     UTC = timezone.utc
 
-from functools import cached_property
 from typing import Literal, Optional
 from urllib.parse import parse_qs, urljoin, urlparse
 
 import requests
 from pydantic import BaseModel, model_validator
 
-from pysilpo.utils.cache import SQLiteCache
+from pysilpo.utils.cache import CacheBackend, CacheLock, TieredCache, get_cache
 from pysilpo.utils.exceptions import (
     NoOpenIDAuthCodeException,
     SilpoAuthorizationException,
     SilpoException,
     SilpoOTPInvalidException,
 )
+from pysilpo.utils.transport import Transport, get_default_transport
 from pysilpo.utils.utils import get_jwt_expires_in, get_logger
 
 
@@ -48,11 +49,19 @@ class Token(BaseModel):
 class User:
     """
     All public methods should return self to allow chaining.
+
+    The token is refreshed single-flight: one thread refreshes it while others wait, and processes sharing
+    the cache take a lock in it, so only one of them sends OpenID requests and the rest reuse the new token.
+    The token is also refreshed in background `refresh_margin` seconds before it expires, so requests
+    don't wait for the refresh at all. A failed background refresh is retried with exponential backoff.
     """
 
     logger = get_logger("pysilpo.authorization.User")
     _base_auth_domain = "https://auth.silpo.ua"
     _openid_configuration = urljoin(_base_auth_domain, "/.well-known/openid-configuration")
+    _OPENID_CONFIGURATION_KEY = "openid_configuration"
+    # Only one thread of the process fetches the discovery document, the others take it from the cache
+    _openid_configuration_lock = threading.Lock()
     _phone_number_pattern = r"^\+380\d{9}$"
 
     def __init__(
@@ -63,34 +72,126 @@ class User:
         "core--core--media-service:media--upload payments--payments--wallet-service:cards--read-my "
         "core--core--media-service:media--upload",
         openid_redirect_uri: Optional[str] = "https://id.silpo.ua/signin-oidc",
+        transport: Optional[Transport] = None,
+        cache: Optional[CacheBackend] = None,
+        refresh_margin: int = 60,
+        refresh_lock_ttl: int = 30,
+        refresh_retry_delay: float = 5,
+        openid_configuration: Optional[dict] = None,
+        openid_configuration_ttl: int = 24 * 60 * 60,
     ):
+        """
+        :param refresh_margin: Refresh the token in background that many seconds before it expires, 0 disables it
+        :param refresh_lock_ttl: How many seconds other processes wait for the one which refreshes the token
+        :param refresh_retry_delay: How many seconds to wait before the background refresh is retried after a failure,
+            the delay doubles with every failure up to `refresh_margin`
+        :param openid_configuration: Already fetched OpenID discovery document, it's taken from the cache by default
+        :param openid_configuration_ttl: How many seconds the discovery document is kept in the cache,
+            it's shared by all users and processes with the same cache
+        """
         if not re.match(self._phone_number_pattern, phone_number):
             raise SilpoException("Invalid phone number, must be in format +380XXYYYYYYY")
         self.phone_number = phone_number
-        self.session = requests.Session()
+        self.transport = transport if transport is not None else get_default_transport()
+        # Own session keeps user cookies separate, while connection pools are shared through the transport
+        self.session = self.transport.new_session()
         self.client_id = openid_client_id
         self.scope = openid_scope
         self.redirect_uri = openid_redirect_uri
         self.code_verifier = secrets.token_urlsafe(64)
+        # Process-wide cache by default, token lookups on every request are served from memory
+        self.cache = cache if cache is not None else get_cache()
+        self.refresh_margin = refresh_margin
+        self.refresh_lock_ttl = refresh_lock_ttl
+        self.refresh_retry_delay = refresh_retry_delay
+        self._refresh_lock = threading.Lock()
+        self._refresh_failures = 0
+        # time.monotonic() before which the background refresh isn't retried
+        self._refresh_retry_at = 0.0
+        self.openid_configuration_ttl = openid_configuration_ttl
+        self._prefetched_openid_configuration = openid_configuration
 
         self.token: Optional[Token] = self.cached_token
 
-    @cached_property
-    def openid_configuration(self) -> dict:
-        resp = self.session.get(self._openid_configuration)
+    @classmethod
+    def fetch_openid_configuration(cls, transport: Optional[Transport] = None) -> dict:
+        """Fetch OpenID discovery document, it's the same for all users."""
+        resp = (transport if transport is not None else get_default_transport()).get(cls._openid_configuration)
         resp.raise_for_status()
         return resp.json()
 
+    @property
+    def openid_configuration(self) -> dict:
+        """OpenID discovery document, it's fetched once per `openid_configuration_ttl` for all users."""
+        if self._prefetched_openid_configuration is not None:
+            return self._prefetched_openid_configuration
+        configuration = self.cache.get(self._OPENID_CONFIGURATION_KEY)
+        if configuration is None:
+            with self._openid_configuration_lock:
+                configuration = self.cache.get(self._OPENID_CONFIGURATION_KEY)
+                if configuration is None:
+                    configuration = self._store_openid_configuration()
+        return configuration
+
+    def _store_openid_configuration(self) -> dict:
+        configuration = self.fetch_openid_configuration(self.transport)
+        self.logger.debug("[openid_configuration] Fetched OpenID configuration")
+        self.cache.set(
+            self._OPENID_CONFIGURATION_KEY, configuration, expires_in=round(time.time()) + self.openid_configuration_ttl
+        )
+        return configuration
+
+    def _revalidate_openid_configuration(self, endpoint: str, failed_url: str) -> Optional[str]:
+        """
+        Fetch the discovery document again after a request to one of its endpoints has failed.
+
+        :param endpoint: Name of the endpoint in the document, e.g. "token_endpoint"
+        :param failed_url: URL which has failed
+        :return: New URL of the endpoint or None if it hasn't changed
+        """
+        with self._openid_configuration_lock:
+            configuration = self._store_openid_configuration()
+        if self._prefetched_openid_configuration is not None:
+            self._prefetched_openid_configuration = configuration
+        url = configuration.get(endpoint)
+        if url is None or url == failed_url:
+            return None
+        self.logger.warning("[_revalidate_openid_configuration] %s has moved from %s to %s", endpoint, failed_url, url)
+        return url
+
+    def _openid_request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """
+        Send a request to an endpoint of the discovery document.
+        When the endpoint fails, the document is revalidated, and the request is sent again if the endpoint has moved.
+
+        :param endpoint: Name of the endpoint in the document, e.g. "authorization_endpoint"
+        :param kwargs: Other arguments of Transport.request(...)
+        """
+        url = self.openid_configuration[endpoint]
+        try:
+            resp = self.transport.request(method, url, session=self.session, **kwargs)
+        except requests.ConnectionError:
+            new_url = self._revalidate_openid_configuration(endpoint, url)
+            if new_url is None:
+                raise
+        else:
+            if resp.status_code not in (404, 410) and resp.status_code < 500:
+                return resp
+            new_url = self._revalidate_openid_configuration(endpoint, url)
+            if new_url is None:
+                return resp
+        return self.transport.request(method, new_url, session=self.session, **kwargs)
+
     @property
     def cached_token(self) -> Optional[Token]:
-        return SQLiteCache().get(f"token_{self.phone_number}")
+        return self.cache.get(f"token_{self.phone_number}")
 
     def request_otp(self, delivery_method: Literal["sms", "viber-sms"] = "sms", force: bool = False) -> "User":
         if self.token and not force:
             self.logger.debug("[request_otp] Already logged in with token scope. Skipping OTP request")
             return self
 
-        auth_cookies = SQLiteCache().get(f"cookie_{self.phone_number}")
+        auth_cookies = self.cache.get(f"cookie_{self.phone_number}")
         if auth_cookies and not force:
             self.logger.debug("[request_otp] Have cookies for authorization. Skipping OTP request")
             return self
@@ -103,7 +204,7 @@ class User:
             "phoneChannelType": 0,
         }
         self.logger.debug("[_request_otp] Requesting OTP with %s to %s", json, full_url)
-        resp = self.session.post(full_url, json=json)
+        resp = self.transport.post(full_url, json=json, session=self.session)
         json_data = resp.json()
         self.logger.debug("[_request_otp] Received response: %s", json_data)
         if not resp.ok:
@@ -135,12 +236,12 @@ class User:
             "phoneChannelType": 0,
         }
         self.logger.debug("[_verify_otp] Verifying OTP with %s to %s", json, full_url)
-        resp = self.session.post(full_url, json=json)
+        resp = self.transport.post(full_url, json=json, session=self.session)
         json_data = resp.json()
         self.logger.debug("[_verify_otp] Received response: %s. With cookies: %s", json_data, resp.cookies)
         if not resp.ok or json_data["error"]:
             raise SilpoOTPInvalidException("Error while verifying OTP: %s", json_data)
-        SQLiteCache().set(f"cookie_{self.phone_number}", dict(resp.cookies))
+        self.cache.set(f"cookie_{self.phone_number}", dict(resp.cookies))
         return self
 
     @staticmethod
@@ -160,7 +261,6 @@ class User:
         This code will be used to get access token.
         :return: OpenID authorization code
         """
-        full_url = self.openid_configuration["authorization_endpoint"]
         code_challenge = (
             base64.urlsafe_b64encode(hashlib.sha256(self.code_verifier.encode()).digest()).rstrip(b"=").decode("ascii")
         )
@@ -174,8 +274,8 @@ class User:
             "code_challenge_method": "S256",
             "response_mode": "query",
         }
-        self.logger.debug("[_openid_authorize] Authorizing with %s to %s", params, full_url)
-        resp = self.session.get(full_url, params=params, cookies=auth_cookies)
+        self.logger.debug("[_openid_authorize] Authorizing with %s", params)
+        resp = self._openid_request("GET", "authorization_endpoint", params=params, cookies=auth_cookies)
         resp.raise_for_status()
         self.logger.debug(
             "[_openid_authorize] Received location: %s. With headers: %s and cookies: %s",
@@ -194,7 +294,6 @@ class User:
         return auth_code
 
     def _get_token(self, auth_code: str) -> Token:
-        full_url = self.openid_configuration["token_endpoint"]
         form_data = {
             "client_id": self.client_id,
             "code": auth_code,
@@ -202,47 +301,116 @@ class User:
             "code_verifier": self.code_verifier,
             "grant_type": "authorization_code",
         }
-        self.logger.debug("[_get_access_token] Getting access token with %s to %s", form_data, full_url)
-        resp = self.session.post(full_url, data=form_data)
+        self.logger.debug("[_get_access_token] Getting access token with %s", form_data)
+        resp = self._openid_request("POST", "token_endpoint", data=form_data)
         json_data = resp.json()
         self.logger.debug("[_get_access_token] Received response: %s", json_data)
         if not resp.ok:
             raise SilpoAuthorizationException(f"Error while getting access token: {json_data}")
         return Token(**json_data)
 
-    def is_expired(self) -> bool:
-        if self.cached_token is None:
+    def is_expired(self, margin: int = 0) -> bool:
+        """
+        :param margin: Consider the token expired that many seconds earlier
+        """
+        if self.token is None or self.cached_token is None:
             return True
-        return self.token.expires_in < datetime.now(tz=UTC)
+        return self.token.expires_in - timedelta(seconds=margin) < datetime.now(tz=UTC)
 
     def _refresh_token(self) -> None:
-        auth_cookies = SQLiteCache().get(f"cookie_{self.phone_number}")
+        auth_cookies = self.cache.get(f"cookie_{self.phone_number}")
         if not auth_cookies:
             raise SilpoAuthorizationException(
                 "No cookies found for token refresh."
                 "Please login first using User(phone_number=...).request_otp().login() method."
             )
         code = self._openid_authorize(auth_cookies)
-        self.token = self._get_token(code)
+        self.set_token(self._get_token(code))
         self.logger.debug(
             "[refresh_token] Token refreshed with scope: %s | %s UTC", self.token.scope, self.token.expires_in
         )
 
+    def _adopt_cached_token(self) -> bool:
+        """
+        Take the token from the cache if it's newer than the own one, e.g. another process has refreshed it.
+
+        The in-memory copy of TieredCache may be stale, so the token is read from its persistent cache.
+        """
+        key = f"token_{self.phone_number}"
+        token = self.cache.get(key, bypass_memory=True) if isinstance(self.cache, TieredCache) else self.cache.get(key)
+        if token is None or (self.token is not None and token.expires_in <= self.token.expires_in):
+            return False
+        self.token = token
+        return True
+
+    def _refresh_token_locked(self, margin: int) -> None:
+        """
+        Refresh the token unless another process has done it already, the caller holds `_refresh_lock`.
+
+        :param margin: Refresh the token if it expires in that many seconds
+        """
+        self._adopt_cached_token()
+        if not self.is_expired(margin):
+            return
+        lock = CacheLock(self.cache, f"token_refresh_{self.phone_number}", ttl=self.refresh_lock_ttl)
+        while not lock.acquire():
+            # Another process is refreshing the token, the lock expires if that process dies
+            time.sleep(0.1)
+            if self._adopt_cached_token() and not self.is_expired(margin):
+                self.logger.debug("[_refresh_token_locked] Token was refreshed by another process")
+                return
+        try:
+            self._adopt_cached_token()
+            if self.is_expired(margin):
+                self._refresh_token()
+        finally:
+            lock.release()
+
+    def _refresh_token_once(self) -> None:
+        """Refresh the expired token, threads which come while it's refreshed wait and reuse the new token."""
+        with self._refresh_lock:
+            self._refresh_token_locked(margin=0)
+
+    def _refresh_in_background(self) -> None:
+        """
+        Refresh the token which expires soon in a background thread, unless it's already being refreshed
+        or the last attempt has failed recently.
+        """
+        if time.monotonic() < self._refresh_retry_at or not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                self._refresh_token_locked(margin=self.refresh_margin)
+                self._refresh_failures = 0
+            except Exception as e:
+                delay = min(self.refresh_retry_delay * 2**self._refresh_failures, self.refresh_margin)
+                self._refresh_failures += 1
+                self._refresh_retry_at = time.monotonic() + delay
+                self.logger.warning("[_refresh_in_background] Failed to refresh token, retry in %ss: %s", delay, e)
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=refresh, name="pysilpo-token-refresh", daemon=True).start()
+
     @property
     def access_token(self) -> str:
-        if self.token is None:
+        if self.token is None and not self.cache.get(f"cookie_{self.phone_number}"):
             raise SilpoAuthorizationException(
                 "Access token is not set. "
                 "Please login first using User(phone_number=...).request_otp().login() method."
             )
+        # Without a token, e.g. it has expired and dropped from the cache, a new one is got with the cached cookies
         if self.is_expired():
-            self._refresh_token()
+            self._refresh_token_once()
+        elif self.refresh_margin and self.is_expired(self.refresh_margin):
+            self._refresh_in_background()
         return self.token.access_token
 
     def set_token(self, token: Token) -> "User":
         self.token = token
         self.logger.debug("[set_token] Set token scope: %s | %s UTC", self.token.scope, self.token.expires_in)
-        SQLiteCache().set(f"token_{self.phone_number}", token, expires_in=token.expires_in)
+        self.cache.set(f"token_{self.phone_number}", token, expires_in=token.expires_in)
         return self
 
     def login(self, otp_code: Optional[str] = None, force: bool = False, retry_no: int = 0) -> "User":
@@ -252,7 +420,7 @@ class User:
             )
             return self
 
-        auth_cookies = SQLiteCache().get(f"cookie_{self.phone_number}")
+        auth_cookies = self.cache.get(f"cookie_{self.phone_number}")
         if not auth_cookies and not force:
             if otp_code is None:
                 otp_code = self._enter_cli_otp()
@@ -266,9 +434,11 @@ class User:
                     "Failed to get OpenID authorization code after 3 retries. Please try again later."
                 ) from e
             self.logger.warning("[login] %s. Trying to request OTP and login again", e)
-            SQLiteCache().clear()
+            # The cache may be shared with other accounts, so only this account is logged out
+            self.cache.remove(f"token_{self.phone_number}")
+            self.cache.remove(f"cookie_{self.phone_number}")
             return self.login(otp_code=otp_code, force=True, retry_no=retry_no + 1)
         self.token = self._get_token(auth_code)
         self.logger.debug("[login] Logged in with token scope: %s | %s UTC", self.token.scope, self.token.expires_in)
-        SQLiteCache().set(f"token_{self.phone_number}", self.token, expires_in=self.token.expires_in)
+        self.cache.set(f"token_{self.phone_number}", self.token, expires_in=self.token.expires_in)
         return self
@@ -0,0 +1,37 @@
+from typing import Optional
+
+from pysilpo.utils.transport import AsyncTransport, Transport, get_default_async_transport, get_default_transport
+
+
+class BaseService:
+    """
+    Base class for services with classmethod API (Product, Store, City).
+    """
+
+    _transport: Optional[Transport] = None
+
+    @classmethod
+    def get_transport(cls) -> Transport:
+        return cls._transport if cls._transport is not None else get_default_transport()
+
+    @classmethod
+    def bind(cls, transport: Transport) -> type:
+        """
+        Return a subclass of the service that sends all requests through the given transport.
+
+        :param transport: Transport to use
+        :return: Bound service class
+        """
+        return type(cls.__name__, (cls,), {"_transport": transport, "__module__": cls.__module__})
+
+
+class AsyncBaseService(BaseService):
+    """
+    Base class for asyncio services, they are bound to AsyncTransport instead of Transport.
+    """
+
+    _transport: Optional[AsyncTransport] = None
+
+    @classmethod
+    def get_transport(cls) -> AsyncTransport:
+        return cls._transport if cls._transport is not None else get_default_async_transport()
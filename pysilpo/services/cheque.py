@@ -1,15 +1,20 @@
-from collections.abc import Generator
+import asyncio
+from collections.abc import AsyncIterator, Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import cached_property
 from typing import Optional
 from urllib.parse import urljoin
 
-import requests
 from pydantic import BaseModel, Field, PrivateAttr
 
 from pysilpo.services.authorization import User
+from pysilpo.utils.cheque_store import SQLiteChequeStore
 from pysilpo.utils.enums import PayTypeEnum
 from pysilpo.utils.exceptions import SilpoException
+from pysilpo.utils.models import DEFAULT_PARSER, record
+from pysilpo.utils.rate_limit import RateLimiter
+from pysilpo.utils.transport import AsyncTransport, Transport, get_default_async_transport
 from pysilpo.utils.utils import get_logger, subtract_months
 
 
@@ -94,6 +99,17 @@ class ChequeModel(BaseModel):
     business_card_id: int = Field(..., alias="businessCardId")
     external_operation_id: str = Field(..., alias="externalOperationId")
 
+    def set_detail(self, detail: ChequeDetailModel) -> "ChequeModel":
+        """
+        Attach already fetched detail, so accessing `detail` doesn't send a request.
+        """
+        self.__dict__["detail"] = detail
+        return self
+
+    @property
+    def has_detail(self) -> bool:
+        return "detail" in self.__dict__
+
     @cached_property
     def detail(self) -> ChequeDetailModel:
         if self._cheque_service is None:
@@ -112,24 +128,167 @@ class Cheque:
     _ALL_CHEQUES_URL = urljoin(_DOMAIN, "/api/v1/profile/my/cheque/cheque-headers")
     _CHEQUE_DETAIL_URL = urljoin(_DOMAIN, "/api/v1/profile/my/cheque/cheque-info")
 
-    def __init__(self, user: User):
+    def __init__(self, user: User, transport: Optional[Transport] = None):
         self.user = user
+        self.transport = transport if transport is not None else user.transport
 
-    def get_detail(self, cheque_id: int, created: datetime, fill_id: int, loyalty_fact_id: int) -> ChequeDetailModel:
-        payload = {
+    def _authorization_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.user.access_token}"}
+
+    @staticmethod
+    def _detail_payload(cheque_id: int, created: datetime, fill_id: int, loyalty_fact_id: int) -> dict:
+        return {
             "filId": fill_id,
             "chequeId": cheque_id,
             "created": created.isoformat(),
             "loyaltyFactId": loyalty_fact_id,
         }
+
+    @staticmethod
+    def _detail_model(data: dict, records: bool) -> ChequeDetailModel:
+        if not records:
+            return ChequeDetailModel(**data)
+        positions = data.get("chequeLines")
+        detail = ChequeDetailModel(**{**data, "chequeLines": None})
+        if positions is not None:
+            detail.positions = [record(ChequePositionModel, position) for position in positions]
+        return detail
+
+    @staticmethod
+    def _first_window(date_from: Optional[datetime], date_to: datetime) -> tuple[datetime, datetime]:
+        # Start with the latest 3-month chunk and work backwards
+        return max(
+            subtract_months(date_to, 3),
+            date_from if date_from is not None else datetime.min,
+        ), date_to
+
+    @staticmethod
+    def _next_window(
+        current_date_from: datetime, data: list[dict], date_from: Optional[datetime]
+    ) -> tuple[datetime, datetime]:
+        # Previous 3-month chunk
+        current_date_to = subtract_months(current_date_from, 3)
+        return max(
+            subtract_months(current_date_to, 3),
+            subtract_months(datetime.fromisoformat(data[-1]["created"]), 3) if date_from is None else date_from,
+        ), current_date_to
+
+    def get_detail(
+        self, cheque_id: int, created: datetime, fill_id: int, loyalty_fact_id: int, records: bool = False
+    ) -> ChequeDetailModel:
+        """
+        :param records: Keep positions as compact ChequePositionRecord namedtuples, see pysilpo.utils.models.Record
+        """
+        payload = self._detail_payload(cheque_id, created, fill_id, loyalty_fact_id)
         self.logger.debug("Fetching cheque detail for %s", payload)
-        resp = requests.post(
+        resp = self.transport.post(
             self._CHEQUE_DETAIL_URL,
             json=payload,
-            headers={"Authorization": f"Bearer {self.user.access_token}"},
+            headers=self._authorization_headers(),
+            idempotent=True,
         )
         resp.raise_for_status()
-        return ChequeDetailModel(**resp.json())
+        return self._detail_model(resp.json(), records)
+
+    def get_details(
+        self,
+        cheques: Iterable[ChequeModel],
+        max_workers: int = 8,
+        rate_limit: Optional[float] = None,
+        records: bool = False,
+    ) -> list[ChequeModel]:
+        """
+        Fetch details of many cheques concurrently and attach them to the models,
+        so accessing `ChequeModel.detail` doesn't send a request anymore.
+
+        :param cheques: Cheques to fetch details for, cheques which already have details are skipped
+        :param max_workers: How many details to fetch concurrently
+        :param rate_limit: Maximum number of detail requests per second, unlimited by default
+        :param records: Keep positions as compact records, see get_detail
+        :return: The same cheques with attached details
+        """
+        cheques = list(cheques)
+        pending = [cheque for cheque in cheques if not cheque.has_detail]
+        if not pending:
+            return cheques
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        def fetch(cheque: ChequeModel) -> ChequeDetailModel:
+            if limiter is not None:
+                limiter.acquire()
+            return self.get_detail(
+                cheque.cheque_id, cheque.created, cheque.filial_id, cheque.loyalty_fact_id, records=records
+            )
+
+        # Refresh the token once here, not in every worker thread
+        self._authorization_headers()
+        self.logger.debug("Fetching %s cheque details with %s workers", len(pending), max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pysilpo-cheque") as executor:
+            for cheque, detail in zip(pending, executor.map(fetch, pending)):
+                cheque.set_detail(detail)
+        return cheques
+
+    @classmethod
+    def _windows(cls, date_from: datetime, date_to: datetime) -> list[tuple[datetime, datetime]]:
+        """
+        All 3-month windows between the dates, in the same order as `all` walks them without fan-out.
+        """
+        windows = []
+        current_date_from, current_date_to = cls._first_window(date_from, date_to)
+        while current_date_to > date_from:
+            windows.append((current_date_from, current_date_to))
+            current_date_from, current_date_to = cls._next_window(current_date_from, [], date_from)
+        return windows
+
+    @staticmethod
+    def _headers_payload(date_start: datetime, date_end: datetime, page_size: int, row_number: int) -> dict:
+        return {
+            "rowNumber": row_number,
+            "pageSize": page_size,
+            "dateStart": date_start.isoformat(),
+            "dateEnd": date_end.isoformat(),
+        }
+
+    def _fetch_headers(self, date_start: datetime, date_end: datetime, page_size: int, row_number: int) -> list[dict]:
+        self.logger.debug("Fetching cheques from %s to %s", date_start, date_end)
+        resp = self.transport.post(
+            self._ALL_CHEQUES_URL,
+            json=self._headers_payload(date_start, date_end, page_size, row_number),
+            headers=self._authorization_headers(),
+            idempotent=True,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    def _chunks(
+        self,
+        date_from: Optional[datetime],
+        date_to: datetime,
+        page_size: int,
+        row_number: int,
+        window_workers: int,
+    ) -> Generator[list[dict], None, None]:
+        """
+        Raw cheque headers of every 3-month window, from the latest window to the oldest one.
+        """
+        if window_workers > 1 and date_from is not None:
+            # Both dates are known, so are all windows, fetch them concurrently and keep their order
+            windows = self._windows(date_from, date_to)
+            self._authorization_headers()
+            with ThreadPoolExecutor(max_workers=window_workers, thread_name_prefix="pysilpo-cheque") as executor:
+                yield from executor.map(
+                    lambda window: self._fetch_headers(*window, page_size, row_number),
+                    windows,
+                )
+            return
+
+        current_date_from, current_date_to = self._first_window(date_from, date_to)
+        while date_from is None or current_date_to > date_from:
+            data = self._fetch_headers(current_date_from, current_date_to, page_size, row_number)
+            yield data
+            if not data:
+                return
+            current_date_from, current_date_to = self._next_window(current_date_from, data, date_from)
 
     def all(
         self,
@@ -137,35 +296,51 @@ class Cheque:
         date_to: Optional[datetime] = None,
         page_size: int = 0,
         row_number: int = 0,
+        with_details: bool = False,
+        max_workers: int = 8,
+        rate_limit: Optional[float] = None,
+        window_workers: int = 1,
+        records: bool = False,
     ) -> Generator[ChequeModel, None, None]:
+        """
+        Get all cheques of the user, from the latest to the oldest one.
+
+        :param date_from: Oldest date to get cheques from, all history by default
+        :param date_to: Latest date to get cheques to, now by default
+        :param page_size: Page size of Silpo API
+        :param row_number: Row number of Silpo API
+        :param with_details: Fetch details of every 3-month chunk concurrently before yielding it, see get_details
+        :param max_workers: How many details to fetch concurrently
+        :param rate_limit: Maximum number of detail requests per second
+        :param window_workers: How many 3-month windows to fetch concurrently, works only when date_from is set
+        :param records: Keep positions of the details as compact records, see get_detail
+        :return:
+        """
+        for cheques in self.cheque_chunks(date_from, date_to, page_size, row_number, window_workers):
+            if with_details:
+                self.get_details(cheques, max_workers=max_workers, rate_limit=rate_limit, records=records)
+
+            # Yield each item in a flat structure
+            yield from cheques
+
+    def cheque_chunks(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        page_size: int = 0,
+        row_number: int = 0,
+        window_workers: int = 1,
+    ) -> Generator[list[ChequeModel], None, None]:
+        """
+        Cheques of every 3-month window without details, from the latest window to the oldest one.
+        Every chunk is one request, see `all` for the arguments.
+        """
         if date_to is None:
             date_to = datetime.now()
 
-        # Start with the latest 3-month chunk and work backwards
-        current_date_to = date_to
-        current_date_from = max(
-            subtract_months(current_date_to, 3),
-            date_from if date_from is not None else datetime.min,
-        )
-
         first_cheque_id_in_chunk: Optional[int] = None
 
-        while date_from is None or current_date_to > date_from:
-            payload = {
-                "rowNumber": row_number,
-                "pageSize": page_size,
-                "dateStart": current_date_from.isoformat(),
-                "dateEnd": current_date_to.isoformat(),
-            }
-            self.logger.debug("Fetching cheques from %s to %s", current_date_from, current_date_to)
-            resp = requests.post(
-                self._ALL_CHEQUES_URL,
-                json=payload,
-                headers={"Authorization": f"Bearer {self.user.access_token}"},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-
+        for data in self._chunks(date_from, date_to, page_size, row_number, window_workers):
             # If no more data, exit the loop, but it's unlikely to happen, see the next check
             if not data:
                 break
@@ -178,13 +353,257 @@ class Cheque:
                 break  # No more data
             first_cheque_id_in_chunk = data[0]["chequeId"]
 
-            # Yield each item in a flat structure
-            for item in data:
-                yield ChequeModel(**item, cheque_service=self)
-
-            # Update dates for the next iteration (previous 3-month chunk)
-            current_date_to = subtract_months(current_date_from, 3)
-            current_date_from = max(
-                subtract_months(current_date_to, 3),
-                subtract_months(datetime.fromisoformat(data[-1]["created"]), 3) if date_from is None else date_from,
-            )
+            yield DEFAULT_PARSER.parse_many(ChequeModel, data, cheque_service=self)
+
+    def _save_new_cheques(self, store: SQLiteChequeStore, cheques: list[ChequeModel]) -> list[ChequeModel]:
+        """
+        Store headers of cheques which are not stored yet and move the high-water mark.
+
+        :return: Cheques which were not stored before
+        """
+        phone_number = self.user.phone_number
+        existing_ids = store.existing_ids(phone_number, [cheque.cheque_id for cheque in cheques])
+        new_cheques = list(
+            {cheque.cheque_id: cheque for cheque in cheques if cheque.cheque_id not in existing_ids}.values()
+        )
+        store.save_headers(phone_number, [cheque.model_dump(by_alias=True, mode="json") for cheque in new_cheques])
+        if new_cheques:
+            latest = max(new_cheques, key=lambda cheque: (cheque.created, cheque.cheque_id))
+            store.set_high_water_mark(phone_number, latest.created, latest.cheque_id)
+        self.logger.debug("Stored %s new cheques of %s", len(new_cheques), phone_number)
+        return new_cheques
+
+    def _cheques_without_details(self, store: SQLiteChequeStore, new_cheques: list[ChequeModel]) -> list[ChequeModel]:
+        """
+        Stored cheques without details, including the ones left from previous interrupted syncs.
+        """
+        new_cheques_by_id = {cheque.cheque_id: cheque for cheque in new_cheques}
+        return [
+            new_cheques_by_id.get(header["chequeId"]) or ChequeModel(**header, cheque_service=self)
+            for header in store.missing_details(self.user.phone_number)
+        ]
+
+    def _save_details(self, store: SQLiteChequeStore, cheques: list[ChequeModel]):
+        store.save_details(
+            self.user.phone_number,
+            {cheque.cheque_id: cheque.detail.model_dump(by_alias=True, mode="json") for cheque in cheques},
+        )
+
+    def sync(
+        self,
+        store: SQLiteChequeStore,
+        date_from: Optional[datetime] = None,
+        with_details: bool = True,
+        max_workers: int = 8,
+        rate_limit: Optional[float] = None,
+        window_workers: int = 1,
+        chunk_size: int = 100,
+    ) -> list[ChequeModel]:
+        """
+        Fetch cheques newer than the already stored ones and persist them with their details.
+
+        The first sync fetches the whole history (or since date_from). Next ones start from the high-water mark,
+        i.e. the latest stored cheque, so usually it's a single request. Details are fetched only for stored
+        cheques without them, and saved every `chunk_size` cheques, so an interrupted sync continues where it stopped.
+
+        :param store: Where to keep cheques, e.g. SQLiteChequeStore()
+        :param date_from: Oldest date to get cheques from on the first sync, all history by default
+        :param with_details: Fetch and store details, see get_details
+        :param max_workers: How many details to fetch concurrently
+        :param rate_limit: Maximum number of detail requests per second
+        :param window_workers: How many 3-month windows to fetch concurrently, see all
+        :param chunk_size: How many details to fetch before saving them
+        :return: New cheques, with attached details when with_details is True
+        """
+        mark = store.get_high_water_mark(self.user.phone_number)
+        if mark is not None:
+            date_from = mark[0] if date_from is None else max(date_from, mark[0])
+
+        new_cheques = self._save_new_cheques(store, list(self.all(date_from=date_from, window_workers=window_workers)))
+
+        if with_details:
+            cheques = self._cheques_without_details(store, new_cheques)
+            for i in range(0, len(cheques), chunk_size):
+                chunk = cheques[i : i + chunk_size]
+                self.get_details(chunk, max_workers=max_workers, rate_limit=rate_limit)
+                self._save_details(store, chunk)
+        return new_cheques
+
+    def from_store(self, store: SQLiteChequeStore) -> list[ChequeModel]:
+        """
+        Load all stored cheques of the user, from the latest to the oldest one. Stored details are attached.
+        """
+        cheques = []
+        for header, detail in store.get_cheques(self.user.phone_number):
+            cheque = ChequeModel(**header, cheque_service=self)
+            if detail is not None:
+                cheque.set_detail(ChequeDetailModel(**detail))
+            cheques.append(cheque)
+        return cheques
+
+
+class AsyncCheque(Cheque):
+    """
+    Asyncio version of Cheque. User authorization is still synchronous, only token refresh is moved to a thread.
+
+    Cheques yielded by `all` are not bound to the service, use `await AsyncCheque.get_detail(...)` to get details.
+    """
+
+    logger = get_logger("pysilpo.cheque.AsyncCheque")
+
+    def __init__(self, user: User, transport: Optional[AsyncTransport] = None):
+        self.user = user
+        self._transport = transport
+
+    @property
+    def transport(self) -> AsyncTransport:
+        return self._transport if self._transport is not None else get_default_async_transport()
+
+    async def _async_authorization_headers(self) -> dict:
+        if self.user.is_expired():
+            # Token refresh does blocking OpenID requests, so keep it out of the event loop
+            return await asyncio.to_thread(self._authorization_headers)
+        return self._authorization_headers()
+
+    async def get_detail(
+        self, cheque_id: int, created: datetime, fill_id: int, loyalty_fact_id: int, records: bool = False
+    ) -> ChequeDetailModel:
+        payload = self._detail_payload(cheque_id, created, fill_id, loyalty_fact_id)
+        self.logger.debug("Fetching cheque detail for %s", payload)
+        resp = await self.transport.post(
+            self._CHEQUE_DETAIL_URL,
+            json=payload,
+            headers=await self._async_authorization_headers(),
+            idempotent=True,
+        )
+        resp.raise_for_status()
+        return self._detail_model(resp.json(), records)
+
+    async def get_details(
+        self,
+        cheques: Iterable[ChequeModel],
+        max_workers: int = 8,
+        rate_limit: Optional[float] = None,
+        records: bool = False,
+    ) -> list[ChequeModel]:
+        """
+        Asyncio version of Cheque.get_details, `max_workers` limits how many requests are in flight.
+        """
+        cheques = list(cheques)
+        pending = [cheque for cheque in cheques if not cheque.has_detail]
+        if not pending:
+            return cheques
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(cheque: ChequeModel) -> ChequeDetailModel:
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.async_acquire()
+                return await self.get_detail(
+                    cheque.cheque_id, cheque.created, cheque.filial_id, cheque.loyalty_fact_id, records=records
+                )
+
+        await self._async_authorization_headers()
+        details = await asyncio.gather(*(fetch(cheque) for cheque in pending))
+        for cheque, detail in zip(pending, details):
+            cheque.set_detail(detail)
+        return cheques
+
+    async def _fetch_headers(
+        self, date_start: datetime, date_end: datetime, page_size: int, row_number: int
+    ) -> list[dict]:
+        self.logger.debug("Fetching cheques from %s to %s", date_start, date_end)
+        resp = await self.transport.post(
+            self._ALL_CHEQUES_URL,
+            json=self._headers_payload(date_start, date_end, page_size, row_number),
+            headers=await self._async_authorization_headers(),
+            idempotent=True,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _chunks(
+        self,
+        date_from: Optional[datetime],
+        date_to: datetime,
+        page_size: int,
+        row_number: int,
+        window_workers: int,
+    ) -> AsyncIterator[list[dict]]:
+        if window_workers > 1 and date_from is not None:
+            semaphore = asyncio.Semaphore(window_workers)
+
+            async def fetch(window: tuple[datetime, datetime]) -> list[dict]:
+                async with semaphore:
+                    return await self._fetch_headers(*window, page_size, row_number)
+
+            await self._async_authorization_headers()
+            for data in await asyncio.gather(*(fetch(window) for window in self._windows(date_from, date_to))):
+                yield data
+            return
+
+        current_date_from, current_date_to = self._first_window(date_from, date_to)
+        while date_from is None or current_date_to > date_from:
+            data = await self._fetch_headers(current_date_from, current_date_to, page_size, row_number)
+            yield data
+            if not data:
+                return
+            current_date_from, current_date_to = self._next_window(current_date_from, data, date_from)
+
+    async def all(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        page_size: int = 0,
+        row_number: int = 0,
+        with_details: bool = False,
+        max_workers: int = 8,
+        rate_limit: Optional[float] = None,
+        window_workers: int = 1,
+        records: bool = False,
+    ) -> AsyncIterator[ChequeModel]:
+        if date_to is None:
+            date_to = datetime.now()
+
+        first_cheque_id_in_chunk: Optional[int] = None
+
+        async for data in self._chunks(date_from, date_to, page_size, row_number, window_workers):
+            if not data or data[0]["chequeId"] == first_cheque_id_in_chunk:
+                break  # No more data, see Cheque.all
+            first_cheque_id_in_chunk = data[0]["chequeId"]
+
+            cheques = DEFAULT_PARSER.parse_many(ChequeModel, data)
+            if with_details:
+                await self.get_details(cheques, max_workers=max_workers, rate_limit=rate_limit, records=records)
+
+            for cheque in cheques:
+                yield cheque
+
+    async def sync(
+        self,
+        store: SQLiteChequeStore,
+        date_from: Optional[datetime] = None,
+        with_details: bool = True,
+        max_workers: int = 8,
+        rate_limit: Optional[float] = None,
+        window_workers: int = 1,
+        chunk_size: int = 100,
+    ) -> list[ChequeModel]:
+        """
+        Asyncio version of Cheque.sync, the store is accessed synchronously.
+        """
+        mark = store.get_high_water_mark(self.user.phone_number)
+        if mark is not None:
+            date_from = mark[0] if date_from is None else max(date_from, mark[0])
+
+        cheques = [cheque async for cheque in self.all(date_from=date_from, window_workers=window_workers)]
+        new_cheques = self._save_new_cheques(store, cheques)
+
+        if with_details:
+            cheques = self._cheques_without_details(store, new_cheques)
+            for i in range(0, len(cheques), chunk_size):
+                chunk = cheques[i : i + chunk_size]
+                await self.get_details(chunk, max_workers=max_workers, rate_limit=rate_limit)
+                self._save_details(store, chunk)
+        return new_cheques
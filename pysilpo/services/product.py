@@ -1,13 +1,21 @@
+import asyncio
+from collections.abc import AsyncIterator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Literal, Optional
+from functools import cached_property
+from pathlib import Path
+from typing import Literal, Optional, Union
 from urllib.parse import urljoin
 
-import requests
-from cryptography.utils import cached_property
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
-from pysilpo.utils.cursor import Cursor
+from pysilpo.services.base import AsyncBaseService, BaseService
+from pysilpo.utils.checkpoint import CrawlCheckpoint
+from pysilpo.utils.cursor import AsyncCursor, Cursor
 from pysilpo.utils.exceptions import SilpoException, SilpoRequestException
+from pysilpo.utils.models import DEFAULT_PARSER, ModelParser
+from pysilpo.utils.page_size import AdaptivePageSize
+from pysilpo.utils.rate_limit import HostLimiter, RateLimiter
 
 
 class SortBy(str, Enum):
@@ -50,7 +58,27 @@ class ProductModel(BaseModel):
     blur_for_under_aged: bool = Field(..., alias="blurForUnderAged")
 
 
+class BranchOfferModel(BaseModel):
+    branch_id: str
+    price: float
+    old_price: Optional[float] = None
+    stock: float
+
+
+class ProductComparisonModel(BaseModel):
+    external_product_id: int
+    title: str
+    slug: str
+    offers: dict[str, BranchOfferModel] = Field(default_factory=dict)  # By branch ID
+
+
 class CategoryModel(BaseModel):
+    _product_service: Optional[type["Product"]] = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._product_service = kwargs.pop("product_service", None)
+
     id: str = Field(..., alias="id")
     slug: str = Field(..., alias="slug")
     parent_id: Optional[str] = Field(None, alias="parentId")
@@ -62,28 +90,51 @@ class CategoryModel(BaseModel):
     updated_at: str = Field(..., alias="updatedAt")
 
     @cached_property
-    def products(self) -> Cursor[ProductModel]:
-        return Product.all(category_slug=self.slug, include_child_categories=False)
+    def products(self) -> Union[Cursor[ProductModel], AsyncCursor[ProductModel]]:
+        """Products of the category, AsyncCursor when the category is got with AsyncProduct."""
+        product_service = self._product_service or Product
+        return product_service.all(category_slug=self.slug, include_child_categories=False)
 
 
-class Product:
+class Product(BaseService):
     _DOMAIN = "https://sf-ecom-api.silpo.ua"
     _PRODUCTS_URL = urljoin(_DOMAIN, "/v1/uk/branches/{branch_id}/products")
     _CATEGORIES_URL = urljoin(_DOMAIN, "/v1/uk/branches/{branch_id}/categories")
 
     _DEFAULT_BRANCH_ID = "00000000-0000-0000-0000-000000000000"
+    # Largest page of adaptive Product.all(...), the same as categories are requested with
+    _MAX_PRODUCTS_LIMIT = 1000
 
     @classmethod
-    def categories(cls, branch_id=_DEFAULT_BRANCH_ID) -> Cursor[CategoryModel]:
-        full_url = cls._CATEGORIES_URL.format(branch_id=branch_id)
+    def categories(
+        cls, branch_id=_DEFAULT_BRANCH_ID, prefetch: int = 0, bypass_cache: bool = False
+    ) -> Cursor[CategoryModel]:
+        """
+        Get all categories of the branch
+
+        :param branch_id: Branch where to get categories from
+        :param prefetch: How many pages to fetch concurrently ahead of iteration, see Cursor
+        :param bypass_cache: Don't use cached response, see Transport(cache=...)
+        :return:
+        """
+        return cls._categories_cursor(
+            cls._CATEGORIES_URL.format(branch_id=branch_id), prefetch=prefetch, bypass_cache=bypass_cache
+        )
 
+    @classmethod
+    def _categories_cursor(cls, full_url: str, prefetch: int = 0, bypass_cache: bool = False) -> Cursor[CategoryModel]:
         def generator(_offset: int):
-            resp = requests.get(full_url, params={"limit": 1000, "offset": _offset})
+            resp = cls.get_transport().get(
+                full_url,
+                params={"limit": 1000, "offset": _offset},
+                endpoint="product.categories",
+                bypass_cache=bypass_cache,
+            )
             resp.raise_for_status()
             data = resp.json()
-            return [CategoryModel(**category) for category in data["items"]], data["total"]
+            return [CategoryModel(**category, product_service=cls) for category in data["items"]], data["total"]
 
-        return Cursor[CategoryModel](generator=generator, page_size=1000)
+        return Cursor[CategoryModel](generator=generator, page_size=1000, prefetch=prefetch)
 
     @classmethod
     def all(
@@ -100,6 +151,11 @@ class Product:
         in_stock: bool = False,
         limit: int = 50,
         offset: int = 0,
+        prefetch: int = 0,
+        bypass_cache: bool = False,
+        validate_sample: float = 0.01,
+        records: bool = False,
+        adaptive: Union[bool, AdaptivePageSize] = False,
     ) -> Cursor[ProductModel]:
         """
         Get all products from the branch
@@ -114,6 +170,12 @@ class Product:
         :param in_stock: Get only in stock products
         :param limit: How many products to get per request
         :param offset: How many products to skip
+        :param prefetch: How many pages to fetch concurrently ahead of iteration, see Cursor
+        :param bypass_cache: Don't use cached response, products are cached only with "product.all" cache policy
+        :param validate_sample: Share of products which are still validated in records mode
+        :param records: Yield compact ProductRecord namedtuples instead of models, use `to_model()` to get ProductModel
+        :param adaptive: Grow the request size from `limit` up to the largest one the API tolerates,
+            pass AdaptivePageSize(step=limit) to share the size between cursors
         :return:
         """
         # TODO: Add support for other query parameters, e.g. get data by products, productsIds, productsSlugs,
@@ -134,16 +196,56 @@ class Product:
             query_params["deliveryType"] = delivery_type
         if search:
             query_params["search"] = search
+        return cls._products_cursor(
+            full_url,
+            query_params,
+            page_size=limit,
+            prefetch=prefetch,
+            bypass_cache=bypass_cache,
+            parser=ModelParser(validate_sample=validate_sample, records=records),
+            page_sizer=cls._page_sizer(adaptive, limit),
+        )
 
-        def generator(_offset: int):
-            query_params["offset"] = _offset
-            resp = requests.get(full_url, params=query_params)
+    @classmethod
+    def _page_sizer(cls, adaptive: Union[bool, AdaptivePageSize], limit: int) -> Optional[AdaptivePageSize]:
+        if isinstance(adaptive, AdaptivePageSize):
+            return adaptive
+        return AdaptivePageSize(step=limit, max_limit=cls._MAX_PRODUCTS_LIMIT) if adaptive else None
+
+    @classmethod
+    def _products_cursor(
+        cls,
+        full_url: str,
+        query_params: dict,
+        page_size: int,
+        prefetch: int = 0,
+        bypass_cache: bool = False,
+        parser: ModelParser = DEFAULT_PARSER,
+        page_sizer: Optional[AdaptivePageSize] = None,
+    ) -> Cursor[ProductModel]:
+        def request(offset: int, limit: int) -> dict:
+            resp = cls.get_transport().get(
+                full_url,
+                params={**query_params, "offset": offset, "limit": limit},
+                endpoint="product.all",
+                bypass_cache=bypass_cache,
+            )
             if not resp.ok:
                 raise SilpoRequestException(f"Failed to fetch products: {resp.text}")
-            data = resp.json()
-            return [ProductModel(**product) for product in data["items"]], data["total"]
+            if page_sizer is not None:
+                page_sizer.record_payload(len(resp.content))
+            return resp.json()
+
+        def generator(_offset: int, _limit: int = page_size):
+            data = request(_offset, _limit)
+            return parser.parse_many(ProductModel, data["items"]), data["total"]
+
+        def counter() -> int:
+            return request(0, 1)["total"]
 
-        return Cursor(generator=generator, page_size=limit)
+        return Cursor(
+            generator=generator, page_size=page_size, prefetch=prefetch, counter=counter, page_sizer=page_sizer
+        )
 
     @classmethod
     def search(
@@ -161,3 +263,288 @@ class Product:
         :return:
         """
         return cls.all(branch_id=branch_id, search=search, sort_by=SortBy.PRODUCTS_LIST, **kwargs)
+
+    @classmethod
+    def _comparison_tasks(
+        cls, query_or_slugs: Union[str, Iterable[str]], branch_ids: Iterable[str], kwargs: dict
+    ) -> list[tuple[str, dict]]:
+        """
+        :return: (branch ID, Product.all(...) arguments) for every request of the comparison
+        """
+        if isinstance(query_or_slugs, str):
+            queries = [{"search": query_or_slugs, "sort_by": SortBy.PRODUCTS_LIST}]
+        else:
+            queries = [{"category_slug": slug} for slug in query_or_slugs]
+        return [(branch_id, {**query, **kwargs}) for branch_id in branch_ids for query in queries]
+
+    @staticmethod
+    def _merge_comparison(results: Iterable[tuple[str, list[ProductModel]]]) -> dict[int, ProductComparisonModel]:
+        table = {}
+        for branch_id, products in results:
+            for product in products:
+                row = table.get(product.external_product_id)
+                if row is None:
+                    row = table[product.external_product_id] = ProductComparisonModel(
+                        external_product_id=product.external_product_id, title=product.title, slug=product.slug
+                    )
+                row.offers[branch_id] = BranchOfferModel(
+                    branch_id=branch_id, price=product.price, old_price=product.old_price, stock=product.stock
+                )
+        return table
+
+    @classmethod
+    def compare(
+        cls,
+        query_or_slugs: Union[str, Iterable[str]],
+        branch_ids: Iterable[str],
+        max_workers: int = 8,
+        max_per_host: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        **kwargs,
+    ) -> dict[int, ProductComparisonModel]:
+        """
+        Run the same query against many branches concurrently and merge prices and stocks of the products
+
+        :param query_or_slugs: Search query or list of category slugs
+        :param branch_ids: Branches to compare
+        :param max_workers: How many requests run at once in total
+        :param max_per_host: How many requests to the same host run at once, only max_workers limits it by default
+        :param rate_limit: Maximum number of requests per second, unlimited by default
+        :param kwargs: Other query parameters from Product.all(...), e.g. in_stock=True
+        :return: Products by external product ID with offers per branch
+        """
+        host_limiter = HostLimiter(max_per_host) if max_per_host else None
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        def fetch(task: tuple[str, dict]) -> tuple[str, list[ProductModel]]:
+            branch_id, params = task
+            cursor = cls.all(branch_id=branch_id, **params)
+            generator = cursor.generator
+
+            def limited_generator(_offset: int, **generator_kwargs):
+                if limiter is not None:
+                    limiter.acquire()
+                if host_limiter is None:
+                    return generator(_offset=_offset, **generator_kwargs)
+                with host_limiter.limit(cls._DOMAIN):
+                    return generator(_offset=_offset, **generator_kwargs)
+
+            cursor.generator = limited_generator
+            return branch_id, list(cursor)
+
+        tasks = cls._comparison_tasks(query_or_slugs, branch_ids, kwargs)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pysilpo-compare") as executor:
+            return cls._merge_comparison(executor.map(fetch, tasks))
+
+    @classmethod
+    def _crawl_checkpoint(cls, branch_id: str, checkpoint: Union[str, Path, None]) -> Optional[CrawlCheckpoint]:
+        return CrawlCheckpoint(checkpoint, branch_id) if checkpoint is not None else None
+
+    @classmethod
+    def crawl(
+        cls,
+        branch_id=_DEFAULT_BRANCH_ID,
+        checkpoint: Union[str, Path, None] = None,
+        include_child_categories: bool = False,
+        limit: int = 100,
+        **kwargs,
+    ) -> Iterator[ProductModel]:
+        """
+        Stream every product of the branch, category by category. Every product is returned once,
+        even if it's listed in several categories.
+
+        With checkpoint file the crawl can be restarted after a failure (e.g. 429 Too Many Requests),
+        it continues from the last completely returned page. Products of the page which was being returned
+        during the failure are returned again. The file is removed when the crawl is complete.
+
+        :param branch_id: Branch where to get products from
+        :param checkpoint: Path of the checkpoint file, the crawl isn't resumable without it
+        :param include_child_categories: Request products of child categories with their parent category as well
+        :param limit: How many products to get per request
+        :param kwargs: Other query parameters from Product.all(...), e.g. in_stock=True
+        :return: Generator of products
+        """
+        state = cls._crawl_checkpoint(branch_id, checkpoint)
+        seen = state.seen if state is not None else set()
+        # One page size for all categories, so every category doesn't start from `limit` again
+        kwargs["adaptive"] = cls._page_sizer(kwargs.get("adaptive", False), limit)
+        for category in list(cls.categories(branch_id)):
+            if state is not None and category.slug in state.done:
+                continue
+            cursor = cls.all(
+                branch_id=branch_id,
+                category_slug=category.slug,
+                include_child_categories=include_child_categories,
+                limit=limit,
+                **kwargs,
+            )
+            offset = state.offsets.get(category.slug, 0) if state is not None else 0
+            while True:
+                # Pages are requested directly, so the crawl can start from any offset
+                if cursor.page_sizer is not None:
+                    (products, total), _ = cursor.page_sizer.call(
+                        lambda page_limit: cursor.generator(_offset=offset, _limit=page_limit)  # noqa: B023
+                    )
+                else:
+                    products, total = cursor.generator(_offset=offset)
+                new_products = [product for product in products if product.external_product_id not in seen]
+                yield from new_products
+                # The API may return fewer items than requested, e.g. it caps the page size
+                offset += len(products)
+                seen.update(product.external_product_id for product in new_products)
+                if state is not None:
+                    state.advance(category.slug, offset, (product.external_product_id for product in new_products))
+                if not products or offset >= total:
+                    break
+            if state is not None:
+                state.finish(category.slug)
+        if state is not None:
+            state.remove()
+
+
+class AsyncProduct(AsyncBaseService, Product):
+    """
+    Asyncio version of Product. It has the same methods, but they return AsyncCursor.
+    """
+
+    @classmethod
+    def _categories_cursor(
+        cls,
+        full_url: str,
+        prefetch: int = 0,
+        bypass_cache: bool = False,
+    ) -> AsyncCursor[CategoryModel]:
+        async def generator(_offset: int):
+            resp = await cls.get_transport().get(
+                full_url,
+                params={"limit": 1000, "offset": _offset},
+                endpoint="product.categories",
+                bypass_cache=bypass_cache,
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            return [CategoryModel(**category, product_service=cls) for category in data["items"]], data["total"]
+
+        return AsyncCursor[CategoryModel](generator=generator, page_size=1000, prefetch=prefetch)
+
+    @classmethod
+    def _products_cursor(
+        cls,
+        full_url: str,
+        query_params: dict,
+        page_size: int,
+        prefetch: int = 0,
+        bypass_cache: bool = False,
+        parser: ModelParser = DEFAULT_PARSER,
+        page_sizer: Optional[AdaptivePageSize] = None,
+    ) -> AsyncCursor[ProductModel]:
+        async def request(offset: int, limit: int) -> dict:
+            resp = await cls.get_transport().get(
+                full_url,
+                params={**query_params, "offset": offset, "limit": limit},
+                endpoint="product.all",
+                bypass_cache=bypass_cache,
+            )
+            if not resp.is_success:
+                raise SilpoRequestException(f"Failed to fetch products: {resp.text}")
+            if page_sizer is not None:
+                page_sizer.record_payload(len(resp.content))
+            return resp.json()
+
+        async def generator(_offset: int, _limit: int = page_size):
+            data = await request(_offset, _limit)
+            return parser.parse_many(ProductModel, data["items"]), data["total"]
+
+        async def counter() -> int:
+            return (await request(0, 1))["total"]
+
+        return AsyncCursor(
+            generator=generator, page_size=page_size, prefetch=prefetch, counter=counter, page_sizer=page_sizer
+        )
+
+    @classmethod
+    async def compare(
+        cls,
+        query_or_slugs: Union[str, Iterable[str]],
+        branch_ids: Iterable[str],
+        max_workers: int = 8,
+        max_per_host: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        **kwargs,
+    ) -> dict[int, ProductComparisonModel]:
+        """
+        Asyncio version of Product.compare(...), `max_workers` limits how many requests are in flight.
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+        host_limiter = HostLimiter(max_per_host) if max_per_host else None
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        async def fetch(task: tuple[str, dict]) -> tuple[str, list[ProductModel]]:
+            branch_id, params = task
+            cursor = cls.all(branch_id=branch_id, **params)
+            generator = cursor.generator
+
+            async def limited_generator(_offset: int, **generator_kwargs):
+                if limiter is not None:
+                    await limiter.async_acquire()
+                async with semaphore:
+                    if host_limiter is None:
+                        return await generator(_offset=_offset, **generator_kwargs)
+                    async with host_limiter.async_limit(cls._DOMAIN):
+                        return await generator(_offset=_offset, **generator_kwargs)
+
+            cursor.generator = limited_generator
+            return branch_id, [product async for product in cursor]
+
+        tasks = cls._comparison_tasks(query_or_slugs, branch_ids, kwargs)
+        return cls._merge_comparison(await asyncio.gather(*(fetch(task) for task in tasks)))
+
+    @classmethod
+    async def crawl(
+        cls,
+        branch_id=Product._DEFAULT_BRANCH_ID,
+        checkpoint: Union[str, Path, None] = None,
+        include_child_categories: bool = False,
+        limit: int = 100,
+        **kwargs,
+    ) -> AsyncIterator[ProductModel]:
+        """
+        Asyncio version of Product.crawl(...), use it with `async for`.
+        """
+        state = cls._crawl_checkpoint(branch_id, checkpoint)
+        seen = state.seen if state is not None else set()
+        # One page size for all categories, so every category doesn't start from `limit` again
+        kwargs["adaptive"] = cls._page_sizer(kwargs.get("adaptive", False), limit)
+        categories = [category async for category in cls.categories(branch_id)]
+        for category in categories:
+            if state is not None and category.slug in state.done:
+                continue
+            cursor = cls.all(
+                branch_id=branch_id,
+                category_slug=category.slug,
+                include_child_categories=include_child_categories,
+                limit=limit,
+                **kwargs,
+            )
+            offset = state.offsets.get(category.slug, 0) if state is not None else 0
+            while True:
+                if cursor.page_sizer is not None:
+                    (products, total), _ = await cursor.page_sizer.async_call(
+                        lambda page_limit: cursor.generator(_offset=offset, _limit=page_limit)  # noqa: B023
+                    )
+                else:
+                    products, total = await cursor.generator(_offset=offset)
+                new_products = [product for product in products if product.external_product_id not in seen]
+                for product in new_products:
+                    yield product
+                # The API may return fewer items than requested, e.g. it caps the page size
+                offset += len(products)
+                seen.update(product.external_product_id for product in new_products)
+                if state is not None:
+                    state.advance(category.slug, offset, (product.external_product_id for product in new_products))
+                if not products or offset >= total:
+                    break
+            if state is not None:
+                state.finish(category.slug)
+        if state is not None:
+            state.remove()
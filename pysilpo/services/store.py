@@ -1,45 +1,56 @@
+import asyncio
+import hashlib
 import json
-import random
-import string
-from typing import Optional
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import ClassVar, Optional, Union
 from urllib.parse import urljoin
 
-import requests
-from cryptography.utils import cached_property
 from pydantic import BaseModel, Field, PrivateAttr
 
-from pysilpo.utils.cursor import Cursor
-from pysilpo.utils.exceptions import SilpoRequestException
+from pysilpo.services.base import AsyncBaseService, BaseService
+from pysilpo.utils.cursor import AsyncCursor, Cursor, Empty
+from pysilpo.utils.exceptions import SilpoException, SilpoRequestException
+from pysilpo.utils.models import DEFAULT_PARSER, ModelParser
 
 _GRAPHQL_API_URL = "https://graphql.silpo.ua/graphql"
 
 
 class CityModel(BaseModel):
     _stores: Cursor["StoreModel"] = PrivateAttr(None)
+    _store_service: Optional[type["Store"]] = PrivateAttr(default=None)
     id: str
     title: str
     slug: str
 
     def __init__(self, **data):
         super().__init__(**data)
+        self._store_service = data.pop("store_service", None)
         stores = data.pop("storeFilterable", None)
         if stores is not None:
-            stores = [StoreModel(**x) for x in stores]
+            stores = [StoreModel(**x, store_service=self._store_service) for x in stores]
             self._stores = Cursor(generator=lambda _offset: (stores, len(stores)), page_size=len(stores))
 
     @cached_property
-    def stores(self) -> Cursor["StoreModel"]:
+    def stores(self) -> Union[Cursor["StoreModel"], AsyncCursor["StoreModel"]]:
+        """Stores of the city, AsyncCursor when the city is got with AsyncCity and stores weren't included."""
         if not self._stores:
-            self._stores = Store.all(city_id=self.id)
+            store_service = self._store_service or Store
+            self._stores = store_service.all(city_id=self.id)
         return self._stores
 
 
 class StoreModel(BaseModel):
+    _store_service: Optional[type["Store"]] = PrivateAttr(default=None)
+
     def __init__(self, **data):
         super().__init__(**data)
         filial_id = data.get("filial_id")
         if filial_id is not None:
             self.filial_id = filial_id
+        self._store_service = data.pop("store_service", None)
+        self.city._store_service = self._store_service
 
     id: str = Field(..., alias="id")
     images: list[dict] = Field(..., alias="images")
@@ -66,12 +77,25 @@ class StoreModel(BaseModel):
 
     @cached_property
     def branch_id(self) -> Optional[str]:
-        try:
-            if self.filial_id is None:
-                return None
-            return Store.get_branch_id(self.filial_id)[0].branch_id
-        except IndexError:
-            raise SilpoRequestException(f"Branch not found for filial_id: {self.filial_id}") from None
+        """
+        Branch ID of the store, it's resolved with a request unless it has been resolved in bulk.
+        Stores of AsyncStore don't send blocking requests, await AsyncStore.resolve_branch_ids(...) first.
+        """
+        if self.filial_id is None:
+            return None
+        store_service = self._store_service or Store
+        if issubclass(store_service, AsyncBaseService):
+            if self.filial_id not in store_service._branch_ids:
+                raise SilpoException(
+                    f"Branch ID of filial {self.filial_id} isn't resolved, "
+                    "await AsyncStore.resolve_branch_ids(stores) first"
+                )
+            return store_service._branch_ids[self.filial_id]
+        # Free when branch IDs were resolved in bulk, see Store.resolve_branch_ids(...)
+        branch_id = store_service.resolve_branch_ids([self.filial_id]).get(self.filial_id)
+        if branch_id is None:
+            raise SilpoRequestException(f"Branch not found for filial_id: {self.filial_id}")
+        return branch_id
 
 
 class FilialModel(BaseModel):
@@ -80,13 +104,16 @@ class FilialModel(BaseModel):
     filial_id: str = Field(..., alias="filialId")
 
 
-class Store:
+class Store(BaseService):
     _BASE_RESTFUL_DOMAIN = "https://sf-ecom-api.silpo.ua"
 
     _GET_BRANCH_BY_FILIAL_ID_URL = urljoin(_BASE_RESTFUL_DOMAIN, "/v1/branches/by-filial-ids")
 
-    _ALL_STORES_QUERY = """query stores($filter: StoreFilterInputType, $pagingInfo: InputBatch!) {
-      stores(filter: $filter, pagingInfo: $pagingInfo) {
+    # Branch ID by filial ID, shared by Store and all its bound and async versions
+    _branch_ids: ClassVar[dict[int, str]] = {}
+
+    # Selection of one page of stores, batched requests repeat it under different aliases
+    _STORES_PAGE_SELECTION = """{
         limit
         offset
         count
@@ -96,10 +123,9 @@ class Store:
           __typename
         }
         __typename
-      }
-    }
+      }"""
 
-    fragment StoreBaseFragment on Store {
+    _STORE_FRAGMENTS = """fragment StoreBaseFragment on Store {
       id
       images {
         image {
@@ -153,26 +179,92 @@ class Store:
       __typename
     }"""
 
+    _ALL_STORES_QUERY = (
+        """query stores($filter: StoreFilterInputType, $pagingInfo: InputBatch!) {
+      stores(filter: $filter, pagingInfo: $pagingInfo) """
+        + _STORES_PAGE_SELECTION
+        + """
+    }
+
+    """
+        + _STORE_FRAGMENTS
+    )
+
     @classmethod
-    def all(cls, city_id: Optional[str] = None) -> Cursor[StoreModel]:
-        form_data = {
-            "query": cls._ALL_STORES_QUERY,
-            "variables": {
-                "filter": {
-                    "filialId": None,
-                    "cityId": city_id,
-                    "start": None,
-                    "end": None,
-                    "hasCertificate": None,
-                    "servicesIds": None,
-                },
-                "pagingInfo": {"limit": 400, "offset": 0},
+    def all(
+        cls,
+        city_id: Optional[str] = None,
+        bypass_cache: bool = False,
+        limit: int = 400,
+        pages_per_request: int = 1,
+        prefetch: int = 0,
+        trusted: bool = False,
+        validate_sample: float = 0.01,
+        records: bool = False,
+    ) -> Cursor[StoreModel]:
+        """
+        Get all stores
+
+        :param city_id: Get stores only from this city
+        :param bypass_cache: Don't use cached response, see Transport(cache=...)
+        :param limit: How many stores to request per page
+        :param pages_per_request: How many pages to request in one HTTP request (as GraphQL aliases),
+            e.g. 4 fetches 1600 stores per round trip
+        :param prefetch: How many requests ahead to send in background threads
+        :param trusted: Build stores without pydantic validation, it's about 1.5x faster, see ModelParser
+        :param validate_sample: Share of stores which are still validated in trusted or records mode
+        :param records: Yield compact StoreRecord namedtuples instead of models, use `to_model()` to get StoreModel
+        :return:
+        """
+        return cls._stores_cursor(
+            city_id,
+            limit,
+            pages_per_request,
+            prefetch=prefetch,
+            bypass_cache=bypass_cache,
+            parser=ModelParser(trusted, validate_sample, records),
+        )
+
+    @classmethod
+    def _stores_query(cls, pages: int) -> str:
+        if pages == 1:
+            return cls._ALL_STORES_QUERY
+        variables = ", ".join(f"$page{i}: InputBatch!" for i in range(pages))
+        fields = "\n".join(
+            f"      page{i}: stores(filter: $filter, pagingInfo: $page{i}) {cls._STORES_PAGE_SELECTION}"
+            for i in range(pages)
+        )
+        query = f"query stores($filter: StoreFilterInputType, {variables}) {{\n{fields}\n    }}"
+        return f"{query}\n\n    {cls._STORE_FRAGMENTS}"
+
+    @classmethod
+    def _stores_payload(cls, city_id: Optional[str], offset: int, limit: int, pages: int) -> dict:
+        variables = {
+            "filter": {
+                "filialId": None,
+                "cityId": city_id,
+                "start": None,
+                "end": None,
+                "hasCertificate": None,
+                "servicesIds": None,
             },
-            "operationName": "stores",
         }
-
-        # Custom boundary string
-        boundary = "----WebKitFormBoundary" + "".join(random.choices(string.ascii_letters + string.digits, k=16))  # noqa: S311
+        if pages == 1:
+            variables["pagingInfo"] = {"limit": limit, "offset": offset}
+        else:
+            for i in range(pages):
+                variables[f"page{i}"] = {"limit": limit, "offset": offset + i * limit}
+        return {"query": cls._stores_query(pages), "variables": variables, "operationName": "stores"}
+
+    @staticmethod
+    def _multipart(form_data: dict) -> tuple[dict, str]:
+        """
+        Encode form data as multipart body, it's done for every request, so every offset gets its own body.
+
+        :return: (headers, body)
+        """
+        # Custom boundary string, derived from the form data to keep the body (and its cache key) stable
+        boundary = "----WebKitFormBoundary" + hashlib.sha256(json.dumps(form_data).encode()).hexdigest()[:16]
 
         # Create the multipart form data manually
         body_parts = []
@@ -190,31 +282,209 @@ class Store:
 
         # Set headers with the custom boundary
         headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        return headers, body
+
+    @staticmethod
+    def _parse_stores(json_data: dict, pages: int) -> tuple[list[dict], int]:
+        """
+        Merge pages of a (batched) response.
+
+        :return: (store items, total count)
+        """
+        if json_data.get("errors") or not json_data.get("data"):
+            raise SilpoRequestException(f"Failed to fetch stores: {json_data.get('errors')}")
+        data = json_data["data"]
+        results = [data["stores"]] if pages == 1 else [data[f"page{i}"] for i in range(pages)]
+        items = [item for result in results for item in result["items"]]
+        return items, results[0]["count"]
 
-        def generator(_offset: int):
-            # Update the offset for pagination
-            form_data["variables"]["pagingInfo"]["offset"] = _offset
+    @classmethod
+    def _stores_cursor(
+        cls,
+        city_id: Optional[str],
+        limit: int,
+        pages_per_request: int,
+        prefetch: int = 0,
+        bypass_cache: bool = False,
+        parser: ModelParser = DEFAULT_PARSER,
+    ) -> Cursor[StoreModel]:
+        def request(offset: int, page_limit: int, pages: int) -> tuple[list[dict], int]:
+            headers, body = cls._multipart(cls._stores_payload(city_id, offset, page_limit, pages))
 
             # Send the POST request
-            resp = requests.post(_GRAPHQL_API_URL, headers=headers, data=body)
+            resp = cls.get_transport().post(
+                _GRAPHQL_API_URL,
+                headers=headers,
+                data=body,
+                endpoint="store.all",
+                bypass_cache=bypass_cache,
+                idempotent=True,
+            )
 
             if not resp.ok:
                 raise SilpoRequestException(f"Failed to fetch stores: {resp.text}")
 
             # Extract relevant data from the response
-            data = resp.json()["data"]["stores"]
-            return [StoreModel(**x) for x in data["items"]], data["count"]
+            return cls._parse_stores(resp.json(), pages)
+
+        def generator(_offset: int):
+            items, count = request(_offset, limit, pages_per_request)
+            return parser.parse_many(StoreModel, items, store_service=cls), count
+
+        def counter() -> int:
+            return request(0, 1, 1)[1]
+
+        return Cursor(generator=generator, page_size=limit * pages_per_request, prefetch=prefetch, counter=counter)
+
+    @classmethod
+    def get_branch_id(cls, *filial_ids: int, bypass_cache: bool = False) -> list[FilialModel]:
+        resp = cls.get_transport().get(
+            cls._GET_BRANCH_BY_FILIAL_ID_URL,
+            params={"filialIds[]": filial_ids},
+            endpoint="store.get_branch_id",
+            bypass_cache=bypass_cache,
+        )
+        resp.raise_for_status()
+        return [FilialModel(**item) for item in resp.json()["items"]]
+
+    @staticmethod
+    def _filial_ids(stores: Iterable[Union[StoreModel, int]]) -> list[int]:
+        if isinstance(stores, Cursor):
+            # Read the cursor by index, so its iteration state isn't touched
+            cursor, stores = stores, []
+            while (store := cursor.get(len(stores))) is not Empty:
+                stores.append(store)
+        filial_ids = []
+        for store in stores:
+            filial_id = getattr(store, "filial_id", store)
+            if filial_id is not None and filial_id not in filial_ids:
+                filial_ids.append(filial_id)
+        return filial_ids
+
+    @classmethod
+    def _remember_branch_ids(cls, filials: Iterable[FilialModel]):
+        for filial in filials:
+            cls._branch_ids[int(filial.filial_id)] = filial.branch_id
+
+    @classmethod
+    def resolve_branch_ids(
+        cls,
+        stores: Iterable[Union[StoreModel, int]],
+        chunk_size: int = 100,
+        max_workers: int = 4,
+        bypass_cache: bool = False,
+    ) -> dict[int, str]:
+        """
+        Resolve branch IDs of many stores with a few batch requests, e.g. Store.resolve_branch_ids(city.stores).
+        Resolved IDs are remembered, so `StoreModel.branch_id` doesn't send requests afterwards.
+
+        :param stores: Stores (e.g. Cursor[StoreModel] or CityModel.stores), their records or filial IDs
+        :param chunk_size: How many filial IDs to send in one request
+        :param max_workers: How many requests to send concurrently
+        :param bypass_cache: Ignore remembered and cached branch IDs
+        :return: Branch ID by filial ID, stores without branch are omitted
+        """
+        filial_ids = cls._filial_ids(stores)
+        missing = filial_ids if bypass_cache else [x for x in filial_ids if x not in cls._branch_ids]
+        chunks = [missing[i : i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+        def resolve(chunk: list[int]) -> list[FilialModel]:
+            return cls.get_branch_id(*chunk, bypass_cache=bypass_cache)
+
+        if len(chunks) > 1 and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pysilpo-branches") as executor:
+                results = list(executor.map(resolve, chunks))
+        else:
+            results = [resolve(chunk) for chunk in chunks]
+        for filials in results:
+            cls._remember_branch_ids(filials)
+        return {x: cls._branch_ids[x] for x in filial_ids if x in cls._branch_ids}
+
+
+class AsyncStore(AsyncBaseService, Store):
+    """
+    Asyncio version of Store. `all` returns AsyncCursor and `get_branch_id` is a coroutine.
+    """
+
+    @classmethod
+    def _stores_cursor(
+        cls,
+        city_id: Optional[str],
+        limit: int,
+        pages_per_request: int,
+        prefetch: int = 0,
+        bypass_cache: bool = False,
+        parser: ModelParser = DEFAULT_PARSER,
+    ) -> AsyncCursor[StoreModel]:
+        async def request(offset: int, page_limit: int, pages: int) -> tuple[list[dict], int]:
+            headers, body = cls._multipart(cls._stores_payload(city_id, offset, page_limit, pages))
+
+            resp = await cls.get_transport().post(
+                _GRAPHQL_API_URL,
+                headers=headers,
+                content=body,
+                endpoint="store.all",
+                bypass_cache=bypass_cache,
+                idempotent=True,
+            )
+
+            if not resp.is_success:
+                raise SilpoRequestException(f"Failed to fetch stores: {resp.text}")
+
+            return cls._parse_stores(resp.json(), pages)
 
-        return Cursor(generator=generator, page_size=form_data["variables"]["pagingInfo"]["limit"])
+        async def generator(_offset: int):
+            items, count = await request(_offset, limit, pages_per_request)
+            return parser.parse_many(StoreModel, items, store_service=cls), count
+
+        async def counter() -> int:
+            return (await request(0, 1, 1))[1]
+
+        return AsyncCursor(
+            generator=generator, page_size=limit * pages_per_request, prefetch=prefetch, counter=counter
+        )
 
     @classmethod
-    def get_branch_id(cls, *filial_ids: int) -> list[FilialModel]:
-        resp = requests.get(cls._GET_BRANCH_BY_FILIAL_ID_URL, params={"filialIds[]": filial_ids})
+    async def get_branch_id(cls, *filial_ids: int, bypass_cache: bool = False) -> list[FilialModel]:
+        resp = await cls.get_transport().get(
+            cls._GET_BRANCH_BY_FILIAL_ID_URL,
+            params={"filialIds[]": filial_ids},
+            endpoint="store.get_branch_id",
+            bypass_cache=bypass_cache,
+        )
         resp.raise_for_status()
         return [FilialModel(**item) for item in resp.json()["items"]]
 
+    @classmethod
+    async def resolve_branch_ids(
+        cls,
+        stores: Union[AsyncCursor[StoreModel], Iterable[Union[StoreModel, int]]],
+        chunk_size: int = 100,
+        max_workers: int = 4,
+        bypass_cache: bool = False,
+    ) -> dict[int, str]:
+        """
+        Asyncio version of Store.resolve_branch_ids(...), `stores` can be AsyncCursor as well.
+        """
+        if isinstance(stores, AsyncCursor):
+            stores = [store async for store in stores]
+        filial_ids = cls._filial_ids(stores)
+        missing = filial_ids if bypass_cache else [x for x in filial_ids if x not in cls._branch_ids]
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def resolve(chunk: list[int]) -> list[FilialModel]:
+            async with semaphore:
+                return await cls.get_branch_id(*chunk, bypass_cache=bypass_cache)
+
+        results = await asyncio.gather(
+            *(resolve(missing[i : i + chunk_size]) for i in range(0, len(missing), chunk_size))
+        )
+        for filials in results:
+            cls._remember_branch_ids(filials)
+        return {x: cls._branch_ids[x] for x in filial_ids if x in cls._branch_ids}
+
 
-class City:
+class City(BaseService):
     _CITY_QUERY = """query cityWithStores($slug: String) {
           city(slug: $slug) {
             ...CityBaseFragment
@@ -281,15 +551,41 @@ class City:
         }"""
 
     @classmethod
-    def get(cls, slug: str) -> CityModel:
-        resp = requests.post(
+    def _city_payload(cls, slug: str) -> dict:
+        return {
+            "query": cls._CITY_QUERY,
+            "variables": {"slug": slug},
+            "operationName": "cityWithStores",
+        }
+
+    @classmethod
+    def get(cls, slug: str, bypass_cache: bool = False) -> CityModel:
+        resp = cls.get_transport().post(
             _GRAPHQL_API_URL,
-            json={
-                "query": cls._CITY_QUERY,
-                "variables": {"slug": slug},
-                "operationName": "cityWithStores",
-            },
+            json=cls._city_payload(slug),
+            endpoint="city.get",
+            bypass_cache=bypass_cache,
+            idempotent=True,
+        )
+        resp.raise_for_status()
+        data = resp.json()["data"]["city"]
+        return CityModel(**data, store_service=Store.bind(cls.get_transport())) if data else None
+
+
+class AsyncCity(AsyncBaseService, City):
+    """
+    Asyncio version of City.
+    """
+
+    @classmethod
+    async def get(cls, slug: str, bypass_cache: bool = False) -> CityModel:
+        resp = await cls.get_transport().post(
+            _GRAPHQL_API_URL,
+            json=cls._city_payload(slug),
+            endpoint="city.get",
+            bypass_cache=bypass_cache,
+            idempotent=True,
         )
         resp.raise_for_status()
         data = resp.json()["data"]["city"]
-        return CityModel(**data) if data else None
+        return CityModel(**data, store_service=AsyncStore.bind(cls.get_transport())) if data else None
@@ -1,6 +1,14 @@
+import hashlib
+import os
 import pickle
+import shutil
 import sqlite3
 import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
 from datetime import datetime
 
 if sys.version_info >= (3, 11):
@@ -11,22 +19,99 @@ else:
     UTC = timezone.utc
 
 from pathlib import Path
-from typing import Union
+from typing import Any, Optional, Protocol, Union
+
+from pysilpo.utils.exceptions import SilpoException
+
+try:
+    import redis
+except ImportError:
+    redis = None
 
 MAX_TS = round(datetime.max.replace(year=9998).timestamp())  # Maximum Unix timestamp
 
 
+def get_expiry_time(expires_in: Union[datetime, int, None] = None) -> int:
+    """Convert `expires_in` argument of cache `set` methods to Unix timestamp."""
+    if expires_in is None:
+        return MAX_TS
+    if isinstance(expires_in, int):
+        return expires_in
+    return round(expires_in.timestamp())  # Convert datetime to Unix timestamp
+
+
+class CacheBackend(Protocol):
+    """
+    Storage of tokens, cookies and cached responses. `expires_in` is either datetime,
+    Unix timestamp or None (never expires).
+    """
+
+    def get_entry(self, key: str) -> Optional[tuple[Any, float]]:
+        """Cached value with its expiry timestamp, or None if expired or not found."""
+        ...
+
+    def get(self, key: str) -> Any: ...
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]: ...
+
+    def set(self, key: str, value: Any, expires_in: Union[datetime, int, None] = None) -> None: ...
+
+    def set_many(self, items: dict[str, Any], expires_in: Union[datetime, int, None] = None) -> None: ...
+
+    def add(self, key: str, value: Any, expires_in: Union[datetime, int, None] = None) -> bool:
+        """
+        Store the value only if the key is missing or expired, atomically for all processes sharing the cache.
+        It's optional, CacheLock works only with backends which have it.
+
+        :return: Whether the value was stored
+        """
+        ...
+
+    def remove(self, key: str) -> None: ...
+
+    def clear(self) -> None: ...
+
+
 class SQLiteCache:
-    def __init__(self, db_name="cache.db", use_pickle=True):
-        """Initialize with optional pickle support and a database name."""
+    # Maximum number of SQL variables in one statement, SQLite limit is 999 in old versions
+    CHUNK_SIZE = 500
+
+    def __init__(
+        self,
+        db_name="cache.db",
+        use_pickle=True,
+        max_entries: Optional[int] = None,
+        sweep_interval: Optional[int] = 300,
+        timeout: float = 30,
+        directory: Union[str, Path, None] = None,
+    ):
+        """
+        Initialize with optional pickle support and a database name.
+
+        :param db_name: SQLite database file name
+        :param use_pickle: Serialize values with pickle
+        :param max_entries: Maximum number of entries, the oldest written ones are evicted on sweep
+        :param sweep_interval: How often (in seconds) `set` removes expired entries and enforces `max_entries`,
+            None disables sweeps, call `purge_expired()` yourself then
+        :param timeout: How many seconds to wait for a lock held by another process
+        :param directory: Where to keep the database, `~/.pysilpo` by default
+        """
 
-        user_data_dir = Path.home() / ".pysilpo"
+        user_data_dir = Path(directory) if directory is not None else Path.home() / ".pysilpo"
         user_data_dir.mkdir(parents=True, exist_ok=True)  # Ensure the directory exists
         self.db_name = user_data_dir / db_name
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._swept_at = time.monotonic()
 
-        self.conn = sqlite3.connect(str(self.db_name))
+        # Connection is shared between threads, so every operation is done under the lock
+        self.conn = sqlite3.connect(str(self.db_name), timeout=timeout, check_same_thread=False)
         self.cursor = self.conn.cursor()
+        self.lock = threading.RLock()
 
+        # WAL lets readers work while another process writes, so several workers can share the cache
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
         # Create the cache table with columns for key, value, and expiry time
         self.cursor.execute(
             """CREATE TABLE IF NOT EXISTS cache (
@@ -34,6 +119,7 @@ class SQLiteCache:
                                 value BLOB,  -- Store value as a binary blob
                                 expiry REAL)"""
         )
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS cache_expiry ON cache (expiry)")
         self.conn.commit()
 
         self.use_pickle = use_pickle  # Whether to use pickle for serialization
@@ -41,78 +127,594 @@ class SQLiteCache:
     def __del__(self):
         """Automatically close the SQLite connection when the object is deleted."""
 
-        if self.conn:
-            self.conn.close()
+        conn = getattr(self, "conn", None)
+        if conn:
+            conn.close()
 
-    def _check_expiry(self, key):
-        """Check if the cache entry has expired."""
-        self.cursor.execute("SELECT expiry FROM cache WHERE key = ?", (key,))
-        result = self.cursor.fetchone()
-        if result:
-            expiry_time = result[0]
-            now = datetime.now(tz=UTC).timestamp()
-            return expiry_time < now  # Return True if expired
-        return False
+    @staticmethod
+    def _now() -> float:
+        return datetime.now(tz=UTC).timestamp()
+
+    def _loads(self, value):
+        return pickle.loads(value) if self.use_pickle else value  # noqa: S301
+
+    def _dumps(self, value):
+        return pickle.dumps(value) if self.use_pickle else value
+
+    def get_entry(self, key) -> Optional[tuple[Any, float]]:
+        """Retrieve a cached value with its expiry timestamp, or None if expired or not found."""
+        with self.lock:
+            self.cursor.execute("SELECT value, expiry FROM cache WHERE key = ? AND expiry >= ?", (key, self._now()))
+            result = self.cursor.fetchone()
+        if not result:
+            return None  # Expired or not found
+        value, expiry_time = result
+        return self._loads(value), expiry_time
 
     def get(self, key):
         """Retrieve a cached value, or None if expired or not found."""
-        # Check if the key exists and if it's expired
-        if self._check_expiry(key):
-            self.remove(key)  # Remove expired entry
-            return None  # Expired
-
-        self.cursor.execute("SELECT value FROM cache WHERE key = ?", (key,))
-        result = self.cursor.fetchone()
-        if result:
-            value = result[0]
-            if self.use_pickle:
-                return pickle.loads(value)  # noqa: S301
-            return value
-        return None  # Not found
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entries(self, keys: Iterable[str]) -> dict[str, tuple[Any, float]]:
+        """Retrieve several cached values with their expiry timestamps, expired and missing keys are omitted."""
+        keys = list(keys)
+        now = self._now()
+        rows = []
+        with self.lock:
+            for i in range(0, len(keys), self.CHUNK_SIZE):
+                chunk = keys[i : i + self.CHUNK_SIZE]
+                self.cursor.execute(
+                    f"SELECT key, value, expiry FROM cache WHERE key IN ({','.join('?' * len(chunk))}) AND expiry >= ?",  # noqa: S608
+                    (*chunk, now),
+                )
+                rows.extend(self.cursor.fetchall())
+        return {key: (self._loads(value), expiry_time) for key, value, expiry_time in rows}
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Retrieve several cached values at once, expired and missing keys are omitted."""
+        return {key: value for key, (value, _) in self.get_entries(keys).items()}
 
     def set(self, key, value, expires_in: Union[datetime, int, None] = None):
         """Store a value in the cache with an optional TTL."""
-        if expires_in is None:
-            expiry_time = MAX_TS
-        elif isinstance(expires_in, int):
-            expiry_time = expires_in
-        else:
-            expiry_time = round(expires_in.timestamp())  # Convert datetime to Unix timestamp
-        # Serialize the value if using pickle
-        if self.use_pickle:
-            value = pickle.dumps(value)  # Serialize using pickle
+        self.set_many({key: value}, expires_in=expires_in)
 
-        self.cursor.execute(
-            "REPLACE INTO cache (key, value, expiry) VALUES (?, ?, ?)",
-            (key, value, expiry_time),
-        )
-        self.conn.commit()
+    def set_many(self, items: dict[str, Any], expires_in: Union[datetime, int, None] = None):
+        """Store several values with the same TTL in one transaction."""
+        expiry_time = get_expiry_time(expires_in)
+        # Serialize the values if using pickle
+        rows = [(key, self._dumps(value), expiry_time) for key, value in items.items()]
+
+        with self.lock:
+            self.cursor.executemany("REPLACE INTO cache (key, value, expiry) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+        if self.sweep_interval is not None and time.monotonic() - self._swept_at >= self.sweep_interval:
+            self.purge_expired()
+
+    def add(self, key, value, expires_in: Union[datetime, int, None] = None) -> bool:
+        """Store a value only if the key is missing or expired, returns whether it was stored."""
+        with self.lock:
+            # Both statements run in one write transaction, so another process can't add the key in between
+            self.cursor.execute("DELETE FROM cache WHERE key = ? AND expiry < ?", (key, self._now()))
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expiry) VALUES (?, ?, ?)",
+                (key, self._dumps(value), get_expiry_time(expires_in)),
+            )
+            added = self.cursor.rowcount == 1
+            self.conn.commit()
+        return added
+
+    def purge_expired(self) -> int:
+        """
+        Remove expired entries and, when `max_entries` is set, the oldest written entries above the limit.
+
+        :return: Number of removed entries
+        """
+        self._swept_at = time.monotonic()
+        with self.lock:
+            self.cursor.execute("DELETE FROM cache WHERE expiry < ?", (self._now(),))
+            removed = self.cursor.rowcount
+            if self.max_entries is not None:
+                # REPLACE gives the row a new rowid, so the smallest rowids are the oldest writes
+                self.cursor.execute(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                removed += self.cursor.rowcount
+            self.conn.commit()
+        return removed
 
     def remove(self, key):
         """Remove a key-value pair from the cache."""
-        self.cursor.execute("DELETE FROM cache WHERE key = ?", (key,))
-        self.conn.commit()
+        with self.lock:
+            self.cursor.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.conn.commit()
 
     def clear(self):
         """Clear the entire cache."""
-        self.cursor.execute("DELETE FROM cache")
-        self.conn.commit()
+        with self.lock:
+            self.cursor.execute("DELETE FROM cache")
+            self.conn.commit()
 
     def exists(self, key):
         """Check if a key exists in the cache (even if expired)."""
-        self.cursor.execute("SELECT 1 FROM cache WHERE key = ?", (key,))
-        return self.cursor.fetchone() is not None
+        with self.lock:
+            self.cursor.execute("SELECT 1 FROM cache WHERE key = ?", (key,))
+            return self.cursor.fetchone() is not None
 
     def get_all(self):
-        """Retrieve all keys and values from the cache."""
-        # TODO: Fix ttl check
-        self.cursor.execute("SELECT key, value FROM cache")
-        rows = self.cursor.fetchall()
-        # If using pickle, deserialize each value
-        if self.use_pickle:
-            return [(key, pickle.loads(value)) for key, value in rows]  # noqa: S301
-        return rows
+        """Retrieve all not expired keys and values from the cache."""
+        with self.lock:
+            self.cursor.execute("SELECT key, value FROM cache WHERE expiry >= ?", (self._now(),))
+            rows = self.cursor.fetchall()
+        return [(key, self._loads(value)) for key, value in rows]
 
     def close(self):
         """Close the SQLite database connection."""
         self.conn.close()
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with TTL. Values are kept as is, without serialization.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        """
+        :param max_size: Maximum number of entries, the least recently used ones are evicted first
+        """
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key) -> Optional[tuple[Any, float]]:
+        """Retrieve a cached value with its expiry timestamp, or None if expired or not found."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def get(self, key):
+        """Retrieve a cached value, or None if expired or not found."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, expires_in: Union[datetime, int, None] = None):
+        """Store a value in the cache with an optional TTL."""
+        with self._lock:
+            self._data[key] = (value, get_expiry_time(expires_in))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Retrieve several cached values at once, expired and missing keys are omitted."""
+        values = {}
+        for key in keys:
+            entry = self.get_entry(key)
+            if entry is not None:
+                values[key] = entry[0]
+        return values
+
+    def set_many(self, items: dict[str, Any], expires_in: Union[datetime, int, None] = None):
+        """Store several values with the same TTL."""
+        for key, value in items.items():
+            self.set(key, value, expires_in=expires_in)
+
+    def add(self, key, value, expires_in: Union[datetime, int, None] = None) -> bool:
+        """Store a value only if the key is missing or expired, returns whether it was stored."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] >= time.time():
+                return False
+            self._data[key] = (value, get_expiry_time(expires_in))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return True
+
+    def purge_expired(self) -> int:
+        """
+        Remove expired entries.
+
+        :return: Number of removed entries
+        """
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expiry_time) in self._data.items() if expiry_time < now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def remove(self, key):
+        """Remove a key-value pair from the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Clear the entire cache."""
+        with self._lock:
+            self._data.clear()
+
+    def exists(self, key):
+        """Check if a key exists in the cache (even if expired)."""
+        return key in self._data
+
+    def get_all(self):
+        """Retrieve all keys and values from the cache."""
+        now = time.time()
+        with self._lock:
+            return [(key, value) for key, (value, expiry_time) in self._data.items() if expiry_time >= now]
+
+
+class TieredCache:
+    """
+    MemoryCache in front of a persistent cache.
+
+    Values read from the persistent cache are kept in memory for at most `memory_ttl` seconds,
+    so changes made by other processes are picked up after that time.
+    """
+
+    def __init__(self, persistent: CacheBackend, memory: Optional[MemoryCache] = None, memory_ttl: int = 60):
+        """
+        :param persistent: Cache which is shared between processes, e.g. SQLiteCache() or RedisCache(...)
+        :param memory: In-process cache, MemoryCache() by default
+        :param memory_ttl: How many seconds to trust in-memory copy of a persistent value
+        """
+        self.persistent = persistent
+        self.memory = memory if memory is not None else MemoryCache()
+        self.memory_ttl = memory_ttl
+
+    def _memory_expiry_time(self, expiry_time: float) -> int:
+        return round(min(expiry_time, time.time() + self.memory_ttl))
+
+    def get(self, key, bypass_memory: bool = False):
+        """
+        Retrieve a cached value, or None if expired or not found.
+
+        :param bypass_memory: Read the value from the persistent cache even if there is an in-memory copy,
+            e.g. to see a change which another process has just made
+        """
+        if not bypass_memory:
+            entry = self.memory.get_entry(key)
+            if entry is not None:
+                return entry[0]
+        entry = self.persistent.get_entry(key)
+        if entry is None:
+            self.memory.remove(key)
+            return None
+        value, expiry_time = entry
+        self.memory.set(key, value, expires_in=self._memory_expiry_time(expiry_time))
+        return value
+
+    def set(self, key, value, expires_in: Union[datetime, int, None] = None):
+        """Store a value in both caches with an optional TTL."""
+        self.persistent.set(key, value, expires_in=expires_in)
+        self.memory.set(key, value, expires_in=self._memory_expiry_time(get_expiry_time(expires_in)))
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Retrieve several cached values at once, values missing in memory are read in one query."""
+        keys = list(keys)
+        values = self.memory.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            get_entries = getattr(self.persistent, "get_entries", None)
+            if get_entries is not None:
+                entries = get_entries(missing)
+            else:
+                entries = {key: entry for key in missing if (entry := self.persistent.get_entry(key)) is not None}
+            for key, (value, expiry_time) in entries.items():
+                self.memory.set(key, value, expires_in=self._memory_expiry_time(expiry_time))
+                values[key] = value
+        return values
+
+    def set_many(self, items: dict[str, Any], expires_in: Union[datetime, int, None] = None):
+        """Store several values with the same TTL in both caches."""
+        self.persistent.set_many(items, expires_in=expires_in)
+        self.memory.set_many(items, expires_in=self._memory_expiry_time(get_expiry_time(expires_in)))
+
+    def add(self, key, value, expires_in: Union[datetime, int, None] = None) -> bool:
+        """
+        Store a value only if the key is missing or expired in the persistent cache, returns whether it was stored.
+        """
+        add = getattr(self.persistent, "add", None)
+        if add is None:
+            raise SilpoException(f"{type(self.persistent).__name__} doesn't support atomic add")
+        if not add(key, value, expires_in=expires_in):
+            return False
+        self.memory.set(key, value, expires_in=self._memory_expiry_time(get_expiry_time(expires_in)))
+        return True
+
+    def purge_expired(self) -> int:
+        """Remove expired entries from both caches, returns number of entries removed from the persistent one."""
+        self.memory.purge_expired()
+        purge_expired = getattr(self.persistent, "purge_expired", None)
+        return purge_expired() if purge_expired is not None else 0
+
+    def remove(self, key):
+        """Remove a key-value pair from both caches."""
+        self.memory.remove(key)
+        self.persistent.remove(key)
+
+    def clear(self):
+        """Clear both caches."""
+        self.memory.clear()
+        self.persistent.clear()
+
+    def exists(self, key):
+        """Check if a key exists and is not expired."""
+        return self.get_entry(key) is not None
+
+    def get_entry(self, key) -> Optional[tuple[Any, float]]:
+        """Retrieve a cached value with its expiry timestamp, or None if expired or not found."""
+        if self.get(key) is None:
+            return None
+        return self.memory.get_entry(key)
+
+
+class FileSystemCache:
+    """
+    Cache which keeps every entry in its own file, files are sharded into subdirectories by key hash.
+
+    It works on any shared filesystem without file locking, writes are atomic renames,
+    so it's safe for several processes.
+    """
+
+    def __init__(self, directory: Union[str, Path, None] = None, shard_length: int = 2):
+        """
+        :param directory: Where to keep the files, `~/.pysilpo/cache` by default
+        :param shard_length: How many leading hex digits of the key hash name a subdirectory, 2 gives 256 shards
+        """
+        self.directory = Path(directory) if directory is not None else Path.home() / ".pysilpo" / "cache"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shard_length = shard_length
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest[: self.shard_length] / digest
+
+    def get_entry(self, key) -> Optional[tuple[Any, float]]:
+        """Retrieve a cached value with its expiry timestamp, or None if expired or not found."""
+        path = self._path(key)
+        try:
+            with path.open("rb") as file:
+                stored_key, value, expiry_time = pickle.load(file)  # noqa: S301
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key:
+            return None  # Hash collision
+        if expiry_time < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return value, expiry_time
+
+    def get(self, key):
+        """Retrieve a cached value, or None if expired or not found."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Retrieve several cached values at once, expired and missing keys are omitted."""
+        return {key: entry[0] for key in keys if (entry := self.get_entry(key)) is not None}
+
+    def set(self, key, value, expires_in: Union[datetime, int, None] = None):
+        """Store a value in the cache with an optional TTL."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first, so readers never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump((key, value, get_expiry_time(expires_in)), file)
+            Path(tmp_path).replace(path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def set_many(self, items: dict[str, Any], expires_in: Union[datetime, int, None] = None):
+        """Store several values with the same TTL."""
+        for key, value in items.items():
+            self.set(key, value, expires_in=expires_in)
+
+    def add(self, key, value, expires_in: Union[datetime, int, None] = None) -> bool:
+        """
+        Store a value only if the key is missing or expired, returns whether it was stored.
+
+        The entry is hard linked to its path, which fails when the file exists, so only one process adds it.
+        """
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump((key, value, get_expiry_time(expires_in)), file)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, path)
+                    return True
+                except FileExistsError:
+                    # get_entry removes the expired file, so the second attempt can succeed
+                    if self.get_entry(key) is not None:
+                        return False
+            return False
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+
+    def remove(self, key):
+        """Remove a key-value pair from the cache."""
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self):
+        """Clear the entire cache."""
+        for shard in self.directory.iterdir():
+            if shard.is_dir():
+                shutil.rmtree(shard, ignore_errors=True)
+
+    def purge_expired(self) -> int:
+        """
+        Remove expired entries.
+
+        :return: Number of removed entries
+        """
+        removed = 0
+        now = time.time()
+        for path in self.directory.glob("*/*"):
+            try:
+                with path.open("rb") as file:
+                    _, _, expiry_time = pickle.load(file)  # noqa: S301
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                continue
+            if expiry_time < now:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+class RedisCache:
+    """
+    Cache stored in Redis or any server speaking Redis protocol (KeyDB, Dragonfly, Valkey...),
+    so horizontally scaled workers share tokens and responses.
+
+    It accepts a redis-py compatible client, e.g. RedisCache(redis.Redis(host="localhost")).
+    Entries expire on the server side as well, so Redis doesn't keep them forever.
+    """
+
+    def __init__(self, client, prefix: str = "pysilpo:"):
+        """
+        :param client: redis-py compatible client, it should return bytes (default `decode_responses=False`)
+        :param prefix: Prefix of all keys, so the cache can share a database with other data
+        """
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "pysilpo:") -> "RedisCache":
+        """
+        Create the cache with redis-py client, e.g. RedisCache.from_url("redis://localhost:6379/0")
+        """
+        if redis is None:
+            raise SilpoException("RedisCache.from_url requires redis, install it with `pip install pysilpo[redis]`")
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    def _set_kwargs(self, expiry_time: int) -> dict:
+        return {"exat": expiry_time} if expiry_time != MAX_TS else {}
+
+    def get_entry(self, key) -> Optional[tuple[Any, float]]:
+        """Retrieve a cached value with its expiry timestamp, or None if expired or not found."""
+        data = self.client.get(self.prefix + key)
+        if data is None:
+            return None
+        value, expiry_time = pickle.loads(data)  # noqa: S301
+        if expiry_time < time.time():
+            return None
+        return value, expiry_time
+
+    def get(self, key):
+        """Retrieve a cached value, or None if expired or not found."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Retrieve several cached values in one round trip, expired and missing keys are omitted."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        values = {}
+        for key, data in zip(keys, self.client.mget([self.prefix + key for key in keys])):
+            if data is None:
+                continue
+            value, expiry_time = pickle.loads(data)  # noqa: S301
+            if expiry_time >= now:
+                values[key] = value
+        return values
+
+    def set(self, key, value, expires_in: Union[datetime, int, None] = None):
+        """Store a value in the cache with an optional TTL."""
+        expiry_time = get_expiry_time(expires_in)
+        self.client.set(self.prefix + key, pickle.dumps((value, expiry_time)), **self._set_kwargs(expiry_time))
+
+    def set_many(self, items: dict[str, Any], expires_in: Union[datetime, int, None] = None):
+        """Store several values with the same TTL in one round trip."""
+        expiry_time = get_expiry_time(expires_in)
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(self.prefix + key, pickle.dumps((value, expiry_time)), **self._set_kwargs(expiry_time))
+        pipeline.execute()
+
+    def add(self, key, value, expires_in: Union[datetime, int, None] = None) -> bool:
+        """Store a value only if the key is missing or expired, returns whether it was stored."""
+        expiry_time = get_expiry_time(expires_in)
+        data = pickle.dumps((value, expiry_time))
+        return bool(self.client.set(self.prefix + key, data, nx=True, **self._set_kwargs(expiry_time)))
+
+    def remove(self, key):
+        """Remove a key-value pair from the cache."""
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        """Remove all keys with the cache prefix."""
+        keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class CacheLock:
+    """
+    Lock shared by all processes which use the same cache backend, e.g. SQLiteCache or RedisCache.
+
+    It's a lease: the lock expires after `ttl` seconds, so a crashed owner doesn't hold it forever.
+    Backends without atomic `add` can't be locked, the lock is always acquired then.
+    """
+
+    def __init__(self, cache: CacheBackend, key: str, ttl: int = 30):
+        """
+        :param cache: Cache backend shared by the processes
+        :param key: Name of the lock
+        :param ttl: How many seconds the lock is held at most
+        """
+        self.cache = cache
+        self.key = f"lock_{key}"
+        self.ttl = ttl
+        self._owner = os.urandom(16).hex()
+
+    def acquire(self) -> bool:
+        """
+        Take the lock without waiting.
+
+        :return: Whether the lock was taken
+        """
+        add = getattr(self.cache, "add", None)
+        if add is None:
+            return True
+        try:
+            return add(self.key, self._owner, expires_in=round(time.time()) + self.ttl)
+        except SilpoException:
+            return True  # TieredCache over a backend without atomic add
+
+    def release(self):
+        """Release the lock if it's still held by this owner."""
+        if self.cache.get(self.key) == self._owner:
+            self.cache.remove(self.key)
+
+
+_shared_cache: Optional[TieredCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    """
+    Return process-wide cache: MemoryCache in front of SQLiteCache.
+    It's created once, so hot lookups don't open SQLite connections.
+    """
+    global _shared_cache  # noqa: PLW0603
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = TieredCache(SQLiteCache())
+    return _shared_cache
@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Union
+
+from pysilpo.utils.exceptions import SilpoException
+
+
+class CrawlCheckpoint:
+    """
+    Progress of `Product.crawl(...)` kept in a JSON file: offset per category and finished categories.
+    IDs of already returned products are appended to a `<path>.seen` log next to it, so a save writes only
+    the new IDs of the page. A restarted crawl continues where it stopped.
+    """
+
+    def __init__(self, path: Union[str, Path], branch_id: str):
+        """
+        :param path: Checkpoint file, it's created on the first save
+        :param branch_id: Crawled branch, checkpoint of another branch can't be resumed
+        """
+        self.path = Path(path)
+        self.seen_path = self.path.with_name(f"{self.path.name}.seen")
+        self.branch_id = branch_id
+        self.offsets: dict[str, int] = {}
+        self.done: set[str] = set()
+        self.seen: set[int] = set()
+
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data["branch_id"] != branch_id:
+                raise SilpoException(f"Checkpoint {self.path} belongs to branch {data['branch_id']}, not {branch_id}")
+            self.offsets = data["offsets"]
+            self.done = set(data["done"])
+            self.seen = self._read_seen()
+        else:
+            # IDs left from a crawl which never saved its checkpoint
+            self.seen_path.unlink(missing_ok=True)
+
+    def _read_seen(self) -> set[int]:
+        if not self.seen_path.exists():
+            return set()
+        lines = self.seen_path.read_text().split("\n")
+        # The last line is either empty or cut off by a crash during the write
+        return {int(line) for line in lines[:-1]}
+
+    def _append_seen(self, product_ids: list[int]):
+        if product_ids:
+            with self.seen_path.open("a") as file:
+                file.write("".join(f"{product_id}\n" for product_id in product_ids))
+
+    def advance(self, category_slug: str, offset: int, product_ids: Iterable[int]):
+        """Remember that the category is crawled up to the offset and the products are returned."""
+        product_ids = list(product_ids)
+        self.seen.update(product_ids)
+        # IDs are written before the offset, so after a crash between the writes the page is requested again,
+        # but its products aren't returned twice
+        self._append_seen(product_ids)
+        self.offsets[category_slug] = offset
+        self.save()
+
+    def finish(self, category_slug: str):
+        """Mark the category as crawled."""
+        self.offsets.pop(category_slug, None)
+        self.done.add(category_slug)
+        self.save()
+
+    def save(self):
+        data = {
+            "branch_id": self.branch_id,
+            "offsets": self.offsets,
+            "done": sorted(self.done),
+        }
+        # Write to a temporary file first, so a crash during the write doesn't corrupt the checkpoint
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}-")
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+        Path(tmp_path).replace(self.path)
+
+    def remove(self):
+        """Remove the checkpoint files, e.g. when the crawl is complete."""
+        self.path.unlink(missing_ok=True)
+        self.seen_path.unlink(missing_ok=True)
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+from collections.abc import Iterable
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+
+class SQLiteChequeStore:
+    """
+    Local storage of cheque headers and details, used by `Cheque.sync(...)`.
+
+    Headers and details are stored as JSON with Silpo API field names, so they can be loaded back into models.
+    Besides the cheques it keeps the high-water mark per phone number: the latest `created` and `cheque_id` seen.
+    """
+
+    def __init__(self, db_name: str = "cheques.db", directory: Union[str, Path, None] = None):
+        """
+        :param db_name: SQLite database file name
+        :param directory: Where to keep the database, `~/.pysilpo` by default (next to the cache)
+        """
+        user_data_dir = Path(directory) if directory is not None else Path.home() / ".pysilpo"
+        user_data_dir.mkdir(parents=True, exist_ok=True)
+        self.db_name = user_data_dir / db_name
+
+        self.conn = sqlite3.connect(str(self.db_name))
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS cheques (
+                    phone_number TEXT NOT NULL,
+                    cheque_id INTEGER NOT NULL,
+                    created TEXT NOT NULL,
+                    header TEXT NOT NULL,
+                    detail TEXT,  -- NULL until the detail is fetched
+                    PRIMARY KEY (phone_number, cheque_id))"""
+            )
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS sync_state (
+                    phone_number TEXT PRIMARY KEY,
+                    created TEXT NOT NULL,
+                    cheque_id INTEGER NOT NULL)"""
+            )
+
+    def __del__(self):
+        """Automatically close the SQLite connection when the object is deleted."""
+        conn = getattr(self, "conn", None)
+        if conn:
+            conn.close()
+
+    def get_high_water_mark(self, phone_number: str) -> Optional[tuple[datetime, int]]:
+        """Latest (created, cheque_id) stored for the phone number, or None if nothing was synced yet."""
+        row = self.conn.execute(
+            "SELECT created, cheque_id FROM sync_state WHERE phone_number = ?", (phone_number,)
+        ).fetchone()
+        if row is None:
+            return None
+        return datetime.fromisoformat(row[0]), row[1]
+
+    def set_high_water_mark(self, phone_number: str, created: datetime, cheque_id: int):
+        """Move the high-water mark forward, older marks never replace newer ones."""
+        mark = self.get_high_water_mark(phone_number)
+        if mark is not None and mark >= (created, cheque_id):
+            return
+        with self.conn:
+            self.conn.execute(
+                "REPLACE INTO sync_state (phone_number, created, cheque_id) VALUES (?, ?, ?)",
+                (phone_number, created.isoformat(), cheque_id),
+            )
+
+    def existing_ids(self, phone_number: str, cheque_ids: Iterable[int]) -> set[int]:
+        """Which of the given cheques are already stored."""
+        cheque_ids = list(cheque_ids)
+        existing = set()
+        # Keep the number of SQL variables under SQLite limit
+        for i in range(0, len(cheque_ids), 500):
+            chunk = cheque_ids[i : i + 500]
+            rows = self.conn.execute(
+                f"SELECT cheque_id FROM cheques WHERE phone_number = ? AND cheque_id IN ({','.join('?' * len(chunk))})",  # noqa: S608
+                (phone_number, *chunk),
+            )
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def save_headers(self, phone_number: str, headers: Iterable[dict]):
+        """Store cheque headers, already stored headers (and their details) are kept as is."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO cheques (phone_number, cheque_id, created, header) VALUES (?, ?, ?, ?)",
+                [(phone_number, header["chequeId"], header["created"], json.dumps(header)) for header in headers],
+            )
+
+    def save_details(self, phone_number: str, details: dict[int, dict]):
+        """Store details by cheque ID, headers of these cheques must be stored first."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE cheques SET detail = ? WHERE phone_number = ? AND cheque_id = ?",
+                [(json.dumps(detail), phone_number, cheque_id) for cheque_id, detail in details.items()],
+            )
+
+    def missing_details(self, phone_number: str) -> list[dict]:
+        """Headers of stored cheques without details, from the latest to the oldest one."""
+        rows = self.conn.execute(
+            "SELECT header FROM cheques WHERE phone_number = ? AND detail IS NULL "
+            "ORDER BY created DESC, cheque_id DESC",
+            (phone_number,),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def get_cheques(self, phone_number: str) -> list[tuple[dict, Optional[dict]]]:
+        """All stored (header, detail) pairs of the phone number, from the latest to the oldest one."""
+        rows = self.conn.execute(
+            "SELECT header, detail FROM cheques WHERE phone_number = ? ORDER BY created DESC, cheque_id DESC",
+            (phone_number,),
+        )
+        return [(json.loads(header), json.loads(detail) if detail is not None else None) for header, detail in rows]
+
+    def close(self):
+        """Close the SQLite database connection."""
+        self.conn.close()
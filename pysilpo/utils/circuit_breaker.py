@@ -0,0 +1,105 @@
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from urllib.parse import urlsplit
+
+from pysilpo.utils.utils import get_logger
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class _Circuit:
+    state: CircuitState = CircuitState.CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    probes: int = 0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per host.
+
+    After `failure_threshold` failures in a row the circuit of the host opens and requests fail fast
+    without waiting for the degraded host. After `recovery_timeout` the circuit is half-open:
+    a few probe requests are let through, a successful probe closes the circuit, a failed one opens it again.
+    """
+
+    logger = get_logger("pysilpo.circuit_breaker.CircuitBreaker")
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_requests: int = 1):
+        """
+        :param failure_threshold: How many failures in a row open the circuit
+        :param recovery_timeout: How many seconds the circuit stays open before probe requests are allowed
+        :param half_open_requests: How many probe requests can run at once while the circuit is half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_requests = half_open_requests
+        self._circuits: dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, url: str) -> _Circuit:
+        return self._circuits.setdefault(urlsplit(url).netloc, _Circuit())
+
+    def state(self, url: str) -> CircuitState:
+        """State of the circuit of the host of the URL."""
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.state is CircuitState.OPEN and time.monotonic() - circuit.opened_at >= self.recovery_timeout:
+                return CircuitState.HALF_OPEN
+            return circuit.state
+
+    def allow(self, url: str) -> bool:
+        """
+        Whether a request to the host of the URL can be sent, every allowed request must be followed
+        by `record_success()`, `record_failure()` or, if it was cancelled, `release()`.
+        """
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.state is CircuitState.CLOSED:
+                return True
+            if circuit.state is CircuitState.OPEN:
+                if time.monotonic() - circuit.opened_at < self.recovery_timeout:
+                    return False
+                circuit.state = CircuitState.HALF_OPEN
+                circuit.probes = 0
+            if circuit.probes >= self.half_open_requests:
+                return False
+            circuit.probes += 1
+            return True
+
+    def release(self, url: str):
+        """Free the probe slot of an allowed request which has finished without an outcome, e.g. was cancelled."""
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.state is CircuitState.HALF_OPEN and circuit.probes > 0:
+                circuit.probes -= 1
+
+    def record_success(self, url: str):
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.state is not CircuitState.CLOSED:
+                self.logger.info("[record_success] %s recovered, closing the circuit", urlsplit(url).netloc)
+            circuit.state = CircuitState.CLOSED
+            circuit.failures = 0
+            circuit.probes = 0
+
+    def record_failure(self, url: str):
+        with self._lock:
+            circuit = self._circuit(url)
+            circuit.failures += 1
+            if circuit.state is CircuitState.HALF_OPEN or (
+                circuit.state is CircuitState.CLOSED and circuit.failures >= self.failure_threshold
+            ):
+                self.logger.warning(
+                    "[record_failure] %s failed %s times, opening the circuit", urlsplit(url).netloc, circuit.failures
+                )
+                circuit.state = CircuitState.OPEN
+                circuit.opened_at = time.monotonic()
+                circuit.probes = 0
@@ -1,47 +1,266 @@
+import asyncio
 import math
-from typing import Generic, Protocol, TypeVar, Union
+from collections import OrderedDict
+from collections.abc import Awaitable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Generic, Optional, Protocol, TypeVar, Union
+
+from pysilpo.utils import export
+from pysilpo.utils.page_size import AdaptivePageSize
 
 T = TypeVar("T")
 
+# How many pages of a slice are fetched concurrently when the cursor has no `max_workers`
+_SLICE_WORKERS = 4
+
 
 class Empty:
     pass
 
 
 class Generator(Protocol):
-    def __call__(self, _offset: int) -> tuple[list[T], int]:
-        ...
+    def __call__(self, _offset: int) -> tuple[list[T], int]: ...
+
+
+class _ResidentPages:
+    """
+    Fetched pages kept by a cursor. With `max_pages` the least recently used pages are evicted,
+    in streaming mode pages are dropped as soon as iteration moves past them.
+    Evicted pages are fetched again when they are accessed.
+    """
+
+    page_size: int
+    page_sizer: Optional[AdaptivePageSize]
+    _pending: dict
+    total_count: Optional[int]
+    rounded_count: Optional[int]
+    fetched_count: int
+    max_pages: Optional[int]
+    streaming: bool
+
+    def _init_pages(self, max_pages: Optional[int], streaming: bool):
+        self.pages: OrderedDict[int, list] = OrderedDict()
+        self.max_pages = max_pages
+        self.streaming = streaming
+        # Lengths of every page ever fetched, so refetching an evicted page doesn't change fetched_count
+        self._page_lengths: dict[int, int] = {}
+
+    def _resident_page(self, page_index: int) -> list:
+        page_content = self.pages[page_index]
+        self.pages.move_to_end(page_index)
+        return page_content
+
+    def _store_page(self, page_index: int, page_content: list):
+        if page_index not in self._page_lengths:
+            self.fetched_count += len(page_content)
+            self._page_lengths[page_index] = len(page_content)
+        self.pages[page_index] = page_content
+        self.pages.move_to_end(page_index)
+        while self.max_pages and len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+    def _consumed(self, index: int):
+        """Iteration returned the item, drop its page in streaming mode when it was the last item of the page."""
+        if self.streaming and (index + 1) % self.page_size == 0:
+            self.pages.pop(index // self.page_size, None)
+
+    def _iteration_finished(self):
+        if self.streaming:
+            # The last page can be shorter than page_size, so it's not dropped by _consumed
+            self.pages.clear()
+
+    def _adaptive_max_limit(self, page_index: int) -> int:
+        """
+        Largest size of an adaptive request from the page: up to the next fetched page or the last page.
+        """
+        pages = 1
+        while (
+            pages * self.page_size < self.page_sizer.max_limit
+            and (self.total_count is None or (page_index + pages) * self.page_size < self.total_count)
+            and page_index + pages not in self.pages
+            and page_index + pages not in self._pending
+        ):
+            pages += 1
+        return pages * self.page_size
+
+    def _store_pages(self, page_index: int, content: list) -> list:
+        """
+        Split content of an adaptive request into pages of `page_size`.
+
+        :return: The first page
+        """
+        for start in range(0, len(content), self.page_size):
+            self._store_page(page_index + start // self.page_size, content[start : start + self.page_size])
+        return content[: self.page_size]
+
+    def _set_total_count(self, total_count: int):
+        self.total_count = total_count
+        # We need rounded count to know how many items we have in total, because we can't rely on total_count
+        self.rounded_count = math.ceil(total_count / self.page_size) * self.page_size
+
+    def _known_count(self) -> int:
+        """
+        Some API endpoints might return more items than they return in `total`
+        :return: Total count of fetched items if it's more than `total` or `total` otherwise
+        """
+        return self.fetched_count if self.fetched_count >= self.total_count else self.total_count
+
+    def _first_slice_page(self, index: slice) -> Optional[int]:
+        """
+        First page of the slice when the slice can be resolved without total count, e.g. [10:20],
+        None when total count is needed anyway, e.g. [-10:] or [10:], or it's already known.
+        """
+        if self.total_count is not None:
+            return None
+        start, stop, step = index.start, index.stop, index.step or 1
+        if step > 0 and (start is None or start >= 0) and stop is not None and (start or 0) < stop:
+            return (start or 0) // self.page_size
+        if step < 0 and start is not None and start >= 0 and (stop is None or 0 <= stop < start):
+            return start // self.page_size
+        return None
+
+    def _slice_pages(self, index: slice, count: int) -> tuple[range, list[int]]:
+        """
+        :return: (item indexes of the slice, indexes of the pages they are on)
+        """
+        indices = range(*index.indices(count))
+        if not indices:
+            return indices, []
+        if abs(indices.step) == 1:
+            page_indices = range(min(indices) // self.page_size, max(indices) // self.page_size + 1)
+        else:
+            page_indices = sorted({i // self.page_size for i in indices})
+        return indices, list(page_indices)
+
+    def _slice_items(self, indices: Iterable[int], pages: dict[int, list]) -> list:
+        items = []
+        for i in indices:
+            page_content = pages.get(i // self.page_size)
+            if page_content is not None and i % self.page_size < len(page_content):
+                items.append(page_content[i % self.page_size])
+        return items
 
 
-class Cursor(Generic[T]):
-    def __init__(self, generator: Generator, page_size: int):
+class Cursor(_ResidentPages, Generic[T]):
+    def __init__(
+        self,
+        generator: Generator,
+        page_size: int,
+        prefetch: int = 0,
+        max_workers: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        streaming: bool = False,
+        counter: Optional[Callable[[], int]] = None,
+        page_sizer: Optional[AdaptivePageSize] = None,
+    ):
+        """
+        :param generator: Callable which returns page content and total count for the given offset
+        :param page_size: How many items the generator returns per page
+        :param prefetch: How many pages ahead to fetch in background threads, 0 disables prefetching
+        :param max_workers: How many pages to fetch concurrently, defaults to `prefetch`
+        :param max_pages: How many fetched pages to keep, least recently used pages are evicted, unlimited by default
+        :param streaming: Drop pages once iteration moves past them, for forward-only iteration
+        :param counter: Callable which returns total count cheaper than a page, e.g. with limit=1, see count()
+        :param page_sizer: Request several pages at once when the endpoint is fast, the generator has to accept
+            `_limit` then. Pages keep `page_size`, prefetched pages are still requested one by one
+        """
         self.generator = generator
+        self.counter = counter
+        self.page_sizer = page_sizer
         self.total_count = None
         self.rounded_count = None
         self.fetched_count = 0
-        self.pages = {}
+        self._init_pages(max_pages, streaming)
         self.page_size = page_size
         self.curr = 0
 
+        self.prefetch = prefetch
+        self.max_workers = max_workers or prefetch
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: dict[int, Future] = {}
+
+    def _prefetch_pages(self, page_index: int):
+        """
+        Schedule fetching of the next `prefetch` pages after `page_index`, which are not fetched yet.
+        Pages are stored only when they are requested, so items are still returned in order.
+        """
+        if not self.prefetch or self.total_count is None:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pysilpo-cursor")
+        for next_page_index in range(page_index + 1, page_index + self.prefetch + 1):
+            offset = next_page_index * self.page_size
+            if offset >= self.total_count:
+                break
+            if next_page_index in self.pages or next_page_index in self._pending:
+                continue
+            self._pending[next_page_index] = self._executor.submit(self.generator, _offset=offset)
+
+    def close(self):
+        """Cancel pending prefetches and stop background threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+
     def fetch_new_page(self, index: int) -> list[T]:
         page_index = math.floor(index // self.page_size)
         if self.rounded_count is not None and index > self.rounded_count:
             raise IndexError
-        page_content, total_count = self.generator(_offset=page_index * self.page_size)
-        self.total_count = total_count
-
-        # We need rounded count to know how many items we have in total, because we can't rely on total_count
-        self.rounded_count = math.ceil(total_count / self.page_size) * self.page_size
+        offset = page_index * self.page_size
+        future = self._pending.pop(page_index, None)
+        if future is not None:
+            page_content, total_count = future.result()
+        elif self.page_sizer is not None:
+            (page_content, total_count), _ = self.page_sizer.call(
+                lambda limit: self.generator(_offset=offset, _limit=limit), self._adaptive_max_limit(page_index)
+            )
+        else:
+            page_content, total_count = self.generator(_offset=offset)
+        self._set_total_count(total_count)
         if not page_content:
             raise IndexError
-        if page_index not in self.pages:
-            self.fetched_count += len(page_content)
-        self.pages[page_index] = page_content
-        return self.pages[page_index]
+        page_content = self._store_pages(page_index, page_content)
+        self._prefetch_pages(page_index)
+        return page_content
+
+    def fetch_pages(self, page_indices: list[int]) -> dict[int, list[T]]:
+        """
+        Get the pages, the ones which aren't resident are fetched concurrently.
+
+        :return: Content by page index, pages after the last one are left out
+        """
+        pages = {}
+        futures: dict[int, Optional[Future]] = {}
+        for page_index in page_indices:
+            if page_index in self.pages:
+                pages[page_index] = self._resident_page(page_index)
+            else:
+                futures[page_index] = self._pending.pop(page_index, None)
+        missing = [page_index for page_index, future in futures.items() if future is None]
+        if len(missing) > 1:
+            workers = min(len(missing), self.max_workers or _SLICE_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pysilpo-cursor") as executor:
+                for page_index in missing:
+                    futures[page_index] = executor.submit(self.generator, _offset=page_index * self.page_size)
+                results = {page_index: future.result() for page_index, future in futures.items()}
+        else:
+            results = {}
+            for page_index, future in futures.items():
+                offset = page_index * self.page_size
+                results[page_index] = future.result() if future is not None else self.generator(_offset=offset)
+        for page_index, (page_content, total_count) in results.items():
+            self._set_total_count(total_count)
+            if page_content:
+                self._store_page(page_index, page_content)
+                pages[page_index] = page_content
+        return pages
 
     def get_page(self, index: int) -> list[T]:
         try:
-            return self.pages[math.floor(index // self.page_size)]
+            return self._resident_page(math.floor(index // self.page_size))
         except KeyError:
             return self.fetch_new_page(index)
 
@@ -54,15 +273,26 @@ class Cursor(Generic[T]):
     def first(self) -> T:
         return self[0]
 
+    def count(self) -> int:
+        """
+        Total count of items. It's requested with `counter` when the cursor has one, so no page is fetched,
+        otherwise the first page is fetched like len(cursor) does.
+        :return: Total count of fetched items if it's more than `total` or `total` otherwise
+        """
+        if self.total_count is None and self.counter is not None:
+            self._set_total_count(self.counter())
+        return len(self)
+
     def __getitem__(self, index: Union[int, slice]) -> Union[list[T], T]:
         if isinstance(index, slice):
-            return [
-                self.get(i)
-                for i in range(index.start or 0, index.stop or len(self), index.step or 1)
-                if self.get(i) is not Empty
-            ]
+            first_page_index = self._first_slice_page(index)
+            if first_page_index is not None:
+                # Total count comes with the first page of the slice, so it costs no extra request
+                self.fetch_pages([first_page_index])
+            indices, page_indices = self._slice_pages(index, self.count())
+            return self._slice_items(indices, self.fetch_pages(page_indices))
         if index < 0:
-            index = len(self) + index
+            index = self.count() + index
         val = self.get(index)
         if val is Empty:
             raise IndexError
@@ -76,7 +306,10 @@ class Cursor(Generic[T]):
             val = self[self.curr]
         except IndexError:
             self.curr = 0
+            self.close()
+            self._iteration_finished()
             raise StopIteration from None
+        self._consumed(self.curr)
         self.curr += 1
         return val
 
@@ -86,12 +319,237 @@ class Cursor(Generic[T]):
         :return: Total count of fetched items if it's more than `total` or `total` otherwise
         """
         if self.total_count is None:
+            # Not count(), list(cursor) calls len(cursor) and needs the first page anyway
             try:
                 self.fetch_new_page(0)
             except IndexError:
                 self.total_count = 0
                 return 0
-        return self.fetched_count if self.fetched_count >= self.total_count else self.total_count
+        return self._known_count()
 
     def __repr__(self):
         return f"<Cursor len={len(self)}> at {hex(id(self))}"
+
+    def iter_pages(self) -> Iterator[list[T]]:
+        """
+        Yield pages one by one. Pages which aren't fetched yet are not kept in the cursor,
+        so only one page is in memory at a time.
+        """
+        page_index = 0
+        while True:
+            page_content = self.pages.get(page_index)
+            if page_content is None:
+                page_content, self.total_count = self.generator(_offset=page_index * self.page_size)
+            if not page_content:
+                return
+            yield page_content
+            page_index += 1
+            if page_index * self.page_size >= self.total_count:
+                return
+
+    def to_csv(self, path: Union[str, Path], rows: export.Rows = "items") -> int:
+        """
+        Write all items to CSV file page by page, see pysilpo.utils.export for the flattening scheme.
+
+        :return: Number of written rows
+        """
+        return export.to_csv(chain.from_iterable(self.iter_pages()), path, rows=rows)
+
+    def to_arrow(self, rows: export.Rows = "items", batch_size: int = 1000) -> "export.pa.Table":
+        """
+        Convert all items to Arrow table page by page, requires pyarrow.
+        """
+        return export.to_arrow(chain.from_iterable(self.iter_pages()), rows=rows, batch_size=batch_size)
+
+    def to_parquet(self, path: Union[str, Path], rows: export.Rows = "items", batch_size: int = 1000) -> int:
+        """
+        Write all items to Parquet file page by page, requires pyarrow.
+
+        :return: Number of written rows
+        """
+        return export.to_parquet(chain.from_iterable(self.iter_pages()), path, rows=rows, batch_size=batch_size)
+
+
+class AsyncGenerator(Protocol):
+    async def __call__(self, _offset: int) -> tuple[list[T], int]: ...
+
+
+class AsyncCursor(_ResidentPages, Generic[T]):
+    """
+    Asyncio version of Cursor, supports `async for` and awaitable indexing, e.g. `await cursor[0]`.
+    """
+
+    def __init__(
+        self,
+        generator: AsyncGenerator,
+        page_size: int,
+        prefetch: int = 0,
+        max_workers: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        streaming: bool = False,
+        counter: Optional[Callable[[], Awaitable[int]]] = None,
+        page_sizer: Optional[AdaptivePageSize] = None,
+    ):
+        """
+        :param generator: Coroutine function which returns page content and total count for the given offset
+        :param page_size: How many items the generator returns per page
+        :param prefetch: How many pages ahead to fetch in background tasks, 0 disables prefetching
+        :param max_workers: How many pages to fetch concurrently, defaults to `prefetch`
+        :param max_pages: How many fetched pages to keep, least recently used pages are evicted, unlimited by default
+        :param streaming: Drop pages once iteration moves past them, for forward-only iteration
+        :param counter: Coroutine function which returns total count cheaper than a page, see count()
+        :param page_sizer: Request several pages at once when the endpoint is fast, see Cursor
+        """
+        self.generator = generator
+        self.counter = counter
+        self.page_sizer = page_sizer
+        self.total_count = None
+        self.rounded_count = None
+        self.fetched_count = 0
+        self._init_pages(max_pages, streaming)
+        self.page_size = page_size
+        self.curr = 0
+
+        self.prefetch = prefetch
+        self.max_workers = max_workers or prefetch
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: dict[int, asyncio.Task] = {}
+
+    async def _bounded_generator(self, offset: int) -> tuple[list[T], int]:
+        async with self._semaphore:
+            return await self.generator(_offset=offset)
+
+    def _prefetch_pages(self, page_index: int):
+        """
+        Schedule fetching of the next `prefetch` pages after `page_index`, which are not fetched yet.
+        """
+        if not self.prefetch or self.total_count is None:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        for next_page_index in range(page_index + 1, page_index + self.prefetch + 1):
+            offset = next_page_index * self.page_size
+            if offset >= self.total_count:
+                break
+            if next_page_index in self.pages or next_page_index in self._pending:
+                continue
+            self._pending[next_page_index] = asyncio.ensure_future(self._bounded_generator(offset))
+
+    def close(self):
+        """Cancel pending prefetches."""
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def fetch_new_page(self, index: int) -> list[T]:
+        page_index = math.floor(index // self.page_size)
+        if self.rounded_count is not None and index > self.rounded_count:
+            raise IndexError
+        offset = page_index * self.page_size
+        task = self._pending.pop(page_index, None)
+        if task is not None:
+            page_content, total_count = await task
+        elif self.page_sizer is not None:
+            (page_content, total_count), _ = await self.page_sizer.async_call(
+                lambda limit: self.generator(_offset=offset, _limit=limit), self._adaptive_max_limit(page_index)
+            )
+        else:
+            page_content, total_count = await self.generator(_offset=offset)
+        self._set_total_count(total_count)
+        if not page_content:
+            raise IndexError
+        page_content = self._store_pages(page_index, page_content)
+        self._prefetch_pages(page_index)
+        return page_content
+
+    async def get_page(self, index: int) -> list[T]:
+        try:
+            return self._resident_page(math.floor(index // self.page_size))
+        except KeyError:
+            return await self.fetch_new_page(index)
+
+    async def get(self, index: int) -> Union[T, Empty]:
+        try:
+            return (await self.get_page(index))[index % self.page_size]
+        except IndexError:
+            return Empty
+
+    async def first(self) -> T:
+        return await self[0]
+
+    async def fetch_pages(self, page_indices: list[int]) -> dict[int, list[T]]:
+        """
+        Get the pages, the ones which aren't resident are fetched concurrently, see Cursor.fetch_pages
+        """
+        pages = {}
+        awaitables = {}
+        semaphore = asyncio.Semaphore(self.max_workers or _SLICE_WORKERS)
+
+        async def fetch(offset: int) -> tuple[list[T], int]:
+            async with semaphore:
+                return await self.generator(_offset=offset)
+
+        for page_index in page_indices:
+            if page_index in self.pages:
+                pages[page_index] = self._resident_page(page_index)
+            else:
+                task = self._pending.pop(page_index, None)
+                awaitables[page_index] = task if task is not None else fetch(page_index * self.page_size)
+        results = await asyncio.gather(*awaitables.values())
+        for page_index, (page_content, total_count) in zip(awaitables, results):
+            self._set_total_count(total_count)
+            if page_content:
+                self._store_page(page_index, page_content)
+                pages[page_index] = page_content
+        return pages
+
+    async def count(self) -> int:
+        """
+        Async replacement of len(cursor), see Cursor.count
+        :return: Total count of fetched items if it's more than `total` or `total` otherwise
+        """
+        if self.total_count is None:
+            if self.counter is not None:
+                self._set_total_count(await self.counter())
+            else:
+                try:
+                    await self.fetch_new_page(0)
+                except IndexError:
+                    self.total_count = 0
+                    return 0
+        return self._known_count()
+
+    async def _getitem(self, index: Union[int, slice]) -> Union[list[T], T]:
+        if isinstance(index, slice):
+            first_page_index = self._first_slice_page(index)
+            if first_page_index is not None:
+                await self.fetch_pages([first_page_index])
+            indices, page_indices = self._slice_pages(index, await self.count())
+            return self._slice_items(indices, await self.fetch_pages(page_indices))
+        if index < 0:
+            index = await self.count() + index
+        val = await self.get(index)
+        if val is Empty:
+            raise IndexError
+        return val
+
+    def __getitem__(self, index: Union[int, slice]) -> Awaitable[Union[list[T], T]]:
+        return self._getitem(index)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> T:
+        try:
+            val = await self[self.curr]
+        except IndexError:
+            self.curr = 0
+            self.close()
+            self._iteration_finished()
+            raise StopAsyncIteration from None
+        self._consumed(self.curr)
+        self.curr += 1
+        return val
+
+    def __repr__(self):
+        return f"<AsyncCursor total_count={self.total_count}> at {hex(id(self))}"
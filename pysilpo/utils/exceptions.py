@@ -16,3 +16,7 @@ class NoOpenIDAuthCodeException(SilpoAuthorizationException):
 
 class SilpoOTPInvalidException(SilpoAuthorizationException):
     pass
+
+
+class SilpoCircuitOpenException(SilpoRequestException):
+    pass
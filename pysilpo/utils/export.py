@@ -0,0 +1,223 @@
+"""
+Columnar export of models (products, stores, cheques...) to CSV, Arrow and Parquet.
+
+Items are read one batch at a time, so a full catalog is never kept as a list of models.
+Columns are derived from the model class, nested values are flattened this way:
+
+- nested models become columns with dotted names, e.g. StoreModel.city -> `city.id`, `city.title`, `city.slug`
+- dict and list fields (`promotions`, `special_prices`, `active_hours`...) become JSON strings
+- enums are stored as their values
+
+Records (see pysilpo.utils.models.Record) are exported the same way as their models.
+
+Cheques can be exported per cheque (`rows="items"`), per position (`rows="positions"`) or per action
+(`rows="actions"`). Position and action rows start with `cheque.cheque_id`, `cheque.created` and `cheque.filial_id`
+columns, their details are fetched when they aren't attached yet, so use `Cheque.all(with_details=True)`.
+"""
+
+import csv
+import json
+import typing
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from enum import Enum
+from itertools import chain, islice
+from pathlib import Path
+from typing import Any, Literal, Optional, Union
+
+from pydantic import BaseModel
+
+from pysilpo.utils.exceptions import SilpoException
+from pysilpo.utils.models import Record, is_model, unwrap_optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+Rows = Literal["items", "positions", "actions"]
+
+# Cheque columns which identify the cheque of position and action rows
+_CHEQUE_KEY_FIELDS = ("cheque_id", "created", "filial_id")
+
+
+def columns(model: type[BaseModel], prefix: str = "") -> list[tuple[str, tuple[str, ...], Any]]:
+    """
+    Flattened columns of the model.
+
+    :return: (column name, attribute path, type annotation) for every column
+    """
+    result = []
+    for name, field in model.model_fields.items():
+        annotation = unwrap_optional(field.annotation)
+        if is_model(annotation):
+            for column, path, column_annotation in columns(annotation, prefix=f"{prefix}{name}."):
+                result.append((column, (name, *path), column_annotation))
+        else:
+            result.append((f"{prefix}{name}", (name,), annotation))
+    return result
+
+
+def _value(item: BaseModel, path: tuple[str, ...]):
+    value = item
+    for name in path:
+        if value is None:
+            return None
+        value = getattr(value, name)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return json.dumps(value.model_dump(mode="json"), ensure_ascii=False)
+    if isinstance(value, Record):
+        return json.dumps(value._asdict(), ensure_ascii=False, default=str)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+class _Layout:
+    """Columns and rows of one export, built from the first item."""
+
+    def __init__(self, first_item: BaseModel, rows: Rows):
+        self.rows = rows
+        if rows == "items":
+            self.model = first_item._model if isinstance(first_item, Record) else type(first_item)
+            self.columns = columns(self.model)
+            return
+        if not hasattr(first_item, "detail"):
+            raise SilpoException(f"rows={rows!r} is supported only for cheques")
+        # Positions and actions are lists of models in ChequeDetailModel
+        annotation = unwrap_optional(type(first_item.detail).model_fields[rows].annotation)
+        self.model = typing.get_args(annotation)[0]
+        cheque_fields = type(first_item).model_fields
+        self.key_columns = [(f"cheque.{name}", (name,), cheque_fields[name].annotation) for name in _CHEQUE_KEY_FIELDS]
+        self.child_columns = columns(self.model)
+        self.columns = self.key_columns + self.child_columns
+
+    @property
+    def names(self) -> list[str]:
+        return [name for name, _, _ in self.columns]
+
+    def records(self, item: BaseModel) -> Iterator[dict]:
+        if self.rows == "items":
+            yield {name: _value(item, path) for name, path, _ in self.columns}
+            return
+        key = {name: _value(item, path) for name, path, _ in self.key_columns}
+        for child in getattr(item.detail, self.rows) or []:
+            yield {**key, **{name: _value(child, path) for name, path, _ in self.child_columns}}
+
+
+def _start(items: Iterable[BaseModel], rows: Rows) -> tuple[Optional[_Layout], Iterator[BaseModel]]:
+    items = iter(items)
+    first_item = next(items, None)
+    if first_item is None:
+        return None, items
+    return _Layout(first_item, rows), chain([first_item], items)
+
+
+def iter_records(items: Iterable[BaseModel], rows: Rows = "items") -> Iterator[dict]:
+    """Flattened records of the items, see the module docstring for the flattening scheme."""
+    layout, items = _start(items, rows)
+    if layout is None:
+        return
+    for item in items:
+        yield from layout.records(item)
+
+
+def _batches(records: Iterator[dict], batch_size: int) -> Iterator[list[dict]]:
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+
+def to_csv(items: Iterable[BaseModel], path: Union[str, Path], rows: Rows = "items") -> int:
+    """
+    Write the items to CSV file.
+
+    :param items: Models, e.g. Cursor or Cheque.all(...) generator
+    :param path: CSV file path
+    :param rows: Row per item, per cheque position or per cheque action
+    :return: Number of written rows
+    """
+    layout, items = _start(items, rows)
+    count = 0
+    with Path(path).open("w", newline="", encoding="utf-8") as file:
+        if layout is None:
+            return 0
+        writer = csv.writer(file)
+        writer.writerow(layout.names)
+        for item in items:
+            for record in layout.records(item):
+                writer.writerow(
+                    value.isoformat() if isinstance(value, datetime) else value for value in record.values()
+                )
+                count += 1
+    return count
+
+
+def _arrow_type(annotation) -> "pa.DataType":
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        annotation = type(next(iter(annotation)).value)
+    if annotation is bool:
+        return pa.bool_()
+    if annotation is int:
+        return pa.int64()
+    if annotation is float:
+        return pa.float64()
+    if annotation is datetime:
+        return pa.timestamp("us")
+    return pa.string()  # str, dicts and lists as JSON
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise SilpoException("Arrow and Parquet export requires pyarrow, install it with `pip install pysilpo[arrow]`")
+
+
+def iter_record_batches(
+    items: Iterable[BaseModel], rows: Rows = "items", batch_size: int = 1000
+) -> Iterator["pa.RecordBatch"]:
+    """
+    Convert the items to Arrow record batches, only one batch is kept in memory.
+
+    :param items: Models, e.g. Cursor or Cheque.all(...) generator
+    :param rows: Row per item, per cheque position or per cheque action
+    :param batch_size: How many rows to put in one record batch
+    """
+    _require_pyarrow()
+    layout, items = _start(items, rows)
+    if layout is None:
+        return
+    schema = pa.schema([(name, _arrow_type(annotation)) for name, _, annotation in layout.columns])
+    records = chain.from_iterable(layout.records(item) for item in items)
+    for batch in _batches(records, batch_size):
+        yield pa.RecordBatch.from_pylist(batch, schema=schema)
+
+
+def to_arrow(items: Iterable[BaseModel], rows: Rows = "items", batch_size: int = 1000) -> "pa.Table":
+    """Convert the items to Arrow table, see iter_record_batches(...)."""
+    _require_pyarrow()
+    batches = list(iter_record_batches(items, rows=rows, batch_size=batch_size))
+    return pa.Table.from_batches(batches) if batches else pa.table({})
+
+
+def to_parquet(items: Iterable[BaseModel], path: Union[str, Path], rows: Rows = "items", batch_size: int = 1000) -> int:
+    """
+    Write the items to Parquet file batch by batch.
+
+    :return: Number of written rows
+    """
+    _require_pyarrow()
+    count = 0
+    writer = None
+    try:
+        for batch in iter_record_batches(items, rows=rows, batch_size=batch_size):
+            if writer is None:
+                writer = pq.ParquetWriter(str(path), batch.schema)
+            writer.write_batch(batch)
+            count += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
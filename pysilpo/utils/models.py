@@ -0,0 +1,236 @@
+import random
+import types
+import typing
+from collections import namedtuple
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, ClassVar, Optional, TypeVar, Union
+
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+# `X | Y` unions exist since Python 3.10
+_UNION_TYPES = (Union, getattr(types, "UnionType", Union))
+_MISSING = object()
+
+
+def unwrap_optional(annotation):
+    if typing.get_origin(annotation) in _UNION_TYPES:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def is_model(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _converter(annotation, build: Callable) -> Optional[Callable[[Any, dict], Any]]:
+    """
+    Converter of a raw JSON value to the field type, None if the value is used as is.
+
+    :param build: How to build nested models, construct(...) or record(...)
+    """
+    annotation = unwrap_optional(annotation)
+    if is_model(annotation):
+        return lambda value, services: build(annotation, value, **services) if isinstance(value, dict) else value
+    if typing.get_origin(annotation) is list:
+        (item_annotation,) = typing.get_args(annotation) or (Any,)
+        item_annotation = unwrap_optional(item_annotation)
+        if is_model(item_annotation):
+            return lambda value, services: (
+                [build(item_annotation, item, **services) for item in value] if value is not None else None
+            )
+        return None
+    if annotation is datetime:
+        return lambda value, _: _parse_datetime(value)
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return lambda value, _: annotation(value) if value is not None else None
+    return None
+
+
+class _Plan:
+    """How to build one model class from a payload, computed once per class."""
+
+    def __init__(self, model: type[BaseModel]):
+        fields = model.model_fields
+        # Payload key of every field, aliases are used by Silpo API
+        self.keys = [(name, field.alias or name) for name, field in fields.items()]
+        self.fields = fields
+        self.converters = self._converters(construct)
+        self.record_converters = self._converters(record)
+        self.private_attributes = model.__private_attributes__
+
+    def _converters(self, build: Callable) -> list[tuple[str, Callable]]:
+        return [
+            (name, converter)
+            for name, field in self.fields.items()
+            if (converter := _converter(field.annotation, build)) is not None
+        ]
+
+
+_plans: dict[type[BaseModel], _Plan] = {}
+
+
+def _plan(model: type[BaseModel]) -> _Plan:
+    plan = _plans.get(model)
+    if plan is None:
+        plan = _plans[model] = _Plan(model)
+    return plan
+
+
+def _values(plan: _Plan, data: dict) -> dict:
+    """Field values of the payload, not converted yet, missing required fields are left out."""
+    values = {name: data.get(key, _MISSING) for name, key in plan.keys}
+    if _MISSING in values.values():
+        for name, value in list(values.items()):
+            if value is not _MISSING:
+                continue
+            # Some payloads use field names instead of aliases, e.g. `filial_id` of stores
+            value = data.get(name, _MISSING)
+            if value is _MISSING:
+                field = plan.fields[name]
+                if field.is_required():
+                    del values[name]
+                    continue
+                value = field.get_default(call_default_factory=True)
+            values[name] = value
+    return values
+
+
+def construct(model: type[M], data: dict, **services) -> M:
+    """
+    Build the model from trusted API payload without validation, like `model_construct`,
+    but aliases, nested models, datetimes and enums are handled as well.
+    Custom `__init__` of the model is not called.
+
+    :param model: Model class
+    :param data: API payload
+    :param services: Service back-references, e.g. store_service=Store, they are set to private attributes
+        of the model and its nested models, e.g. `_store_service`
+    """
+    plan = _plan(model)
+    values = _values(plan, data)
+    for name, converter in plan.converters:
+        if name in values:
+            values[name] = converter(values[name], services)
+
+    # The same attributes as `model_construct` sets, but without its per-call overhead
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    private = None
+    if plan.private_attributes:
+        private = {name: attr.get_default() for name, attr in plan.private_attributes.items()}
+        for service_name, service in services.items():
+            if f"_{service_name}" in private:
+                private[f"_{service_name}"] = service
+    object.__setattr__(instance, "__pydantic_private__", private)
+    return instance
+
+
+class Record:
+    """
+    Compact read-only copy of a model, a namedtuple with the same field names, see record_type(...).
+    It has no per-instance `__dict__`, so it takes several times less memory than the model.
+    """
+
+    __slots__ = ()
+    _model: ClassVar[type[BaseModel]]
+
+    def to_model(self, **services) -> BaseModel:
+        """
+        Build and validate the full model, e.g. to use its methods and cached properties.
+
+        :param services: Service back-references, e.g. store_service=Store
+        """
+        data = {}
+        for (_, key), value in zip(_plan(self._model).keys, self):
+            if isinstance(value, Record):
+                value = value.to_model(**services)
+            elif isinstance(value, list):
+                value = [item.to_model(**services) if isinstance(item, Record) else item for item in value]
+            data[key] = value
+        return self._model(**data, **services)
+
+
+_record_types: dict[type[BaseModel], type[Record]] = {}
+
+
+def record_type(model: type[BaseModel]) -> type[Record]:
+    """
+    Record class of the model, e.g. ProductRecord for ProductModel, created once per model.
+    """
+    cls = _record_types.get(model)
+    if cls is None:
+        name = model.__name__.removesuffix("Model") + "Record"
+        base = namedtuple(name, list(model.model_fields))
+        cls = _record_types[model] = type(name, (Record, base), {"__slots__": (), "_model": model})
+    return cls
+
+
+def record(model: type[BaseModel], data: dict, **services) -> Record:
+    """
+    Build the record of the model from trusted API payload without validation.
+    Nested models become records too, datetimes and enums are converted like in construct(...).
+
+    :param model: Model class
+    :param data: API payload
+    :param services: Not stored in records, pass them to Record.to_model(...) instead
+    """
+    plan = _plan(model)
+    values = _values(plan, data)
+    for name, converter in plan.record_converters:
+        if name in values:
+            values[name] = converter(values[name], services)
+    # Missing required fields are None, Record.to_model(...) fails on them like the validation does
+    return tuple.__new__(record_type(model), [values.get(name) for name, _ in plan.keys])
+
+
+class ModelParser:
+    """
+    Builds models from API payloads, with full pydantic validation by default.
+
+    Trusted parser builds models with `construct(...)`, only `validate_sample` share of the items is validated,
+    so a changed API payload still fails loudly. It pays off only for nested models with custom `__init__`,
+    e.g. stores are built about 1.5x faster, while flat models like products are validated by pydantic-core
+    as fast as they are constructed in Python.
+    Records parser builds compact records instead of models, see record(...), they are never validated
+    except the sample.
+    """
+
+    def __init__(self, trusted: bool = False, validate_sample: float = 0.0, records: bool = False):
+        """
+        :param trusted: Skip validation of the payloads
+        :param validate_sample: Share of items to validate in trusted mode, e.g. 0.01 validates about every 100th item
+        :param records: Build records instead of models
+        """
+        self.trusted = trusted
+        self.validate_sample = validate_sample
+        self.records = records
+
+    def parse(self, model: type[M], data: dict, **services) -> Union[M, Record]:
+        sampled = self.validate_sample and random.random() < self.validate_sample  # noqa: S311
+        if self.records:
+            if sampled:
+                model(**data)
+            return record(model, data)
+        if self.trusted and not sampled:
+            return construct(model, data, **services)
+        if services or model.__init__ is not BaseModel.__init__:
+            return model(**data, **services)
+        # The same validation, but without passing the payload as keyword arguments, about 1.2x faster
+        return model.model_validate(data)
+
+    def parse_many(self, model: type[M], items: list[dict], **services) -> list[Union[M, Record]]:
+        return [self.parse(model, item, **services) for item in items]
+
+
+DEFAULT_PARSER = ModelParser()
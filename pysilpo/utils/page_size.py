@@ -0,0 +1,123 @@
+import time
+from collections.abc import Awaitable
+from typing import Callable, Optional, TypeVar
+
+from pysilpo.utils.exceptions import SilpoCircuitOpenException, SilpoRequestException
+from pysilpo.utils.utils import get_logger
+
+R = TypeVar("R")
+
+
+class AdaptivePageSize:
+    """
+    Page size which grows toward the largest one the endpoint tolerates.
+
+    The size is doubled after fast responses and halved after slow or too large responses.
+    A failed request is retried with a half size. The failed size becomes the ceiling, so it's not requested again
+    until `recover_after` requests in a row succeed, then the ceiling is lifted to `max_limit` again,
+    so a transient failure doesn't shrink pages for the rest of the iteration.
+    Sizes are multiples of `step`, so pages of a cursor keep their offsets.
+    """
+
+    logger = get_logger("pysilpo.page_size.AdaptivePageSize")
+
+    def __init__(
+        self,
+        step: int,
+        max_limit: int = 1000,
+        target_latency: float = 1.0,
+        max_payload: Optional[int] = None,
+        recover_after: int = 10,
+    ):
+        """
+        :param step: Smallest size, e.g. Product.all(limit=...), other sizes are multiples of it
+        :param max_limit: Largest size to try
+        :param target_latency: Response time in seconds to stay below, faster responses grow the size
+        :param max_payload: Response size in bytes to stay below, see record_payload
+        :param recover_after: How many successful requests in a row lift the ceiling set by a failure
+        """
+        self.step = step
+        self.max_limit = self._ceiling = max(max_limit // step, 1) * step
+        self.target_latency = target_latency
+        self.max_payload = max_payload
+        self.recover_after = recover_after
+        self.limit = step
+        self._payload: Optional[int] = None
+        self._successes = 0
+
+    def record_payload(self, size: int):
+        """Report the response size of the current request, it's called by the fetch function."""
+        self._payload = size
+
+    def _next_limit(self, limit: int, seconds: float) -> int:
+        """
+        :param limit: Size of the finished request, it's smaller than the current size for the last pages
+        """
+        payload = self._payload
+        if seconds > self.target_latency or (self.max_payload and payload and payload > self.max_payload):
+            return max(limit // 2 // self.step, 1) * self.step
+        fast = seconds < self.target_latency / 2
+        if fast and limit >= self.limit and not (self.max_payload and payload and payload > self.max_payload / 2):
+            return min(self.limit * 2, self.max_limit)
+        return self.limit
+
+    def _on_success(self, limit: int, started_at: float):
+        seconds = time.monotonic() - started_at
+        if self.max_limit < self._ceiling:
+            self._successes += 1
+            if self._successes >= self.recover_after:
+                self.logger.debug("[_on_success] %s requests succeeded, page size can grow again", self._successes)
+                self.max_limit = self._ceiling
+                self._successes = 0
+        new_limit = self._next_limit(limit, seconds)
+        if new_limit != self.limit:
+            self.logger.debug("[_on_success] %s items took %.2fs, page size is %s now", limit, seconds, new_limit)
+        self.limit = new_limit
+
+    def _on_failure(self, limit: int, error: Exception) -> bool:
+        """
+        :return: Whether to retry with the smaller size
+        """
+        if limit <= self.step or isinstance(error, SilpoCircuitOpenException):
+            return False
+        self.max_limit = limit - self.step
+        self._successes = 0
+        self.limit = max(limit // 2 // self.step, 1) * self.step
+        self.logger.debug("[_on_failure] %s items failed with %s, retrying with %s", limit, error, self.limit)
+        return True
+
+    def call(self, fetch: Callable[[int], R], max_limit: Optional[int] = None) -> tuple[R, int]:
+        """
+        Call fetch with the current size and adapt the size to the response.
+
+        :param fetch: Function which requests the given number of items
+        :param max_limit: Largest size for this call, e.g. items left before a fetched page
+        :return: (fetch result, used size)
+        """
+        while True:
+            limit = min(self.limit, max_limit) if max_limit else self.limit
+            self._payload = None
+            started_at = time.monotonic()
+            try:
+                result = fetch(limit)
+            except SilpoRequestException as e:
+                if not self._on_failure(limit, e):
+                    raise
+                continue
+            self._on_success(limit, started_at)
+            return result, limit
+
+    async def async_call(self, fetch: Callable[[int], Awaitable[R]], max_limit: Optional[int] = None) -> tuple[R, int]:
+        """Asyncio version of `call()`."""
+        while True:
+            limit = min(self.limit, max_limit) if max_limit else self.limit
+            self._payload = None
+            started_at = time.monotonic()
+            try:
+                result = await fetch(limit)
+            except SilpoRequestException as e:
+                if not self._on_failure(limit, e):
+                    raise
+                continue
+            self._on_success(limit, started_at)
+            return result, limit
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket. Every `acquire()` takes one token and blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: How many tokens are added per second
+        :param burst: Maximum number of tokens in the bucket, i.e. how many calls can be done at once
+        """
+        if rate <= 0:
+            raise ValueError("rate should be a positive number")
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if it's available.
+
+        :return: 0 if the token was taken, otherwise how many seconds to wait for the next token
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def async_acquire(self):
+        """Asyncio version of `acquire()`."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class HostLimiter:
+    """
+    Limits how many requests to the same host run at once, e.g.:
+
+        with limiter.limit(url):
+            transport.get(url)
+    """
+
+    def __init__(self, max_per_host: int):
+        """
+        :param max_per_host: Maximum number of concurrent requests per host
+        """
+        if max_per_host < 1:
+            raise ValueError("max_per_host should be a positive number")
+        self.max_per_host = max_per_host
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._async_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, url: str) -> Iterator[None]:
+        """Block until a request to the host of the URL is allowed."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            yield
+
+    @asynccontextmanager
+    async def async_limit(self, url: str) -> AsyncIterator[None]:
+        """Asyncio version of `limit()`."""
+        host = urlsplit(url).netloc
+        semaphore = self._async_semaphores.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        async with semaphore:
+            yield
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host, shared by all requests of a transport.
+
+    A host can also be paused, e.g. after 429 Too Many Requests, so every thread waits instead of
+    hitting the host again.
+    """
+
+    def __init__(self, rate: Optional[float] = None, rates: Optional[dict[str, float]] = None, burst: int = 1):
+        """
+        :param rate: Maximum number of requests per second to every host, unlimited by default
+        :param rates: Rate overrides per host, e.g. {"sf-ecom-api.silpo.ua": 20}
+        :param burst: How many requests to a host can be sent at once
+        """
+        self.rate = rate
+        self.rates = dict(rates or {})
+        self.burst = burst
+        self._limiters: dict[str, Optional[RateLimiter]] = {}
+        self._paused_until: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, host: str) -> Optional[RateLimiter]:
+        with self._lock:
+            if host not in self._limiters:
+                rate = self.rates.get(host, self.rate)
+                self._limiters[host] = RateLimiter(rate, self.burst) if rate else None
+            return self._limiters[host]
+
+    def try_acquire(self, url: str) -> float:
+        """
+        Take a token of the host if it's available.
+
+        :return: 0 if the token was taken, otherwise how many seconds to wait
+        """
+        host = urlsplit(url).netloc
+        paused = self._paused_until.get(host, 0) - time.monotonic()
+        if paused > 0:
+            return paused
+        limiter = self._limiter(host)
+        return limiter.try_acquire() if limiter is not None else 0
+
+    def acquire(self, url: str):
+        """Block until a request to the host of the URL is allowed."""
+        while True:
+            wait = self.try_acquire(url)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def async_acquire(self, url: str):
+        """Asyncio version of `acquire()`."""
+        while True:
+            wait = self.try_acquire(url)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, url: str, seconds: float):
+        """Don't allow requests to the host of the URL for the given number of seconds."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._paused_until[host] = max(self._paused_until.get(host, 0), time.monotonic() + seconds)
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections.abc import Awaitable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar, Union
+
+import requests
+
+from pysilpo.utils.cache import CacheBackend, get_cache
+from pysilpo.utils.utils import get_logger
+
+R = TypeVar("R")
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    :param ttl: How many seconds a response is fresh, 0 to always send the request
+    :param stale_ttl: How many seconds after `ttl` a stale response is still returned while it's revalidated
+    :param fallback_ttl: How many seconds after that the response is kept to be returned only when the host is
+        unavailable, see Transport(circuit_breaker=...)
+    """
+
+    ttl: int
+    stale_ttl: int = 0
+    fallback_ttl: int = 0
+
+
+class ResponseCache:
+    """
+    Persistent cache of HTTP responses, by default it's stored in the process-wide cache (memory + SQLite).
+
+    Only endpoints with a policy are cached, services name their endpoints, e.g. "product.categories".
+    Keys are derived from method, URL, query params and body.
+    Responses of AsyncTransport (httpx) are kept under their own keys, so both transports can share the cache.
+    """
+
+    logger = get_logger("pysilpo.response_cache.ResponseCache")
+
+    DEFAULT_POLICIES = {
+        # Search results are always requested, they are kept only to be returned while the host is unavailable
+        "product.all": CachePolicy(ttl=0, fallback_ttl=60 * 60),
+        "product.categories": CachePolicy(ttl=24 * 60 * 60, stale_ttl=24 * 60 * 60),
+        "store.all": CachePolicy(ttl=24 * 60 * 60, stale_ttl=24 * 60 * 60),
+        "store.get_branch_id": CachePolicy(ttl=24 * 60 * 60, stale_ttl=7 * 24 * 60 * 60),
+        "city.get": CachePolicy(ttl=24 * 60 * 60, stale_ttl=24 * 60 * 60),
+    }
+
+    def __init__(
+        self,
+        policies: Optional[dict[str, Union[CachePolicy, int, None]]] = None,
+        cache: Optional[CacheBackend] = None,
+    ):
+        """
+        :param policies: Policies per endpoint which override the default ones, e.g. {"product.all": 600}.
+            Integer means TTL in seconds without stale period, None disables caching of the endpoint.
+        :param cache: Where to store responses, `get_cache()` by default, e.g. RedisCache(...) to share them
+        """
+        self.policies = dict(self.DEFAULT_POLICIES)
+        for endpoint, policy in (policies or {}).items():
+            self.policies[endpoint] = CachePolicy(ttl=policy) if isinstance(policy, int) else policy
+        self.cache = cache if cache is not None else get_cache()
+
+        self._refreshing: set[str] = set()
+        self._refreshing_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pysilpo-revalidate")
+        self._tasks: set[asyncio.Task] = set()
+
+    def policy(self, endpoint: Optional[str]) -> Optional[CachePolicy]:
+        return self.policies.get(endpoint) if endpoint is not None else None
+
+    @staticmethod
+    def make_key(method: str, url: str, params=None, data=None, json_data=None, prefix: str = "response") -> str:
+        if isinstance(params, dict):
+            params = sorted((str(key), str(value)) for key, value in params.items())
+        if isinstance(data, str):
+            data = data.encode()
+        digest = hashlib.sha256()
+        for part in (method.upper(), url, json.dumps(params, default=str), json.dumps(json_data, sort_keys=True)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        if data is not None:
+            digest.update(data if isinstance(data, bytes) else json.dumps(data, sort_keys=True, default=str).encode())
+        return f"{prefix}_{digest.hexdigest()}"
+
+    def get(self, key: str) -> Optional[tuple[float, requests.Response]]:
+        """
+        :return: (stored_at timestamp, response) or None if there is no response or it has expired
+        """
+        return self.cache.get(key)
+
+    def set(self, key: str, response: requests.Response, policy: CachePolicy):
+        stored_at = time.time()
+        self.cache.set(
+            key,
+            (stored_at, response),
+            expires_in=round(stored_at + policy.ttl + policy.stale_ttl + policy.fallback_ttl),
+        )
+
+    def fallback(self, key: str) -> Optional[requests.Response]:
+        """
+        :return: Cached response of any age, e.g. when the host is unavailable, or None if there is no response
+        """
+        cached = self.get(key)
+        return cached[1] if cached is not None else None
+
+    def revalidate(self, key: str, fetch: Callable[[], requests.Response]):
+        """
+        Refresh the cached response in the background, only one refresh per key runs at a time.
+        """
+        if not self._start_refresh(key):
+            return
+
+        def refresh():
+            try:
+                fetch()
+            except Exception as e:
+                self.logger.warning("[revalidate] Failed to revalidate cached response: %s", e)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+    def async_revalidate(self, key: str, fetch: Callable[[], Awaitable]):
+        """Asyncio version of `revalidate()`, the response is refreshed in a task of the running event loop."""
+        if not self._start_refresh(key):
+            return
+
+        async def refresh():
+            try:
+                await fetch()
+            except Exception as e:
+                self.logger.warning("[async_revalidate] Failed to revalidate cached response: %s", e)
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        # The event loop keeps only weak references to tasks
+        task = asyncio.ensure_future(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _start_refresh(self, key: str) -> bool:
+        """
+        :return: Whether the refresh of the key can start, i.e. there is no other one running
+        """
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _cached(self, endpoint: str, key: str, policy: CachePolicy) -> tuple[Optional[object], bool]:
+        """
+        :return: (cached response or None if the request has to be sent, whether the response is stale)
+        """
+        cached = self.get(key)
+        if cached is None:
+            return None, False
+        stored_at, response = cached
+        age = time.time() - stored_at
+        if age < policy.ttl:
+            self.logger.debug("[fetch] Fresh cached response of %s", endpoint)
+            return response, False
+        if age < policy.ttl + policy.stale_ttl:
+            self.logger.debug("[fetch] Stale cached response of %s, revalidating", endpoint)
+            return response, True
+        return None, False
+
+    def fetch(
+        self,
+        endpoint: Optional[str],
+        key: str,
+        send: Callable[[], requests.Response],
+        bypass_cache: bool = False,
+    ) -> requests.Response:
+        """
+        Return cached response of the endpoint or send the request and cache the response.
+
+        :param endpoint: Endpoint name, responses of endpoints without policy are not cached
+        :param key: Cache key, see make_key
+        :param send: Function which sends the request
+        :param bypass_cache: Don't read the cache, but still store the fresh response
+        :return: Response
+        """
+        policy = self.policy(endpoint)
+        if policy is None:
+            return send()
+
+        def fetch_and_store() -> requests.Response:
+            response = send()
+            if response.ok:
+                self.set(key, response, policy)
+            return response
+
+        if not bypass_cache:
+            response, stale = self._cached(endpoint, key, policy)
+            if stale:
+                self.revalidate(key, fetch_and_store)
+            if response is not None:
+                return response
+        return fetch_and_store()
+
+    async def async_fetch(
+        self,
+        endpoint: Optional[str],
+        key: str,
+        send: Callable[[], Awaitable[R]],
+        bypass_cache: bool = False,
+    ) -> R:
+        """
+        Asyncio version of `fetch()` for httpx responses.
+        """
+        policy = self.policy(endpoint)
+        if policy is None:
+            return await send()
+
+        async def fetch_and_store() -> R:
+            response = await send()
+            if response.is_success:
+                self.set(key, response, policy)
+            return response
+
+        if not bypass_cache:
+            response, stale = self._cached(endpoint, key, policy)
+            if stale:
+                self.async_revalidate(key, fetch_and_store)
+            if response is not None:
+                return response
+        return await fetch_and_store()
@@ -0,0 +1,97 @@
+import random
+import time
+from collections.abc import Mapping
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a failed request.
+
+    Delays grow exponentially with random jitter, so concurrent workers don't retry at the same moment.
+    `Retry-After` of the response is used instead when it's present.
+
+    Requests which are not idempotent (POST by default) are retried only when the server surely didn't process them,
+    i.e. after 429 Too Many Requests or when the connection wasn't established. Read-only POSTs, e.g. GraphQL
+    queries, are sent with `idempotent=True` and retried like GET.
+    """
+
+    STATUSES = frozenset({429, 500, 502, 503, 504})
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def __init__(
+        self,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        max_retry_after: float = 60.0,
+        jitter: bool = True,
+        statuses: frozenset[int] = STATUSES,
+    ):
+        """
+        :param retries: How many times to retry a request, 0 disables retries
+        :param backoff: Delay before the first retry in seconds, it's doubled for every next one
+        :param max_backoff: Maximum delay between retries
+        :param max_retry_after: Don't retry when the server asks to wait longer than this, the response is returned
+        :param jitter: Randomize delays, from a half to the full delay
+        :param statuses: Response statuses to retry
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.jitter = jitter
+        self.statuses = statuses
+
+    @classmethod
+    def is_idempotent(cls, method: str, idempotent: Optional[bool] = None) -> bool:
+        """
+        :param idempotent: Explicit flag of the request, otherwise it's decided by the method
+        """
+        return idempotent if idempotent is not None else method.upper() in cls.IDEMPOTENT_METHODS
+
+    def backoff_delay(self, attempt: int) -> float:
+        delay = min(self.backoff * 2**attempt, self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2) if self.jitter else delay  # noqa: S311
+
+    @staticmethod
+    def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+        """
+        :return: Seconds from `Retry-After` header, which is either a number of seconds or an HTTP date
+        """
+        value = headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def response_delay(
+        self, attempt: int, status: int, headers: Mapping[str, str], idempotent: bool
+    ) -> Optional[float]:
+        """
+        :param attempt: Number of already done retries
+        :return: Seconds to wait before the retry or None if the response should be returned
+        """
+        if attempt >= self.retries or status not in self.statuses or not (idempotent or status == 429):
+            return None
+        retry_after = self.parse_retry_after(headers)
+        if retry_after is None:
+            return self.backoff_delay(attempt)
+        return retry_after if retry_after <= self.max_retry_after else None
+
+    def error_delay(self, attempt: int, idempotent: bool, sent: bool) -> Optional[float]:
+        """
+        :param attempt: Number of already done retries
+        :param sent: Whether the request could reach the server, e.g. False for connect timeouts
+        :return: Seconds to wait before the retry or None if the error should be raised
+        """
+        if attempt >= self.retries or (sent and not idempotent):
+            return None
+        return self.backoff_delay(attempt)
@@ -0,0 +1,536 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections.abc import Awaitable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from enum import Enum
+from typing import Callable, Optional, TypeVar, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from pysilpo.utils.circuit_breaker import CircuitBreaker
+from pysilpo.utils.exceptions import SilpoCircuitOpenException, SilpoException
+from pysilpo.utils.hedging import HedgePolicy
+from pysilpo.utils.rate_limit import HostRateLimiter
+from pysilpo.utils.response_cache import ResponseCache
+from pysilpo.utils.retry import RetryPolicy
+from pysilpo.utils.utils import get_logger
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+Timeout = Union[float, tuple[float, float], None]
+R = TypeVar("R")
+
+
+class _PoliciesMixin:
+    """Retry, circuit breaker and hedging decisions shared by Transport and AsyncTransport."""
+
+    logger: logging.Logger
+    rate_limiter: HostRateLimiter
+    retry: Optional[RetryPolicy]
+    circuit_breaker: Optional[CircuitBreaker]
+    hedge: Optional[HedgePolicy]
+    # Errors raised before the request reached the server, so even POST can be retried
+    _NOT_SENT_ERRORS: tuple[type[Exception], ...] = ()
+
+    def _response_delay(
+        self, method: str, url: str, idempotent: Optional[bool], attempt: int, status: int, headers
+    ) -> Optional[float]:
+        """
+        :return: Seconds to wait before retrying the response or None to return it
+        """
+        if self.retry is None:
+            return None
+        delay = self.retry.response_delay(attempt, status, headers, self.retry.is_idempotent(method, idempotent))
+        if delay is not None:
+            if status == 429:
+                self.rate_limiter.pause(url, delay)
+            self.logger.warning("[request] %s %s returned %s, retrying in %.2fs", method, url, status, delay)
+        return delay
+
+    def _error_delay(
+        self, method: str, url: str, idempotent: Optional[bool], attempt: int, error: Exception
+    ) -> Optional[float]:
+        """
+        :return: Seconds to wait before retrying the request or None to raise the error
+        """
+        if self.retry is None:
+            return None
+        sent = not isinstance(error, self._NOT_SENT_ERRORS)
+        delay = self.retry.error_delay(attempt, self.retry.is_idempotent(method, idempotent), sent)
+        if delay is not None:
+            self.logger.warning("[request] %s %s failed with %r, retrying in %.2fs", method, url, error, delay)
+        return delay
+
+    def _check_circuit(self, url: str):
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow(url):
+            raise SilpoCircuitOpenException(f"Circuit of {urlsplit(url).netloc} is open, the host is unavailable")
+
+    def _record_outcome(self, url: str, endpoint: Optional[str], started_at: float, failed: Optional[bool]):
+        """
+        :param failed: Whether the request has failed, None if it was interrupted, e.g. cancelled
+        """
+        if failed is None:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.release(url)
+            return
+        if self.circuit_breaker is not None:
+            if failed:
+                self.circuit_breaker.record_failure(url)
+            else:
+                self.circuit_breaker.record_success(url)
+        if self.hedge is not None and not failed:
+            self.hedge.record(endpoint, time.monotonic() - started_at)
+
+    def _hedge_delay(self, method: str, endpoint: Optional[str], idempotent: Optional[bool]) -> Optional[float]:
+        """
+        :return: Seconds to wait before sending the hedged request or None to not hedge it
+        """
+        if self.hedge is None or not RetryPolicy.is_idempotent(method, idempotent):
+            return None
+        return self.hedge.delay(endpoint)
+
+
+class Transport(_PoliciesMixin):
+    """
+    HTTP transport shared by all services.
+
+    It keeps one keep-alive connection pool per Silpo host, so catalog pages, GraphQL calls and cheque requests
+    reuse already opened TCP+TLS connections instead of doing a new handshake for every request.
+
+    Requests to every host go through a shared token bucket and are retried on 429 and 5xx responses,
+    see RetryPolicy. After 429 the whole host is paused, so concurrent workers slow down together.
+
+    Optional CircuitBreaker fails requests to a degraded host fast, cached responses are returned instead
+    when there are any. Optional HedgePolicy sends a duplicate of a slow request and takes the first response.
+    """
+
+    logger = get_logger("pysilpo.transport.Transport")
+    _NOT_SENT_ERRORS = (requests.exceptions.ConnectTimeout,)
+
+    HOSTS = (
+        "sf-ecom-api.silpo.ua",
+        "graphql.silpo.ua",
+        "loyalty-platform-public-api.silpo.ua",
+        "auth.silpo.ua",
+    )
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        pool_sizes: Optional[dict[str, int]] = None,
+        timeout: Timeout = (5, 30),
+        compression: bool = True,
+        cache: Optional[ResponseCache] = None,
+        rate_limit: Optional[float] = None,
+        rate_limits: Optional[dict[str, float]] = None,
+        retry: Optional[RetryPolicy] = RetryPolicy(),  # noqa: B008
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedge: Optional[HedgePolicy] = None,
+    ):
+        """
+        :param pool_size: How many keep-alive connections to keep per host
+        :param pool_sizes: Pool size overrides per host, e.g. {"sf-ecom-api.silpo.ua": 32}
+        :param timeout: Default timeout for every request, either a number or (connect, read) tuple
+        :param compression: Negotiate compressed responses (gzip, deflate and brotli when it is installed)
+        :param cache: Cache of responses of catalog endpoints, e.g. ResponseCache(), disabled by default
+        :param rate_limit: Maximum number of requests per second to every host, unlimited by default
+        :param rate_limits: Rate limit overrides per host, e.g. {"loyalty-platform-public-api.silpo.ua": 5}
+        :param retry: Retry policy of failed requests, None disables retries
+        :param circuit_breaker: Fail requests to degraded hosts fast, e.g. CircuitBreaker(), disabled by default.
+            While a circuit is open, cached responses are returned for endpoints with a cache policy,
+            e.g. search results of the last hour, see ResponseCache.DEFAULT_POLICIES
+        :param hedge: Send duplicates of slow catalog requests, e.g. HedgePolicy(), disabled by default
+        """
+        self.pool_size = pool_size
+        self.pool_sizes = dict(pool_sizes or {})
+        self.timeout = timeout
+        self.compression = compression
+        self.cache = cache
+        self.rate_limiter = HostRateLimiter(rate_limit, rate_limits)
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+
+        self._default_adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self._adapters = {
+            host: HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_sizes.get(host, pool_size))
+            for host in (*self.HOSTS, *self.pool_sizes)
+        }
+        self.session = self.new_session()
+
+    def new_session(self) -> requests.Session:
+        """
+        Create a session that shares connection pools of this transport, but keeps its own cookies and headers.
+        """
+        session = requests.Session()
+        session.mount("http://", self._default_adapter)
+        session.mount("https://", self._default_adapter)
+        for host, adapter in self._adapters.items():
+            session.mount(f"https://{host}", adapter)
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING if self.compression else "identity"
+        return session
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        session: Optional[requests.Session] = None,
+        endpoint: Optional[str] = None,
+        bypass_cache: bool = False,
+        idempotent: Optional[bool] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Send a request through the shared connection pools.
+
+        :param method: HTTP method
+        :param url: Full URL
+        :param session: Session to use instead of the transport one, e.g. to send user cookies
+        :param endpoint: Endpoint name used to look up cache policy, e.g. "product.categories"
+        :param bypass_cache: Don't return cached response, the fresh one is still cached
+        :param idempotent: Whether the request can be safely retried, by default only POST can't be
+        :param kwargs: Other arguments of requests.Session.request(...)
+        :return: Response, the last one if retries didn't help
+        """
+        kwargs.setdefault("timeout", self.timeout)
+
+        def send_once() -> requests.Response:
+            self.rate_limiter.acquire(url)
+            self.logger.debug("[request] %s %s", method, url)
+            started_at = time.monotonic()
+            failed = None
+            try:
+                resp = (session or self.session).request(method, url, **kwargs)
+                failed = resp.status_code >= 500
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # Every allowed request has to report back, otherwise a half-open circuit keeps its probe slot
+                self._record_outcome(url, endpoint, started_at, failed)
+            return resp
+
+        def send() -> requests.Response:
+            attempt = 0
+            while True:
+                self._check_circuit(url)
+                try:
+                    resp = self._hedged(send_once, self._hedge_delay(method, endpoint, idempotent))
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    delay = self._error_delay(method, url, idempotent, attempt, e)
+                    if delay is None:
+                        raise
+                else:
+                    delay = self._response_delay(method, url, idempotent, attempt, resp.status_code, resp.headers)
+                    if delay is None:
+                        return resp
+                    resp.close()
+                time.sleep(delay)
+                attempt += 1
+
+        if self.cache is None or endpoint is None:
+            return send()
+        key = self.cache.make_key(method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json"))
+        try:
+            return self.cache.fetch(endpoint, key, send, bypass_cache=bypass_cache)
+        except SilpoCircuitOpenException:
+            response = self.cache.fallback(key)
+            if response is None:
+                raise
+            self.logger.warning("[request] %s is unavailable, returning cached response of %s", url, endpoint)
+            return response
+
+    def _hedged(self, send_once: Callable[[], R], delay: Optional[float]) -> R:
+        """
+        Send the request, if there is no response after the delay send it again and return the first response.
+        """
+        if delay is None:
+            return send_once()
+        # Own threads for every request, so the request is sent at once and the delay isn't spent in a queue
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pysilpo-hedge")
+        try:
+            first = executor.submit(send_once)
+            if wait([first], timeout=delay).done:
+                return first.result()
+            self.logger.debug("[_hedged] No response in %.2fs, sending hedged request", delay)
+            futures = [first, executor.submit(send_once)]
+            error = None
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                for other in futures:
+                    if other is not future:
+                        # Release the connection of the slower response once it arrives
+                        other.add_done_callback(self._close_response)
+                return response
+            raise error
+        finally:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _close_response(future: Future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+        self._default_adapter.close()
+        for adapter in self._adapters.values():
+            adapter.close()
+
+    def __enter__(self) -> "Transport":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_default_transport: Optional[Transport] = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> Transport:
+    """Return process-wide transport, which is used when no transport is passed explicitly."""
+    global _default_transport  # noqa: PLW0603
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = Transport()
+    return _default_transport
+
+
+class AsyncTransport(_PoliciesMixin):
+    """
+    Asyncio version of Transport built on top of httpx.AsyncClient.
+
+    Transport is bound to the event loop where it sends its first request, so create one per event loop.
+    """
+
+    logger = get_logger("pysilpo.transport.AsyncTransport")
+    _NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) if httpx is not None else ()
+
+    HOSTS = Transport.HOSTS
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        pool_sizes: Optional[dict[str, int]] = None,
+        timeout: Timeout = (5, 30),
+        compression: bool = True,
+        cache: Optional[ResponseCache] = None,
+        rate_limit: Optional[float] = None,
+        rate_limits: Optional[dict[str, float]] = None,
+        retry: Optional[RetryPolicy] = RetryPolicy(),  # noqa: B008
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedge: Optional[HedgePolicy] = None,
+    ):
+        """
+        :param pool_size: How many keep-alive connections to keep per host
+        :param pool_sizes: Pool size overrides per host, e.g. {"sf-ecom-api.silpo.ua": 32}
+        :param timeout: Default timeout for every request, either a number or (connect, read) tuple
+        :param compression: Negotiate compressed responses (gzip, deflate and brotli when it is installed)
+        :param cache: Cache of responses of catalog endpoints, e.g. ResponseCache(), disabled by default
+        :param rate_limit: Maximum number of requests per second to every host, unlimited by default
+        :param rate_limits: Rate limit overrides per host, e.g. {"loyalty-platform-public-api.silpo.ua": 5}
+        :param retry: Retry policy of failed requests, None disables retries
+        :param circuit_breaker: Fail requests to degraded hosts fast, e.g. CircuitBreaker(), disabled by default.
+            While a circuit is open, cached responses are returned for endpoints with a cache policy
+        :param hedge: Send duplicates of slow catalog requests, e.g. HedgePolicy(), disabled by default
+        """
+        if httpx is None:
+            raise SilpoException("AsyncTransport requires httpx, install it with `pip install pysilpo[async]`")
+        self.pool_size = pool_size
+        self.pool_sizes = dict(pool_sizes or {})
+        self.timeout = timeout
+        self.compression = compression
+        self.cache = cache
+        self.rate_limiter = HostRateLimiter(rate_limit, rate_limits)
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+            httpx_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        else:
+            httpx_timeout = httpx.Timeout(timeout)
+
+        self.client = httpx.AsyncClient(
+            limits=self._limits(pool_size),
+            mounts={
+                f"https://{host}": httpx.AsyncHTTPTransport(limits=self._limits(self.pool_sizes.get(host, pool_size)))
+                for host in (*self.HOSTS, *self.pool_sizes)
+            },
+            timeout=httpx_timeout,
+            headers=None if compression else {"Accept-Encoding": "identity"},
+        )
+
+    @staticmethod
+    def _limits(pool_size: int) -> "httpx.Limits":
+        return httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+
+    @staticmethod
+    def _prepare_params(params: Optional[dict]) -> Optional[dict]:
+        """
+        Encode query params the same way requests does: skip None values, use values of enums
+        and keep Python bool notation.
+        """
+        if params is None:
+            return None
+        prepared = {}
+        for key, value in params.items():
+            if value is None:
+                continue
+            if isinstance(value, Enum):
+                value = value.value
+            prepared[key] = str(value) if isinstance(value, bool) else value
+        return prepared
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: Optional[str] = None,
+        bypass_cache: bool = False,
+        idempotent: Optional[bool] = None,
+        **kwargs,
+    ) -> "httpx.Response":
+        """
+        Send a request through the shared connection pools.
+
+        :param method: HTTP method
+        :param url: Full URL
+        :param endpoint: Endpoint name used to look up cache and hedging policies, e.g. "product.categories"
+        :param bypass_cache: Don't return cached response, the fresh one is still cached
+        :param idempotent: Whether the request can be safely retried, by default only POST can't be
+        :param kwargs: Other arguments of httpx.AsyncClient.request(...)
+        :return: Response, the last one if retries didn't help
+        """
+        kwargs["params"] = self._prepare_params(kwargs.get("params"))
+
+        async def send_once() -> "httpx.Response":
+            await self.rate_limiter.async_acquire(url)
+            self.logger.debug("[request] %s %s", method, url)
+            started_at = time.monotonic()
+            failed = None
+            try:
+                resp = await self.client.request(method, url, **kwargs)
+                failed = resp.status_code >= 500
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # Cancelled requests (e.g. the slower hedged one) only release the probe slot
+                self._record_outcome(url, endpoint, started_at, failed)
+            return resp
+
+        async def send() -> "httpx.Response":
+            attempt = 0
+            while True:
+                self._check_circuit(url)
+                try:
+                    resp = await self._hedged(send_once, self._hedge_delay(method, endpoint, idempotent))
+                except httpx.TransportError as e:
+                    delay = self._error_delay(method, url, idempotent, attempt, e)
+                    if delay is None:
+                        raise
+                else:
+                    delay = self._response_delay(method, url, idempotent, attempt, resp.status_code, resp.headers)
+                    if delay is None:
+                        return resp
+                    await resp.aclose()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        if self.cache is None or endpoint is None:
+            return await send()
+        key = self.cache.make_key(
+            method,
+            url,
+            kwargs.get("params"),
+            kwargs.get("content", kwargs.get("data")),
+            kwargs.get("json"),
+            prefix="async_response",
+        )
+        try:
+            return await self.cache.async_fetch(endpoint, key, send, bypass_cache=bypass_cache)
+        except SilpoCircuitOpenException:
+            response = self.cache.fallback(key)
+            if response is None:
+                raise
+            self.logger.warning("[request] %s is unavailable, returning cached response of %s", url, endpoint)
+            return response
+
+    async def _hedged(self, send_once: Callable[[], Awaitable[R]], delay: Optional[float]) -> R:
+        """Asyncio version of Transport._hedged, the slower request is cancelled or its response is closed."""
+        if delay is None:
+            return await send_once()
+        first = asyncio.ensure_future(send_once())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self.logger.debug("[_hedged] No response in %.2fs, sending hedged request", delay)
+        tasks = {first, asyncio.ensure_future(send_once())}
+        error = response = None
+        try:
+            for completed in asyncio.as_completed(tasks):
+                try:
+                    response = await completed
+                    return response
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None and task.result() is not response:
+                    await task.result().aclose()
+
+    async def get(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        """Close all pooled connections."""
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncTransport":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+_default_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncTransport]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_default_async_transport() -> AsyncTransport:
+    """Return async transport of the running event loop, which is used when no transport is passed explicitly."""
+    loop = asyncio.get_running_loop()
+    if loop not in _default_async_transports:
+        _default_async_transports[loop] = AsyncTransport()
+    return _default_async_transports[loop]
@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import Optional
+
+from pysilpo.account_pool import AccountPool
+from pysilpo.services.authorization import User
+from pysilpo.services.cheque import ChequeModel
+from pysilpo.utils.cache import MemoryCache
+from tests.test_authorization import make_token
+from tests.test_cheque import FakeCheque, cheque_data
+
+
+class PoolCheque(FakeCheque):
+    """Account with `chunks` chunks of 2 cheques, requests of all accounts are counted in `in_flight`."""
+
+    def __init__(self, phone_number: str, chunks: int, in_flight: dict, fail_on_chunk: Optional[int] = None):
+        super().__init__()
+        self.user.phone_number = phone_number
+        self.chunk_count = chunks
+        self.fail_on_chunk = fail_on_chunk
+        self.in_flight_by_account = in_flight
+
+    def _request(self):
+        with self.lock:
+            self.in_flight_by_account[self.user.phone_number] = (
+                self.in_flight_by_account.get(self.user.phone_number, 0) + 1
+            )
+            self.max_in_flight = max(self.max_in_flight, self.in_flight_by_account[self.user.phone_number])
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight_by_account[self.user.phone_number] -= 1
+
+    def cheque_chunks(self, date_from=None, date_to=None, page_size=0, row_number=0, window_workers=1, parser=None):
+        for chunk in range(self.chunk_count):
+            self._request()
+            if chunk == self.fail_on_chunk:
+                raise RuntimeError("Unauthorized")
+            yield [ChequeModel(**cheque_data(chunk * 2 + i), cheque_service=self) for i in range(2)]
+
+    def get_detail(self, cheque_id, created, fill_id, loyalty_fact_id, records=False):
+        self._request()
+        return f"detail-{self.user.phone_number}-{cheque_id}"
+
+
+class FakePool(AccountPool):
+    def __init__(self, chunks: dict[str, int], fail_on_chunk: Optional[dict[str, int]] = None, **kwargs):
+        super().__init__(chunks, **kwargs)
+        self.chunks = chunks
+        self.fail_on_chunk = fail_on_chunk or {}
+        self.services: dict[str, PoolCheque] = {}
+        self.in_flight: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def _cheque_service(self, phone_number: str) -> PoolCheque:
+        self.services[phone_number] = PoolCheque(
+            phone_number, self.chunks[phone_number], self.in_flight, self.fail_on_chunk.get(phone_number)
+        )
+        # Services count requests of all accounts in one dict
+        self.services[phone_number].lock = self.lock
+        return self.services[phone_number]
+
+
+class TestAccountPool:
+    def test_cheques(self):
+        pool = FakePool({"+380000000001": 3, "+380000000002": 1}, max_workers=4)
+
+        result = list(pool.cheques())
+        assert sorted((phone, cheque.cheque_id) for phone, cheque in result) == [
+            *(("+380000000001", i) for i in range(6)),
+            *(("+380000000002", i) for i in range(2)),
+        ]
+        assert pool.progress["+380000000001"].cheques == 6
+        assert all(progress.done for progress in pool.progress.values())
+        assert pool.failures == {}
+
+    def test_details_fair_share(self):
+        phones = {f"+38000000000{i}": 3 for i in range(4)}
+        pool = FakePool(phones, max_workers=6, max_per_account=2)
+
+        result = list(pool.cheques(with_details=True))
+        assert len(result) == 4 * 6
+        assert all(cheque.detail == f"detail-{phone}-{cheque.cheque_id}" for phone, cheque in result)
+        assert all(service.max_in_flight <= 2 for service in pool.services.values())
+        assert all(progress.details == 6 for progress in pool.progress.values())
+        # Accounts take turns, so the first results come from every account
+        assert {phone for phone, _ in result[:8]} == set(phones)
+
+    def test_failed_account(self):
+        pool = FakePool({"+380000000001": 3, "+380000000002": 3}, fail_on_chunk={"+380000000002": 1})
+
+        result = list(pool.cheques())
+        assert len([phone for phone, _ in result if phone == "+380000000001"]) == 6
+        assert [phone for phone, _ in result].count("+380000000002") == 2
+        assert list(pool.failures) == ["+380000000002"]
+        assert str(pool.progress["+380000000002"].error) == "Unauthorized"
+        assert pool.progress["+380000000002"].done
+
+    def test_cookie_only_account(self, monkeypatch):
+        authorized_cookies = []
+
+        def authorize(_user, auth_cookies=None) -> str:
+            authorized_cookies.append(auth_cookies)
+            return "code"
+
+        monkeypatch.setattr(User, "_openid_authorize", authorize)
+        monkeypatch.setattr(User, "_get_token", lambda _user, _code: make_token(3600))
+        # The token of the last run has expired and dropped from the cache, only cookies are left
+        cache = MemoryCache()
+        cache.set("cookie_+380000000001", {"session": "cookie"})
+
+        cheque_service = AccountPool(["+380000000001"], cache=cache)._cheque_service("+380000000001")
+        assert cheque_service.user.access_token
+        assert authorized_cookies == [{"session": "cookie"}]
+        assert cache.get("token_+380000000001") is not None
@@ -0,0 +1,222 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+import requests
+
+from pysilpo.services.authorization import Token, User
+from pysilpo.utils.cache import CacheLock, MemoryCache, TieredCache
+from pysilpo.utils.exceptions import NoOpenIDAuthCodeException
+
+
+def make_token(expires_in: float) -> Token:
+    access_token = jwt.encode({"exp": round(time.time() + expires_in)}, "s" * 32, algorithm="HS256")
+    return Token(id_token="id", access_token=access_token, token_type="Bearer", scope="openid")  # noqa: S106
+
+
+class FakeUser(User):
+    """Counts token refreshes instead of sending OpenID requests."""
+
+    def __init__(self, cache: MemoryCache, refreshes: list, **kwargs):
+        super().__init__("+380123456789", cache=cache, **kwargs)
+        self.refreshes = refreshes
+
+    def _openid_authorize(self, auth_cookies=None) -> str:
+        time.sleep(0.1)
+        self.refreshes.append(threading.get_ident())
+        return "code"
+
+    def _get_token(self, auth_code: str) -> Token:
+        return make_token(3600)
+
+
+def make_user(expires_in: float, cache=None, refreshes=None, **kwargs) -> FakeUser:
+    cache = cache if cache is not None else MemoryCache()
+    cache.set("cookie_+380123456789", {"session": "cookie"})
+    user = FakeUser(cache, refreshes if refreshes is not None else [], **kwargs)
+    user.set_token(make_token(expires_in))
+    return user
+
+
+class TestTokenRefresh:
+    def test_single_flight(self):
+        user = make_user(expires_in=-10)
+        expired_token = user.token.access_token
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = list(executor.map(lambda _: user.access_token, range(8)))
+
+        assert len(user.refreshes) == 1
+        assert set(tokens) == {user.token.access_token}
+        assert expired_token not in tokens
+
+    def test_shared_cache(self):
+        # Users of different processes share only the cache
+        cache, refreshes = MemoryCache(), []
+        users = [make_user(expires_in=-10, cache=cache, refreshes=refreshes) for _ in range(4)]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            tokens = list(executor.map(lambda user: user.access_token, users))
+
+        assert len(refreshes) == 1
+        assert len(set(tokens)) == 1
+
+    def test_background_refresh(self):
+        user = make_user(expires_in=30, refresh_margin=60)
+        old_token = user.token.access_token
+
+        # Still valid token is returned at once, the new one is fetched in background
+        assert user.access_token == old_token
+        assert user.access_token == old_token
+        deadline = time.monotonic() + 5
+        while user.token.access_token == old_token and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert user.token.access_token != old_token
+        assert len(user.refreshes) == 1
+
+        assert make_user(expires_in=30, refresh_margin=0).access_token
+
+    def test_background_refresh_backoff(self):
+        class FailingUser(FakeUser):
+            def _openid_authorize(self, auth_cookies=None) -> str:
+                self.refreshes.append(threading.get_ident())
+                raise NoOpenIDAuthCodeException("No auth code")
+
+        def read_token(user: User):
+            assert user.access_token
+            # Let the background refresh finish
+            with user._refresh_lock:
+                pass
+
+        cache = MemoryCache()
+        cache.set("cookie_+380123456789", {"session": "cookie"})
+        user = FailingUser(cache, [], refresh_margin=60, refresh_retry_delay=0.2)
+        user.set_token(make_token(30))
+
+        for _ in range(20):
+            read_token(user)
+        assert len(user.refreshes) == 1
+
+        time.sleep(0.25)
+        for _ in range(20):
+            read_token(user)
+        # The next retry waits twice as long
+        assert len(user.refreshes) == 2
+
+    def test_tiered_cache(self):
+        # Processes have their own memory tiers over one persistent cache
+        persistent, refreshes = MemoryCache(), []
+        users = [
+            make_user(expires_in=30, cache=TieredCache(persistent), refreshes=refreshes, refresh_margin=60)
+            for _ in range(2)
+        ]
+        old_token = users[1].token.access_token
+
+        for user in users:
+            assert user.access_token
+            deadline = time.monotonic() + 5
+            while user.token.access_token == old_token and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert len(refreshes) == 1
+        assert users[0].token.access_token == users[1].token.access_token != old_token
+
+
+class TestLogin:
+    def test_retry_keeps_other_accounts(self):
+        class FlakyUser(FakeUser):
+            def _openid_authorize(self, auth_cookies=None) -> str:
+                if not self.refreshes:
+                    self.refreshes.append(auth_cookies)
+                    raise NoOpenIDAuthCodeException("No auth code")
+                return super()._openid_authorize(auth_cookies)
+
+        cache = MemoryCache()
+        cache.set("cookie_+380123456789", {"session": "cookie"})
+        cache.set("cookie_+380987654321", {"session": "other"})
+        user = FlakyUser(cache, [])
+
+        assert user.login().token is not None
+        assert cache.get("cookie_+380123456789") is None
+        assert cache.get("cookie_+380987654321") == {"session": "other"}
+
+
+def json_response(status: int, data: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(data).encode()
+    return response
+
+
+class FakeAuthTransport:
+    """Serves the discovery document, the token endpoint is moved to `token_url`."""
+
+    def __init__(self, token_url: str = "https://auth.silpo.ua/connect/token"):  # noqa: S107
+        self.token_url = token_url
+        self.requests = []
+
+    def new_session(self) -> requests.Session:
+        return requests.Session()
+
+    def request(self, method, url, session=None, **kwargs):
+        self.requests.append((method, url))
+        if url == User._openid_configuration:
+            return json_response(
+                200,
+                {
+                    "authorization_endpoint": "https://auth.silpo.ua/connect/authorize",
+                    "token_endpoint": self.token_url,
+                },
+            )
+        if url != self.token_url:
+            return json_response(404, {"error": "not_found"})
+        return json_response(200, make_token(3600).model_dump(mode="json"))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+
+class TestOpenIDConfiguration:
+    def test_shared_between_users(self):
+        cache, transport = MemoryCache(), FakeAuthTransport()
+        users = [User("+380123456789", transport=transport, cache=cache) for _ in range(3)]
+
+        assert {user.openid_configuration["token_endpoint"] for user in users} == {transport.token_url}
+        assert transport.requests == [("GET", User._openid_configuration)]
+
+        # Expired document is fetched again
+        cache.set(User._OPENID_CONFIGURATION_KEY, {}, expires_in=round(time.time()) - 1)
+        assert users[0].openid_configuration["token_endpoint"] == transport.token_url
+        assert len(transport.requests) == 2
+
+    def test_revalidate_moved_endpoint(self):
+        cache, transport = MemoryCache(), FakeAuthTransport()
+        user = User("+380123456789", transport=transport, cache=cache)
+        user.openid_configuration  # noqa: B018
+        transport.token_url = "https://auth.silpo.ua/v2/connect/token"  # noqa: S105
+
+        assert user._get_token("code").access_token
+        assert transport.requests[1:] == [
+            ("POST", "https://auth.silpo.ua/connect/token"),
+            ("GET", User._openid_configuration),
+            ("POST", "https://auth.silpo.ua/v2/connect/token"),
+        ]
+        assert cache.get(User._OPENID_CONFIGURATION_KEY)["token_endpoint"] == transport.token_url
+
+
+class TestCacheLock:
+    def test_lease(self):
+        cache = MemoryCache()
+        lock, other = CacheLock(cache, "refresh", ttl=60), CacheLock(cache, "refresh", ttl=60)
+
+        assert lock.acquire()
+        assert not other.acquire()
+        other.release()  # Not an owner, the lock is kept
+        assert not other.acquire()
+        lock.release()
+        assert other.acquire()
+
+        cache.set("lock_expired", "owner", expires_in=round(time.time()) - 1)
+        assert CacheLock(cache, "expired").acquire()
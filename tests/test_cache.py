@@ -0,0 +1,323 @@
+import fnmatch
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pytest
+import requests
+
+from pysilpo.client import Silpo
+from pysilpo.utils import cache as cache_module
+from pysilpo.utils.cache import FileSystemCache, MemoryCache, RedisCache, SQLiteCache, TieredCache, get_cache
+from pysilpo.utils.response_cache import CachePolicy, ResponseCache
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    # Every test gets its own process-wide cache in its own home directory
+    monkeypatch.setattr(cache_module, "_shared_cache", None)
+    return tmp_path
+
+
+def make_response(content: bytes, status_code: int = 200) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+class Sender:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self) -> requests.Response:
+        self.calls += 1
+        return make_response(f"response-{self.calls}".encode())
+
+
+class TestResponseCache:
+    def test_make_key(self):
+        key = ResponseCache.make_key("GET", "https://silpo.ua", params={"b": 1, "a": 2})
+        assert key == ResponseCache.make_key("get", "https://silpo.ua", params={"a": 2, "b": 1})
+        assert key != ResponseCache.make_key("GET", "https://silpo.ua", params={"a": 2, "b": 2})
+        assert key != ResponseCache.make_key("POST", "https://silpo.ua", params={"a": 2, "b": 1}, json_data={})
+
+    def test_fresh(self):
+        cache = ResponseCache(policies={"test": 60})
+        send = Sender()
+        key = cache.make_key("GET", "https://silpo.ua")
+
+        assert cache.fetch("test", key, send).content == b"response-1"
+        assert cache.fetch("test", key, send).content == b"response-1"
+        assert send.calls == 1
+
+        assert cache.fetch("test", key, send, bypass_cache=True).content == b"response-2"
+        assert cache.fetch("test", key, send).content == b"response-2"
+
+    def test_not_cached_endpoint(self):
+        cache = ResponseCache()
+        send = Sender()
+        key = cache.make_key("GET", "https://silpo.ua")
+
+        cache.fetch("product.all", key, send)
+        cache.fetch(None, key, send)
+        assert send.calls == 2
+
+    def test_errors_are_not_cached(self):
+        cache = ResponseCache(policies={"test": 60})
+        key = cache.make_key("GET", "https://silpo.ua")
+
+        assert cache.fetch("test", key, lambda: make_response(b"", status_code=500)).status_code == 500
+        assert cache.get(key) is None
+
+    def test_stale_while_revalidate(self):
+        cache = ResponseCache(policies={"test": CachePolicy(ttl=0, stale_ttl=60)})
+        send = Sender()
+        key = cache.make_key("GET", "https://silpo.ua")
+
+        assert cache.fetch("test", key, send).content == b"response-1"
+        # Stale response is returned immediately, the fresh one is fetched in background
+        assert cache.fetch("test", key, send).content == b"response-1"
+        for _ in range(100):
+            if send.calls == 2 and cache.get(key)[1].content == b"response-2":
+                break
+            time.sleep(0.01)
+        assert cache.get(key)[1].content == b"response-2"
+
+
+class TestSQLiteCache:
+    def test_wal(self):
+        cache = SQLiteCache()
+        assert cache.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_expiry(self):
+        cache = SQLiteCache()
+        cache.set("expired", 1, expires_in=int(time.time()) - 1)
+        cache.set("fresh", 2)
+        assert cache.get("expired") is None
+        assert cache.exists("expired")
+        assert cache.get_all() == [("fresh", 2)]
+
+        assert cache.purge_expired() == 1
+        assert not cache.exists("expired")
+
+    def test_many(self):
+        cache = SQLiteCache()
+        cache.set_many({f"key-{i}": i for i in range(600)})
+        cache.set("expired", 1, expires_in=int(time.time()) - 1)
+
+        values = cache.get_many([*(f"key-{i}" for i in range(600)), "expired", "missing"])
+        assert values == {f"key-{i}": i for i in range(600)}
+
+    def test_max_entries(self):
+        cache = SQLiteCache(max_entries=2, sweep_interval=0)
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+        assert [key for key, _ in cache.get_all()] == ["b", "c"]
+
+    def test_threads(self):
+        cache = SQLiteCache()
+
+        def work(i):
+            cache.set(f"key-{i}", i)
+            return cache.get(f"key-{i}")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert list(executor.map(work, range(100))) == list(range(100))
+
+
+class TestMemoryCache:
+    def test_lru_eviction(self):
+        cache = MemoryCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_ttl(self):
+        cache = MemoryCache()
+        cache.set("expired", 1, expires_in=int(time.time()) - 1)
+        cache.set("fresh", 2, expires_in=int(time.time()) + 60)
+        assert cache.get("expired") is None
+        assert cache.get("fresh") == 2
+        assert cache.get_all() == [("fresh", 2)]
+
+
+class TestTieredCache:
+    def test_read_through(self):
+        persistent = SQLiteCache()
+        persistent.set("key", "value", expires_in=int(time.time()) + 60)
+        cache = TieredCache(persistent)
+
+        assert cache.get("key") == "value"
+        # Second read is served from memory
+        persistent.remove("key")
+        assert cache.get("key") == "value"
+
+        cache.remove("key")
+        assert cache.get("key") is None
+
+    def test_memory_ttl(self):
+        persistent = SQLiteCache()
+        cache = TieredCache(persistent, memory_ttl=0)
+        cache.set("key", "value")
+        persistent.set("key", "updated by another process")
+        time.sleep(1)
+        assert cache.get("key") == "updated by another process"
+
+    def test_get_many(self):
+        persistent = SQLiteCache()
+        cache = TieredCache(persistent)
+        cache.set("memory", 1)
+        persistent.set("persistent", 2)
+        assert cache.get_many(["memory", "persistent", "missing"]) == {"memory": 1, "persistent": 2}
+        assert cache.memory.get("persistent") == 2
+
+    def test_shared_cache(self):
+        assert get_cache() is get_cache()
+        get_cache().set("key", "value")
+        assert SQLiteCache().get("key") == "value"
+
+
+class FakeRedis:
+    """Stand-in for redis.Redis which implements only commands used by RedisCache."""
+
+    def __init__(self):
+        self.data: dict[str, tuple[bytes, Optional[int]]] = {}
+
+    def _get(self, key):
+        value, exat = self.data.get(key, (None, None))
+        if exat is not None and exat < time.time():
+            self.data.pop(key)
+            return None
+        return value
+
+    def get(self, key):
+        return self._get(key)
+
+    def mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    def set(self, key, value, exat=None, nx=False):
+        if nx and self._get(key) is not None:
+            return None
+        self.data[key] = (value, exat)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+
+    def pipeline(self, transaction=True):
+        redis = self
+        commands = []
+
+        class Pipeline:
+            def set(self, *args, **kwargs):
+                commands.append((args, kwargs))
+
+            def execute(self):
+                for args, kwargs in commands:
+                    redis.set(*args, **kwargs)
+
+        return Pipeline()
+
+
+@pytest.fixture(params=["memory", "sqlite", "filesystem", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache()
+    if request.param == "sqlite":
+        return SQLiteCache(directory=tmp_path / "sqlite")
+    if request.param == "filesystem":
+        return FileSystemCache(directory=tmp_path / "files")
+    return RedisCache(FakeRedis())
+
+
+class TestCacheBackends:
+    def test_get_set(self, backend):
+        expiry_time = int(time.time()) + 60
+        backend.set("key", {"value": 1}, expires_in=expiry_time)
+        assert backend.get("key") == {"value": 1}
+        assert backend.get_entry("key") == ({"value": 1}, expiry_time)
+        assert backend.get("missing") is None
+
+        backend.set("expired", 1, expires_in=int(time.time()) - 1)
+        assert backend.get("expired") is None
+
+        backend.remove("key")
+        assert backend.get("key") is None
+
+    def test_add(self, backend):
+        assert backend.add("lock", "first", expires_in=int(time.time()) + 60)
+        assert not backend.add("lock", "second", expires_in=int(time.time()) + 60)
+        assert backend.get("lock") == "first"
+
+        backend.set("expired", 1, expires_in=int(time.time()) - 1)
+        assert backend.add("expired", 2)
+        assert backend.get("expired") == 2
+
+    def test_many(self, backend):
+        backend.set_many({"a": 1, "b": 2})
+        assert backend.get_many(["a", "b", "c"]) == {"a": 1, "b": 2}
+
+        backend.clear()
+        assert backend.get_many(["a", "b"]) == {}
+
+    def test_tiered(self, backend):
+        cache = TieredCache(backend)
+        cache.set("key", "value")
+        assert backend.get("key") == "value"
+        backend.remove("key")
+        assert cache.get("key") == "value"
+
+
+class TestRedisCache:
+    def test_prefix(self):
+        client = FakeRedis()
+        client.set("other", b"data")
+        cache = RedisCache(client, prefix="test:")
+        cache.set("key", "value")
+        assert "test:key" in client.data
+
+        cache.clear()
+        assert list(client.data) == ["other"]
+
+    def test_server_side_expiry(self):
+        client = FakeRedis()
+        cache = RedisCache(client)
+        expiry_time = int(time.time()) + 60
+        cache.set("key", "value", expires_in=expiry_time)
+        cache.set("forever", "value")
+        assert client.data["pysilpo:key"][1] == expiry_time
+        assert client.data["pysilpo:forever"][1] is None
+
+
+class TestSilpoCache:
+    def test_custom_backend(self):
+        cache = MemoryCache()
+        silpo = Silpo(cache=cache)
+        assert silpo.cache is cache
+        assert silpo.transport.cache is None
+
+    def test_default_backend(self):
+        silpo = Silpo()
+        assert silpo.cache is get_cache()
+        assert silpo.transport.cache is None
+
+    def test_clear_cache(self):
+        cache = MemoryCache()
+        get_cache().set("shared", "value")
+        silpo = Silpo(cache=cache)
+        silpo.cache.set("token", "value")
+
+        silpo.clear_cache()
+        assert cache.get("token") is None
+        assert get_cache().get("shared") == "value"
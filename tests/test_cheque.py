@@ -0,0 +1,169 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from pysilpo.services.cheque import Cheque, ChequeDetailModel, ChequeModel
+from pysilpo.utils.cheque_store import SQLiteChequeStore
+from pysilpo.utils.rate_limit import RateLimiter
+
+
+def cheque_data(cheque_id: int) -> dict:
+    return {
+        "loyaltyFactId": cheque_id,
+        "sumReg": 100.0,
+        "sumBalance": 1.0,
+        "filialName": "Silpo",
+        "cityName": "Kyiv",
+        "frId": 1,
+        "zId": 1,
+        "frChequeId": 1,
+        "payType": 2,
+        "filId": 10,
+        "chequeId": cheque_id,
+        "created": "2024-08-19T10:00:00",
+        "fiscalNumber": "123",
+        "businessCardId": 1,
+        "externalOperationId": "abc",
+    }
+
+
+class FakeCheque(Cheque):
+    def __init__(self):
+        super().__init__(SimpleNamespace(access_token="token", transport=None))  # noqa: S106
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get_detail(self, cheque_id: int, created: datetime, fill_id: int, loyalty_fact_id: int, records=False):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        return f"detail-{cheque_id}"
+
+
+class TestChequeDetails:
+    def test_get_details(self):
+        service = FakeCheque()
+        cheques = [ChequeModel(**cheque_data(i), cheque_service=service) for i in range(10)]
+
+        assert service.get_details(cheques, max_workers=4) == cheques
+        assert [cheque.detail for cheque in cheques] == [f"detail-{i}" for i in range(10)]
+        assert 1 < service.max_in_flight <= 4
+
+    def test_skip_cheques_with_details(self):
+        service = FakeCheque()
+        cheque = ChequeModel(**cheque_data(1), cheque_service=service).set_detail("cached")
+
+        service.get_details([cheque])
+        assert cheque.detail == "cached"
+
+
+class WindowsCheque(FakeCheque):
+    """Returns one cheque per window, the oldest window repeats the previous one like Silpo API does."""
+
+    def __init__(self, date_from: datetime, date_to: datetime):
+        super().__init__()
+        self.all_windows = Cheque._windows(date_from, date_to)
+        self.windows = []
+
+    def _fetch_headers(self, date_start: datetime, date_end: datetime, page_size: int, row_number: int):
+        with self.lock:
+            self.windows.append((date_start, date_end))
+        time.sleep(0.01)
+        window_index = min(self.all_windows.index((date_start, date_end)), len(self.all_windows) - 2)
+        return [cheque_data(window_index)]
+
+
+class TestChequeWindows:
+    date_from = datetime(2020, 1, 1)
+    date_to = datetime(2024, 12, 31)
+
+    def test_windows(self):
+        windows = Cheque._windows(self.date_from, self.date_to)
+        assert windows[0] == (datetime(2024, 9, 30), self.date_to)
+        assert all(window[0] >= self.date_from for window in windows)
+        assert all(earlier[0] > later[1] for earlier, later in zip(windows, windows[1:]))
+
+    def test_concurrent_windows(self):
+        sequential = WindowsCheque(self.date_from, self.date_to)
+        expected = [cheque.cheque_id for cheque in sequential.all(self.date_from, self.date_to)]
+
+        concurrent = WindowsCheque(self.date_from, self.date_to)
+        result = [cheque.cheque_id for cheque in concurrent.all(self.date_from, self.date_to, window_workers=4)]
+
+        assert result == expected == list(range(len(concurrent.all_windows) - 1))
+        assert sorted(concurrent.windows) == sorted(concurrent.all_windows)
+
+
+class SyncCheque(FakeCheque):
+    def __init__(self, headers: list[dict]):
+        super().__init__()
+        self.user.phone_number = "+380123456789"
+        self.headers = headers
+        self.requested_date_from = []
+        self.detail_ids = []
+
+    def all(self, date_from=None, date_to=None, **kwargs):
+        self.requested_date_from.append(date_from)
+        for header in self.headers:
+            yield ChequeModel(**header, cheque_service=self)
+
+    def get_detail(self, cheque_id: int, created: datetime, fill_id: int, loyalty_fact_id: int, records=False):
+        with self.lock:
+            self.detail_ids.append(cheque_id)
+        return ChequeDetailModel(
+            chequeHeader=cheque_data(cheque_id),
+            sumDiscount=0,
+            chequeLines=[],
+            chequeActions=[],
+            chPrediction="",
+            sumCashback=0,
+        )
+
+
+class TestChequeSync:
+    def test_sync(self, tmp_path):
+        store = SQLiteChequeStore(directory=tmp_path)
+        service = SyncCheque([{**cheque_data(i), "created": f"2024-08-{i:02}T10:00:00"} for i in (2, 1)])
+
+        assert [cheque.cheque_id for cheque in service.sync(store)] == [2, 1]
+        assert store.get_high_water_mark(service.user.phone_number) == (datetime(2024, 8, 2, 10), 2)
+        assert sorted(service.detail_ids) == [1, 2]
+
+        # Only the new cheque is stored and its detail fetched
+        service.headers.insert(0, {**cheque_data(3), "created": "2024-08-03T10:00:00"})
+        assert [cheque.cheque_id for cheque in service.sync(store)] == [3]
+        assert service.requested_date_from[-1] == datetime(2024, 8, 2, 10)
+        assert sorted(service.detail_ids) == [1, 2, 3]
+
+        cheques = service.from_store(store)
+        assert [cheque.cheque_id for cheque in cheques] == [3, 2, 1]
+        assert all(cheque.has_detail for cheque in cheques)
+
+    def test_sync_missing_details(self, tmp_path):
+        store = SQLiteChequeStore(directory=tmp_path)
+        service = SyncCheque([cheque_data(1)])
+        service.sync(store, with_details=False)
+        assert service.detail_ids == []
+
+        assert service.sync(store) == []
+        assert service.detail_ids == [1]
+
+
+class TestRateLimiter:
+    def test_burst(self):
+        limiter = RateLimiter(rate=1, burst=2)
+        assert limiter.try_acquire() == 0
+        assert limiter.try_acquire() == 0
+        assert 0 < limiter.try_acquire() <= 1
+
+    def test_acquire_waits(self):
+        limiter = RateLimiter(rate=50)
+        started_at = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        assert time.monotonic() - started_at >= 3 / 50 * 0.9
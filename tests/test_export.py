@@ -0,0 +1,115 @@
+import csv
+import json
+from pathlib import Path
+
+import pytest
+
+from pysilpo.services.cheque import ChequeDetailModel, ChequeModel
+from pysilpo.services.product import ProductModel
+from pysilpo.services.store import StoreModel
+from pysilpo.utils import export
+from pysilpo.utils.cursor import Cursor
+from pysilpo.utils.exceptions import SilpoException
+from pysilpo.utils.models import record
+from tests.test_cheque import cheque_data
+from tests.test_product import make_product
+from tests.test_store import make_store
+
+
+def read_csv(path: Path) -> list[dict]:
+    with path.open(newline="", encoding="utf-8") as file:
+        return list(csv.DictReader(file))
+
+
+def product_cursor(count: int, page_size: int) -> Cursor[ProductModel]:
+    def generator(_offset: int):
+        products = []
+        for i in range(_offset, min(_offset + page_size, count)):
+            product = make_product(i, "branch-1", 10.5)
+            product["promotions"] = [{"id": i, "title": "-10%"}]
+            products.append(ProductModel(**product))
+        return products, count
+
+    return Cursor(generator=generator, page_size=page_size)
+
+
+def cheque_with_detail(cheque_id: int) -> ChequeModel:
+    cheque = ChequeModel(**cheque_data(cheque_id))
+    line = {
+        "lagerId": 100,
+        "lagerNameUA": "Молоко",
+        "lagerUnit": "шт",
+        "kolvo": 2,
+        "priceOut": 40.5,
+        "unitText": "шт",
+    }
+    detail = {
+        "chequeHeader": cheque_data(cheque_id),
+        "sumDiscount": 0,
+        "chequeLines": [{**line, "chequeLineId": 1}, {**line, "chequeLineId": 2}],
+        "chequeActions": [{"actionType": 1, "actionId": 5}],
+        "chPrediction": "",
+        "sumCashback": 0,
+    }
+    return cheque.set_detail(ChequeDetailModel(**detail))
+
+
+class TestExport:
+    def test_columns(self):
+        names = [name for name, _, _ in export.columns(StoreModel)]
+        assert [name for name in names if name.startswith("city.")] == ["city.id", "city.title", "city.slug"]
+        assert "active_hours" in names
+
+    def test_cursor_to_csv(self, tmp_path):
+        cursor = product_cursor(count=25, page_size=10)
+
+        assert cursor.to_csv(tmp_path / "products.csv") == 25
+        rows = read_csv(tmp_path / "products.csv")
+        assert [row["external_product_id"] for row in rows] == [str(i) for i in range(25)]
+        assert json.loads(rows[3]["promotions"]) == [{"id": 3, "title": "-10%"}]
+        assert rows[0]["price"] == "10.5"
+        # Pages are streamed, not kept in the cursor
+        assert cursor.pages == {}
+
+    def test_nested_model(self, tmp_path):
+        stores = [StoreModel(**make_store(i)) for i in range(3)]
+
+        export.to_csv(stores, tmp_path / "stores.csv")
+        rows = read_csv(tmp_path / "stores.csv")
+        assert rows[0]["city.slug"] == "kyiv"
+        assert json.loads(rows[0]["active_hours"]) == {"start": "08:00", "end": "22:00"}
+
+    def test_cheque_positions(self, tmp_path):
+        cheques = (cheque_with_detail(i) for i in range(3))
+
+        assert export.to_csv(cheques, tmp_path / "positions.csv", rows="positions") == 6
+        rows = read_csv(tmp_path / "positions.csv")
+        assert [(row["cheque.cheque_id"], row["cheque_line_id"]) for row in rows[:2]] == [("0", "1"), ("0", "2")]
+        assert rows[0]["cheque.created"] == "2024-08-19T10:00:00"
+
+        records = list(export.iter_records([cheque_with_detail(1)], rows="actions"))
+        assert records[0]["cheque.cheque_id"] == 1
+        assert records[0]["action_id"] == 5
+
+    def test_positions_of_not_cheques(self, tmp_path):
+        with pytest.raises(SilpoException):
+            export.to_csv(product_cursor(count=1, page_size=1), tmp_path / "products.csv", rows="positions")
+
+    def test_empty(self, tmp_path):
+        assert export.to_csv([], tmp_path / "empty.csv") == 0
+
+    def test_parquet(self, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        cursor = product_cursor(count=25, page_size=10)
+
+        assert cursor.to_parquet(tmp_path / "products.parquet", batch_size=10) == 25
+        table = pq.read_table(tmp_path / "products.parquet")
+        assert table.column("external_product_id").to_pylist() == list(range(25))
+        assert cursor.to_arrow().num_rows == 25
+
+    def test_records(self, tmp_path):
+        stores = [record(StoreModel, make_store(i)) for i in range(3)]
+
+        export.to_csv(stores, tmp_path / "records.csv")
+        export.to_csv([StoreModel(**make_store(i)) for i in range(3)], tmp_path / "models.csv")
+        assert read_csv(tmp_path / "records.csv") == read_csv(tmp_path / "models.csv")
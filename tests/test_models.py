@@ -0,0 +1,112 @@
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from pysilpo.services.cheque import Cheque, ChequeDetailModel, ChequeModel
+from pysilpo.services.product import Product, ProductModel
+from pysilpo.services.store import Store, StoreModel
+from pysilpo.utils.enums import PayTypeEnum
+from pysilpo.utils.models import ModelParser, construct, record
+from tests.test_cheque import cheque_data
+from tests.test_product import FakeProductsTransport, make_product
+from tests.test_store import FakeGraphQLTransport, make_store
+
+
+class TestConstruct:
+    @pytest.mark.parametrize(
+        ("model", "data"),
+        [
+            (ProductModel, make_product(1, "branch-1", 10.5)),
+            (StoreModel, make_store(1)),
+            (ChequeModel, cheque_data(1)),
+        ],
+    )
+    def test_same_as_validation(self, model, data):
+        assert construct(model, data) == model(**data)
+
+    def test_nested_models(self):
+        store = construct(StoreModel, make_store(1), store_service=Store)
+
+        assert store.city.slug == "kyiv"
+        assert store._store_service is Store
+        assert store.city._store_service is Store
+
+    def test_conversions(self):
+        cheque = construct(ChequeModel, cheque_data(1))
+
+        assert cheque.created.year == 2024
+        assert isinstance(cheque.pay_type, PayTypeEnum)
+        assert not cheque.has_detail
+
+
+class TestModelParser:
+    def test_validate_sample(self):
+        data = {**make_product(1, "branch-1", 10.5), "price": "free"}
+
+        # Not validated, the payload is trusted
+        assert ModelParser(trusted=True, validate_sample=0).parse(ProductModel, data).price == "free"
+        with pytest.raises(ValidationError):
+            ModelParser(trusted=True, validate_sample=1).parse(ProductModel, data)
+        with pytest.raises(ValidationError):
+            ModelParser().parse(ProductModel, data)
+
+    def test_trusted_stores(self):
+        store_service = Store.bind(FakeGraphQLTransport())
+
+        assert list(store_service.all(trusted=True)) == list(store_service.all())
+
+    def test_items_per_second(self):
+        def items_per_second(parser: ModelParser, model: type, items: list[dict], **services) -> float:
+            parser.parse_many(model, items[:10], **services)  # Warm up, e.g. the plan of construct(...)
+            best = 0.0
+            for _ in range(5):
+                # CPU time of this thread, background threads of other tests don't count
+                started = time.thread_time()
+                parser.parse_many(model, items, **services)
+                best = max(best, len(items) / (time.thread_time() - started))
+            return best
+
+        stores = [make_store(i) for i in range(1000)]
+        # Trusted mode pays off for nested models with custom __init__
+        assert items_per_second(ModelParser(trusted=True), StoreModel, stores, store_service=Store) > items_per_second(
+            ModelParser(), StoreModel, stores, store_service=Store
+        )
+
+
+class TestRecord:
+    def test_fields(self):
+        store = record(StoreModel, make_store(1))
+
+        assert type(store).__name__ == "StoreRecord"
+        assert store._fields == tuple(StoreModel.model_fields)
+        assert store.city.slug == "kyiv"
+        assert not hasattr(store, "__dict__")
+
+    def test_to_model(self):
+        store = record(StoreModel, make_store(1)).to_model(store_service=Store)
+
+        assert store == StoreModel(**make_store(1), store_service=Store)
+        assert store.city._store_service is Store
+
+    def test_records_cursor(self):
+        product_service = Product.bind(FakeProductsTransport())
+
+        products = list(product_service.all(branch_id="branch-1", search="молоко", limit=2, records=True))
+        assert [product.external_product_id for product in products] == [0, 1, 2, 3, 4]
+        assert products[0].to_model() == ProductModel(**make_product(0, "branch-1", 11))
+
+    def test_cheque_positions(self):
+        line = {"chequeLineId": 1, "lagerId": 100, "lagerNameUA": "Молоко", "lagerUnit": "шт", "kolvo": 2}
+        data = {
+            "chequeHeader": cheque_data(1),
+            "sumDiscount": 0,
+            "chequeLines": [{**line, "priceOut": 40.5, "unitText": "шт"}],
+            "chequeActions": [],
+            "chPrediction": "",
+            "sumCashback": 0,
+        }
+
+        (position,) = Cheque._detail_model(data, records=True).positions
+        assert (position.lager_id, position.count, position.sum_cashback_line) == (100, 2, 0.0)
+        assert position.to_model() == ChequeDetailModel(**data).positions[0]
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Optional
+
+import pytest
+import requests
+
+from pysilpo.services.product import AsyncProduct, Product
+from pysilpo.utils.checkpoint import CrawlCheckpoint
+from pysilpo.utils.exceptions import SilpoException, SilpoRequestException
+
+
+def make_product(i: int, branch_id: str, price: float) -> dict:
+    return {
+        "id": f"product-{i}",
+        "title": f"Product {i}",
+        "icon": "icon.png",
+        "price": price,
+        "oldPrice": None,
+        "offerId": f"offer-{i}",
+        "ratio": "1 шт",
+        "sectionSlug": "milk",
+        "companyId": "company",
+        "branchId": branch_id,
+        "externalProductId": i,
+        "promotions": [],
+        "specialPrices": [],
+        "createdAt": "2024-08-01T10:00:00",
+        "slug": f"product-{i}",
+        "addToBasketStep": 1,
+        "stock": 10,
+        "displayPrice": price,
+        "displayOldPrice": None,
+        "displayRatio": "1 шт",
+        "guestProductRating": None,
+        "guestProductRatingCount": None,
+        "classifierSapId": None,
+        "originType": None,
+        "brandId": None,
+        "brandTitle": None,
+        "weighted": False,
+        "blurForUnderAged": False,
+    }
+
+
+class FakeProductsTransport:
+    """Every branch has products 0..4, except branch-2 which doesn't have product 4, prices differ by branch."""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _products(self, url: str, params: dict) -> dict:
+        branch_id = url.split("/branches/")[1].split("/", maxsplit=1)[0]
+        count = 4 if branch_id == "branch-2" else 5
+        price_delta = int(branch_id.split("-")[1])
+        offset, limit = params["offset"], params["limit"]
+        items = [make_product(i, branch_id, 10 + i + price_delta) for i in range(offset, min(offset + limit, count))]
+        return {"items": items, "total": count}
+
+    def get(self, url, params, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(self._products(url, params)).encode()
+        return response
+
+
+class FakeAsyncProductsTransport(FakeProductsTransport):
+    async def get(self, url, params, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(self._products(url, params)).encode()
+        response.is_success = True
+        return response
+
+
+def check_comparison(comparison):
+    assert sorted(comparison) == [0, 1, 2, 3, 4]
+    assert {branch_id: offer.price for branch_id, offer in comparison[1].offers.items()} == {
+        "branch-1": 12,
+        "branch-2": 13,
+        "branch-3": 14,
+    }
+    assert sorted(comparison[4].offers) == ["branch-1", "branch-3"]
+
+
+class TestCompare:
+    @pytest.mark.parametrize("query_or_slugs", ["молоко", ["milk"]])
+    def test_compare(self, query_or_slugs):
+        product_service = Product.bind(FakeProductsTransport())
+
+        check_comparison(product_service.compare(query_or_slugs, ["branch-1", "branch-2", "branch-3"], limit=2))
+
+    def test_adaptive(self):
+        product_service = Product.bind(FakeProductsTransport())
+
+        check_comparison(
+            product_service.compare("молоко", ["branch-1", "branch-2", "branch-3"], limit=1, adaptive=True)
+        )
+
+    def test_max_per_host(self):
+        transport = FakeProductsTransport(delay=0.01)
+        product_service = Product.bind(transport)
+
+        branch_ids = [f"branch-{i}" for i in range(1, 9)]
+        product_service.compare("молоко", branch_ids, max_workers=8, max_per_host=2, limit=2)
+        assert transport.max_in_flight == 2
+
+    def test_async_compare(self):
+        transport = FakeAsyncProductsTransport(delay=0.01)
+        product_service = AsyncProduct.bind(transport)
+
+        comparison = asyncio.run(
+            product_service.compare("молоко", ["branch-1", "branch-2", "branch-3"], max_workers=2, limit=2)
+        )
+        check_comparison(comparison)
+        assert transport.max_in_flight == 2
+
+    def test_async_adaptive(self):
+        product_service = AsyncProduct.bind(FakeAsyncProductsTransport())
+
+        comparison = asyncio.run(
+            product_service.compare("молоко", ["branch-1", "branch-2", "branch-3"], limit=1, adaptive=True)
+        )
+        check_comparison(comparison)
+
+
+class FakeCatalogTransport:
+    """
+    Categories "a" (products 0..4) and "b" (products 3..8), the request number `fail_on` returns 429.
+    Pages have at most `max_page` products, whatever limit is requested.
+    """
+
+    def __init__(self, fail_on: Optional[int] = None, max_page: int = 1000):
+        self.fail_on = fail_on
+        self.max_page = max_page
+        self.requests = []
+
+    def get(self, url, params, **kwargs):
+        self.requests.append(params)
+        response = requests.Response()
+        response.status_code = 200
+        if len(self.requests) == self.fail_on:
+            response.status_code = 429
+            response._content = b"Too Many Requests"
+        elif url.endswith("/categories"):
+            items = [make_category(slug) for slug in ("a", "b")]
+            response._content = json.dumps({"items": items, "total": 2}).encode()
+        else:
+            ids = range(5) if params["category"] == "a" else range(3, 9)
+            page = list(ids)[params["offset"] : params["offset"] + min(params["limit"], self.max_page)]
+            items = [make_product(i, "branch-1", 10) for i in page]
+            response._content = json.dumps({"items": items, "total": len(ids)}).encode()
+        return response
+
+
+class FakeAsyncCatalogTransport(FakeCatalogTransport):
+    async def get(self, url, params, **kwargs):
+        response = super().get(url, params, **kwargs)
+        response.is_success = response.ok
+        return response
+
+
+def make_category(slug: str) -> dict:
+    return {
+        "id": slug,
+        "slug": slug,
+        "parentId": None,
+        "title": slug,
+        "media": {},
+        "tileSize": {},
+        "order": 0,
+        "visibility": True,
+        "updatedAt": "2024-08-01T10:00:00",
+    }
+
+
+class TestCrawl:
+    def test_deduplicate(self):
+        product_service = Product.bind(FakeCatalogTransport())
+
+        products = list(product_service.crawl("branch-1", limit=2))
+        assert [product.external_product_id for product in products] == list(range(9))
+
+    def test_resume(self, tmp_path):
+        checkpoint = tmp_path / "crawl.json"
+        # Categories, a[0:2], a[2:4], a[4:6], b[0:2], b[2:4] fails
+        product_service = Product.bind(FakeCatalogTransport(fail_on=6))
+
+        products = []
+        with pytest.raises(SilpoRequestException):
+            for product in product_service.crawl("branch-1", checkpoint=checkpoint, limit=2):
+                products.append(product)
+        assert [product.external_product_id for product in products] == [0, 1, 2, 3, 4]
+        assert json.loads(checkpoint.read_text())["offsets"] == {"b": 2}
+        # Every save appends only the IDs of its page
+        assert (tmp_path / "crawl.json.seen").read_text().split() == ["0", "1", "2", "3", "4"]
+
+        transport = FakeCatalogTransport()
+        products = list(Product.bind(transport).crawl("branch-1", checkpoint=checkpoint, limit=2))
+        assert [product.external_product_id for product in products] == [5, 6, 7, 8]
+        assert [params.get("offset") for params in transport.requests[1:]] == [2, 4]
+        assert not checkpoint.exists()
+        assert not (tmp_path / "crawl.json.seen").exists()
+
+    def test_async_crawl(self):
+        product_service = AsyncProduct.bind(FakeAsyncCatalogTransport())
+
+        async def crawl():
+            return [product.external_product_id async for product in product_service.crawl("branch-1", limit=2)]
+
+        assert asyncio.run(crawl()) == list(range(9))
+
+    def test_async_categories(self):
+        product_service = AsyncProduct.bind(FakeAsyncCatalogTransport())
+
+        async def products():
+            category = await product_service.categories("branch-1").__anext__()
+            return [product.external_product_id async for product in category.products]
+
+        assert asyncio.run(products()) == list(range(5))
+
+    def test_adaptive(self):
+        transport = FakeCatalogTransport()
+        products = list(Product.bind(transport).crawl("branch-1", limit=1, adaptive=True))
+
+        assert [product.external_product_id for product in products] == list(range(9))
+        # a[0:1], a[1:3], a[3:7], then b[0:8] continues with the page size of "a"
+        assert [params.get("limit") for params in transport.requests[1:]] == [1, 2, 4, 8]
+
+    def test_capped_pages(self):
+        transport = FakeCatalogTransport(max_page=2)
+        products = list(Product.bind(transport).crawl("branch-1", limit=1, adaptive=True))
+
+        assert [product.external_product_id for product in products] == list(range(9))
+
+    def test_checkpoint_of_another_branch(self, tmp_path):
+        checkpoint = tmp_path / "crawl.json"
+        CrawlCheckpoint(checkpoint, "branch-1").save()
+        with pytest.raises(SilpoException):
+            next(Product.bind(FakeCatalogTransport()).crawl("branch-2", checkpoint=checkpoint))
+
+
+class TestProductCursor:
+    def test_count(self):
+        transport = FakeCatalogTransport()
+        cursor = Product.bind(transport).all(branch_id="branch-1", category_slug="b", limit=2)
+
+        assert cursor.count() == 6
+        assert cursor[-2:] == [cursor[4], cursor[5]]
+        assert [(params["offset"], params["limit"]) for params in transport.requests] == [(0, 1), (4, 2)]
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import re
+import threading
+
+import pytest
+import requests
+
+from pysilpo.services.store import AsyncStore, Store, StoreModel
+from pysilpo.utils.cursor import AsyncCursor
+from pysilpo.utils.exceptions import SilpoException, SilpoRequestException
+
+TOTAL_STORES = 950
+
+
+def make_store(i: int) -> dict:
+    return {
+        "id": f"store-{i}",
+        "images": [],
+        "electricityState": 1,
+        "isDesigned": False,
+        "isLesilpo": False,
+        "filial_id": 1000 + i,
+        "link": None,
+        "title": f"Store {i}",
+        "premium": False,
+        "mapLink": None,
+        "slug": f"store-{i}",
+        "active": True,
+        "cacheAmount": 0,
+        "terminalEnabled": True,
+        "withGenerator": True,
+        "withWifi": False,
+        "withStarlink": False,
+        "activeHours": {"start": "08:00", "end": "22:00"},
+        "filialType": "supermarket",
+        "location": {"lat": 50.45, "lng": 30.52},
+        "city": {"id": "1", "title": "Київ", "slug": "kyiv"},
+        "updatedAt": None,
+    }
+
+
+class FakeGraphQLTransport:
+    """Answers stores query from the multipart body like GraphQL server does, including aliases."""
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _page(paging_info: dict) -> dict:
+        offset, limit = paging_info["offset"], paging_info["limit"]
+        items = [make_store(i) for i in range(offset, min(offset + limit, TOTAL_STORES))]
+        return {"limit": limit, "offset": offset, "count": TOTAL_STORES, "items": items}
+
+    def post(self, url, headers, data, **kwargs):
+        boundary = headers["Content-Type"].split("boundary=")[1]
+        fields = {}
+        for part in data.split(f"--{boundary}")[1:-1]:
+            name, value = re.match(
+                r'\r\nContent-Disposition: form-data; name="(\w+)"\r\n\r\n(.*)\r\n', part, re.S
+            ).groups()
+            fields[name] = value
+        variables = json.loads(fields["variables"])
+        with self.lock:
+            self.requests.append(variables)
+
+        if "pagingInfo" in variables:
+            result = {"stores": self._page(variables["pagingInfo"])}
+        else:
+            aliases = re.findall(r"(page\d+): stores\(", fields["query"])
+            result = {alias: self._page(variables[alias]) for alias in aliases}
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"data": result}).encode()
+        return response
+
+
+class FakeBranchesTransport(FakeGraphQLTransport):
+    def __init__(self):
+        super().__init__()
+        self.branch_requests = []
+
+    def get(self, url, params, **kwargs):
+        filial_ids = params["filialIds[]"]
+        with self.lock:
+            self.branch_requests.append(filial_ids)
+        items = [
+            {"branchId": f"branch-{filial_id}", "companyId": "company", "filialId": str(filial_id)}
+            for filial_id in filial_ids
+            if filial_id < 1000 + TOTAL_STORES
+        ]
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"items": items}).encode()
+        return response
+
+
+class FakeAsyncBranchesTransport(FakeBranchesTransport):
+    async def post(self, url, headers, content, **kwargs):
+        response = super().post(url, headers, content)
+        response.is_success = response.ok
+        return response
+
+    async def get(self, url, params, **kwargs):
+        return super().get(url, params)
+
+
+@pytest.fixture()
+def transport():
+    return FakeGraphQLTransport()
+
+
+class TestStoreAll:
+    def test_pages_have_own_offsets(self, transport):
+        stores = list(Store.bind(transport).all())
+
+        assert [store.id for store in stores] == [f"store-{i}" for i in range(TOTAL_STORES)]
+        assert [request["pagingInfo"]["offset"] for request in transport.requests] == [0, 400, 800]
+
+    def test_batched_pages(self, transport):
+        stores = list(Store.bind(transport).all(pages_per_request=3))
+
+        assert len({store.id for store in stores}) == TOTAL_STORES
+        assert len(transport.requests) == 1
+        assert [transport.requests[0][f"page{i}"]["offset"] for i in range(3)] == [0, 400, 800]
+
+    def test_prefetch(self, transport):
+        stores = list(Store.bind(transport).all(limit=100, prefetch=4))
+
+        assert [store.id for store in stores] == [f"store-{i}" for i in range(TOTAL_STORES)]
+        assert sorted(request["pagingInfo"]["offset"] for request in transport.requests) == list(range(0, 1000, 100))
+
+
+class TestResolveBranchIds:
+    @pytest.fixture(autouse=True)
+    def branch_ids(self, monkeypatch):
+        monkeypatch.setattr(Store, "_branch_ids", {})
+
+    def test_bulk(self):
+        transport = FakeBranchesTransport()
+        store_service = Store.bind(transport)
+        stores = store_service.all()
+
+        branch_ids = store_service.resolve_branch_ids(stores, chunk_size=400)
+        assert len(branch_ids) == TOTAL_STORES
+        assert sorted(len(chunk) for chunk in transport.branch_requests) == [150, 400, 400]
+
+        # Resolved IDs are shared, so branch_id of any store doesn't send requests
+        assert stores[10].branch_id == "branch-1010"
+        assert Store.resolve_branch_ids([1000, 1001]) == {1000: "branch-1000", 1001: "branch-1001"}
+        assert len(transport.branch_requests) == 3
+        # Cursor is still iterated from the beginning
+        assert next(stores).id == "store-0"
+
+    def test_records(self):
+        transport = FakeBranchesTransport()
+        store_service = Store.bind(transport)
+
+        branch_ids = store_service.resolve_branch_ids(store_service.all(records=True), chunk_size=400)
+        assert len(branch_ids) == TOTAL_STORES
+        assert branch_ids[1010] == "branch-1010"
+
+    def test_not_found(self):
+        transport = FakeBranchesTransport()
+        store_service = Store.bind(transport)
+        assert store_service.resolve_branch_ids([1000, 5000]) == {1000: "branch-1000"}
+
+        store = StoreModel(**{**make_store(0), "filial_id": 5000}, store_service=store_service)
+        with pytest.raises(SilpoRequestException):
+            _ = store.branch_id
+
+    def test_async(self):
+        transport = FakeAsyncBranchesTransport()
+        store_service = AsyncStore.bind(transport)
+
+        async def resolve():
+            stores = [store async for store in store_service.all()]
+            with pytest.raises(SilpoException):
+                _ = stores[0].branch_id
+            await stores[0]._store_service.resolve_branch_ids(stores[:5])
+            return stores
+
+        stores = asyncio.run(resolve())
+        # Resolved by the async service, the sync one would send another request
+        assert [store.branch_id for store in stores[:5]] == [f"branch-{1000 + i}" for i in range(5)]
+        assert len(transport.branch_requests) == 1
+        assert isinstance(stores[0].city.stores, AsyncCursor)
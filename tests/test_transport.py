@@ -0,0 +1,360 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional, Union
+
+import pytest
+import requests
+
+from pysilpo.services.product import Product
+from pysilpo.utils.cache import MemoryCache
+from pysilpo.utils.circuit_breaker import CircuitBreaker, CircuitState
+from pysilpo.utils.exceptions import SilpoCircuitOpenException
+from pysilpo.utils.hedging import HedgePolicy
+from pysilpo.utils.rate_limit import HostRateLimiter
+from pysilpo.utils.response_cache import ResponseCache
+from pysilpo.utils.retry import RetryPolicy
+from pysilpo.utils.transport import AsyncTransport, Transport, get_default_transport
+
+
+class TestTransport:
+    def test_sessions_share_connection_pools(self):
+        transport = Transport(pool_size=4, pool_sizes={"graphql.silpo.ua": 16})
+        session = transport.new_session()
+
+        url = "https://graphql.silpo.ua/graphql"
+        assert session is not transport.session
+        assert session.get_adapter(url) is transport.session.get_adapter(url)
+        assert session.get_adapter(url)._pool_maxsize == 16
+        assert session.get_adapter("https://sf-ecom-api.silpo.ua/v1")._pool_maxsize == 4
+
+    def test_compression(self):
+        assert "gzip" in Transport().session.headers["Accept-Encoding"]
+        assert Transport(compression=False).session.headers["Accept-Encoding"] == "identity"
+
+    def test_bind_service(self):
+        transport = Transport()
+        bound = Product.bind(transport)
+
+        assert issubclass(bound, Product)
+        assert bound.get_transport() is transport
+        assert Product.get_transport() is get_default_transport()
+
+
+def make_response(status: int, headers: Optional[dict] = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = b"{}"
+    response.raw = io.BytesIO(response._content)
+    return response
+
+
+class FakeSession:
+    """Returns the given responses (or raises the given errors) one by one."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        result = self.results[self.calls]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestRetry:
+    URL = "https://loyalty-platform-public-api.silpo.ua/api/v1/profile/my/cheque/cheque-info"
+
+    @staticmethod
+    def send(method: str, *results, **kwargs) -> tuple[Union[requests.Response, Exception], FakeSession]:
+        transport = Transport(retry=RetryPolicy(retries=2, backoff=0))
+        session = FakeSession(*results)
+        try:
+            return transport.request(method, TestRetry.URL, session=session, **kwargs), session
+        except requests.RequestException as e:
+            return e, session
+
+    def test_get(self):
+        resp, session = self.send("GET", make_response(503), make_response(502), make_response(200))
+        assert (resp.status_code, session.calls) == (200, 3)
+
+        # Retries are exhausted, the last response is returned
+        resp, session = self.send("GET", make_response(500), make_response(500), make_response(500))
+        assert (resp.status_code, session.calls) == (500, 3)
+
+        resp, session = self.send("GET", make_response(404))
+        assert (resp.status_code, session.calls) == (404, 1)
+
+    def test_post(self):
+        # The server could process the request, so it's not retried
+        resp, session = self.send("POST", make_response(500), make_response(200))
+        assert (resp.status_code, session.calls) == (500, 1)
+        error, session = self.send("POST", requests.ReadTimeout(), make_response(200))
+        assert (type(error), session.calls) == (requests.ReadTimeout, 1)
+
+        # The server didn't process the request
+        resp, session = self.send("POST", make_response(429), make_response(200))
+        assert (resp.status_code, session.calls) == (200, 2)
+        resp, session = self.send("POST", requests.ConnectTimeout(), make_response(200))
+        assert (resp.status_code, session.calls) == (200, 2)
+
+        resp, session = self.send(
+            "POST", make_response(500), requests.ReadTimeout(), make_response(200), idempotent=True
+        )
+        assert (resp.status_code, session.calls) == (200, 3)
+
+    def test_retry_after(self):
+        retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+
+        assert RetryPolicy.parse_retry_after({"Retry-After": "2"}) == 2
+        assert 25 < RetryPolicy.parse_retry_after({"Retry-After": retry_at}) <= 30
+        assert RetryPolicy.parse_retry_after({"Retry-After": "soon"}) is None
+
+        policy = RetryPolicy(max_retry_after=10)
+        assert policy.response_delay(0, 429, {"Retry-After": "3"}, idempotent=False) == 3
+        # Waiting that long is worse than failing
+        assert policy.response_delay(0, 429, {"Retry-After": "30"}, idempotent=False) is None
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+
+        assert [RetryPolicy(backoff=1, jitter=False).backoff_delay(attempt) for attempt in range(3)] == [1, 2, 4]
+        assert all(2 <= policy.backoff_delay(2) <= 4 for _ in range(100))
+        assert all(2.5 <= policy.backoff_delay(10) <= 5 for _ in range(100))
+
+    def test_429_pauses_host(self):
+        transport = Transport(retry=RetryPolicy(retries=1))
+        session = FakeSession(make_response(429, {"Retry-After": "0.1"}), make_response(200))
+
+        started_at = time.monotonic()
+        assert transport.request("GET", self.URL, session=session).status_code == 200
+        assert time.monotonic() - started_at >= 0.1
+        # Other workers wait for the host too, not only the one which got 429
+        assert "loyalty-platform-public-api.silpo.ua" in transport.rate_limiter._paused_until
+        assert "sf-ecom-api.silpo.ua" not in transport.rate_limiter._paused_until
+
+    def test_async(self):
+        httpx = pytest.importorskip("httpx")
+        statuses = [503, 500, 200]
+
+        def handler(_request) -> httpx.Response:
+            return httpx.Response(statuses.pop(0), json={})
+
+        async def send(method: str) -> int:
+            transport = AsyncTransport(retry=RetryPolicy(retries=2, backoff=0))
+            transport.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            async with transport:
+                return (await transport.request(method, self.URL)).status_code
+
+        assert asyncio.run(send("GET")) == 200
+        statuses[:] = [500, 200]
+        assert asyncio.run(send("POST")) == 500
+
+
+class TestHostRateLimiter:
+    def test_rates(self):
+        limiter = HostRateLimiter(rate=1, rates={"graphql.silpo.ua": 1000}, burst=2)
+        url = "https://sf-ecom-api.silpo.ua/v1"
+
+        assert [limiter.try_acquire(url) == 0 for _ in range(3)] == [True, True, False]
+        assert all(limiter.try_acquire("https://graphql.silpo.ua/graphql") == 0 for _ in range(2))
+        assert HostRateLimiter().try_acquire(url) == 0
+
+    def test_pause(self):
+        limiter = HostRateLimiter()
+        url = "https://sf-ecom-api.silpo.ua/v1"
+
+        limiter.pause(url, 0.05)
+        assert limiter.try_acquire(url) > 0
+        started_at = time.monotonic()
+        limiter.acquire(url)
+        assert time.monotonic() - started_at >= 0.04
+
+
+class SlowSession(FakeSession):
+    """Every request takes the given number of seconds, one by one."""
+
+    def __init__(self, *delays):
+        super().__init__(*(make_response(200) for _ in delays))
+        self.delays = list(delays)
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            delay = self.delays[self.calls]
+            response = super().request(method, url, **kwargs)
+        time.sleep(delay)
+        response.headers["X-Delay"] = str(delay)
+        return response
+
+
+class TestCircuitBreaker:
+    URL = "https://sf-ecom-api.silpo.ua/v1/uk/branches/branch-1/products"
+
+    def test_states(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+
+        breaker.record_failure(self.URL)
+        assert breaker.allow(self.URL)
+        breaker.record_failure(self.URL)
+        assert breaker.state(self.URL) is CircuitState.OPEN
+        assert not breaker.allow(self.URL)
+        assert breaker.allow("https://graphql.silpo.ua/graphql")
+
+        time.sleep(0.05)
+        assert breaker.state(self.URL) is CircuitState.HALF_OPEN
+        # Only one probe request at a time
+        assert [breaker.allow(self.URL), breaker.allow(self.URL)] == [True, False]
+        breaker.record_failure(self.URL)
+        assert breaker.state(self.URL) is CircuitState.OPEN
+
+        time.sleep(0.05)
+        assert breaker.allow(self.URL)
+        # A cancelled probe frees its slot
+        breaker.release(self.URL)
+        assert breaker.allow(self.URL)
+        breaker.record_success(self.URL)
+        assert breaker.state(self.URL) is CircuitState.CLOSED
+
+    def test_any_error_is_recorded(self):
+        transport = Transport(retry=None, circuit_breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=0.05))
+        session = FakeSession(
+            make_response(500), requests.exceptions.ChunkedEncodingError("Connection broken"), make_response(200)
+        )
+
+        assert transport.get(self.URL, session=session).status_code == 500
+        time.sleep(0.05)
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            transport.get(self.URL, session=session)
+        # The failed probe opens the circuit again instead of holding the probe slot forever
+        assert transport.circuit_breaker.state(self.URL) is CircuitState.OPEN
+        time.sleep(0.05)
+        assert transport.get(self.URL, session=session).status_code == 200
+
+    def test_cache_fallback(self):
+        transport = Transport(
+            cache=ResponseCache(cache=MemoryCache()),  # Search results are kept for fallback by default
+            retry=None,
+            circuit_breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=60),
+        )
+        session = FakeSession(make_response(200), make_response(500))
+
+        def send(search: str) -> requests.Response:
+            return transport.get(self.URL, params={"search": search}, endpoint="product.all", session=session)
+
+        assert send("молоко").status_code == 200
+        assert send("молоко").status_code == 500  # Not cached, the policy has no TTL
+        assert send("молоко").status_code == 200
+        assert session.calls == 2
+        with pytest.raises(SilpoCircuitOpenException):
+            send("хліб")
+
+    def test_async_cache_fallback(self):
+        httpx = pytest.importorskip("httpx")
+        statuses = [200, 500, 200]
+
+        def handler(_request) -> httpx.Response:
+            return httpx.Response(statuses.pop(0), json={"items": []})
+
+        async def send_all() -> list[int]:
+            transport = AsyncTransport(
+                cache=ResponseCache(policies={"product.categories": 60}, cache=MemoryCache()),
+                retry=None,
+                circuit_breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=60),
+            )
+            transport.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            params = {"search": "молоко"}
+            async with transport:
+                # The second search opens the circuit, the third one returns the cached response
+                responses = [await transport.get(self.URL, params=params, endpoint="product.all") for _ in range(3)]
+                # Fresh responses are returned from the cache without requests
+                categories_url = "https://graphql.silpo.ua/categories"
+                responses += [await transport.get(categories_url, endpoint="product.categories") for _ in range(2)]
+            return [response.status_code for response in responses]
+
+        assert asyncio.run(send_all()) == [200, 500, 200, 200, 200]
+        assert statuses == []
+
+
+class TestHedging:
+    URL = TestCircuitBreaker.URL
+
+    def test_delay(self):
+        hedge = HedgePolicy(min_samples=10)
+
+        for latency in range(1, 10):
+            hedge.record("product.all", latency / 100)
+        assert hedge.delay("product.all") is None
+        for latency in range(10, 101):
+            hedge.record("product.all", latency / 100)
+            hedge.record("cheque.detail", latency / 100)
+        assert hedge.delay("product.all") == 0.96
+        assert hedge.delay("cheque.detail") is None
+
+    def test_first_response_wins(self):
+        hedge = HedgePolicy(min_samples=1, min_delay=0)
+        hedge.record("product.all", 0.05)
+        transport = Transport(hedge=hedge)
+        session = SlowSession(1, 0)
+
+        started_at = time.monotonic()
+        resp = transport.get(self.URL, endpoint="product.all", session=session)
+        assert resp.headers["X-Delay"] == "0"
+        assert time.monotonic() - started_at < 0.5
+        assert session.calls == 2
+        # The slower response is closed once it arrives
+        deadline = time.monotonic() + 5
+        while not session.results[0].raw.closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert session.results[0].raw.closed
+        assert not resp.raw.closed
+
+        # POST is not hedged, it could be processed twice
+        session = SlowSession(0.1, 0)
+        assert transport.post(self.URL, endpoint="product.all", session=session).headers["X-Delay"] == "0.1"
+        assert session.calls == 1
+        transport.close()
+
+    def test_concurrent_requests_are_not_queued(self):
+        hedge = HedgePolicy(min_samples=1, min_delay=0)
+        hedge.record("product.all", 0.05)
+        transport = Transport(hedge=hedge)
+
+        def send(_) -> str:
+            return transport.get(self.URL, endpoint="product.all", session=SlowSession(0.5, 0)).headers["X-Delay"]
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            assert list(executor.map(send, range(16))) == ["0"] * 16
+        # Every request is hedged after its own delay, not after the slow requests of the others
+        assert time.monotonic() - started_at < 0.4
+
+    def test_async_slower_response_is_closed(self):
+        httpx = pytest.importorskip("httpx")
+        responses = []
+
+        async def hedge():
+            answered = asyncio.Event()
+
+            async def send_once() -> httpx.Response:
+                response = httpx.Response(200, stream=httpx.ByteStream(b"{}"))
+                responses.append(response)
+                if len(responses) == 1:
+                    await answered.wait()  # The first request answers right after the hedged one
+                else:
+                    answered.set()
+                return response
+
+            async with AsyncTransport() as transport:
+                return await transport._hedged(send_once, delay=0.01)
+
+        assert asyncio.run(hedge()) is responses[1]
+        assert responses[0].is_closed
+        assert not responses[1].is_closed
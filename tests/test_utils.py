@@ -1,8 +1,13 @@
+import asyncio
+import threading
+import time
 from datetime import datetime, timezone
 
 import pytest
 
-from pysilpo.utils.cursor import Cursor
+from pysilpo.utils.cursor import AsyncCursor, Cursor
+from pysilpo.utils.exceptions import SilpoRequestException
+from pysilpo.utils.page_size import AdaptivePageSize
 from pysilpo.utils.utils import subtract_months
 
 
@@ -124,6 +129,297 @@ class TestCursor:
         assert cursor[1000::2] == []
 
 
+class SlowDummyGenerator(DummyGenerator):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.offsets = []
+
+    def __call__(self, _offset: int):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.offsets.append(_offset)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        return super().__call__(_offset)
+
+
+class TestCursorPrefetch:
+    def test_iter_in_order(self):
+        generator = SlowDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, prefetch=4)
+
+        assert list(cursor) == list(generator.values)
+        assert sorted(generator.offsets) == list(range(0, len(generator.values), generator.limit))
+        assert generator.max_in_flight > 1
+        assert cursor._executor is None
+
+    def test_bounded_concurrency(self):
+        generator = SlowDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, prefetch=4, max_workers=2)
+
+        assert list(cursor) == list(generator.values)
+        assert generator.max_in_flight <= 2
+
+    def test_random_access(self):
+        generator = SlowDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, prefetch=2)
+
+        assert cursor[12] == 12
+        assert cursor[3] == 3
+        assert len(cursor) == len(generator.values)
+        cursor.close()
+
+
+class CountingDummyGenerator(DummyGenerator):
+    def __init__(self):
+        super().__init__()
+        self.offsets = []
+
+    def __call__(self, _offset: int):
+        self.offsets.append(_offset)
+        return super().__call__(_offset)
+
+
+class TestCursorMemory:
+    def test_max_pages(self):
+        generator = CountingDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, max_pages=2)
+
+        assert list(cursor) == list(generator.values)
+        assert list(cursor.pages) == [3, 4]
+        assert cursor.fetched_count == len(generator.values)
+
+    def test_lru_eviction(self):
+        generator = CountingDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, max_pages=2)
+
+        assert (cursor[0], cursor[5], cursor[1], cursor[10]) == (0, 5, 1, 10)
+        # Page 1 is least recently used
+        assert list(cursor.pages) == [0, 2]
+        # Evicted page is fetched again
+        assert cursor[6] == 6
+        assert generator.offsets == [0, 5, 10, 5]
+        assert cursor.fetched_count == 15
+
+    def test_streaming(self):
+        generator = CountingDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, streaming=True)
+
+        for i, value in enumerate(cursor):
+            assert value == i
+            assert len(cursor.pages) <= 1
+        assert cursor.pages == {}
+        assert cursor[7] == 7
+        assert generator.offsets == [0, 5, 10, 15, 20, 5]
+
+    def test_async_streaming(self):
+        generator = AsyncDummyGenerator()
+        cursor = AsyncCursor(generator=generator, page_size=generator.limit, streaming=True, max_pages=1)
+
+        async def collect():
+            values = []
+            async for value in cursor:
+                values.append(value)
+                assert len(cursor.pages) <= 1
+            return values
+
+        assert asyncio.run(collect()) == list(generator.values)
+        assert cursor.pages == {}
+
+
+class TestCursorSlicing:
+    @pytest.fixture
+    def generator(self):
+        return CountingDummyGenerator()
+
+    @pytest.fixture
+    def counted_cursor(self, generator):
+        return Cursor(generator=generator, page_size=generator.limit, counter=lambda: len(generator.values))
+
+    def test_fetch_only_needed_pages(self, generator):
+        cursor = Cursor(generator=generator, page_size=generator.limit)
+
+        assert cursor[7:12] == [7, 8, 9, 10, 11]
+        assert sorted(generator.offsets) == [5, 10]
+        assert cursor[14:3:-4] == [14, 10, 6]
+        assert sorted(generator.offsets) == [5, 10]
+
+    def test_count(self, generator, counted_cursor):
+        assert counted_cursor.count() == len(generator.values)
+        assert generator.offsets == []
+
+    def test_negative_index(self, generator, counted_cursor):
+        assert counted_cursor[-1] == 22
+        assert counted_cursor[-3:] == [20, 21, 22]
+        assert generator.offsets == [20]
+
+    def test_concurrent_pages(self):
+        generator = SlowDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=generator.limit, counter=lambda: len(generator.values))
+
+        assert cursor[::3] == list(range(0, 23, 3))
+        assert sorted(generator.offsets) == [0, 5, 10, 15, 20]
+        assert generator.max_in_flight > 1
+
+    def test_async_slice(self):
+        generator = AsyncDummyGenerator()
+
+        async def counter():
+            return len(generator.values)
+
+        cursor = AsyncCursor(generator=generator, page_size=generator.limit, counter=counter)
+        assert asyncio.run(cursor[-3:]) == [20, 21, 22]
+        assert list(cursor.pages) == [4]
+
+
+class AsyncDummyGenerator(DummyGenerator):
+    async def __call__(self, _offset: int):
+        return super().__call__(_offset)
+
+
+class TestAsyncCursor:
+    @staticmethod
+    def run(coro):
+        return asyncio.run(coro)
+
+    @pytest.fixture
+    def cursor(self):
+        generator = AsyncDummyGenerator()
+        return AsyncCursor(generator=generator, page_size=generator.limit)
+
+    def test_count(self, cursor):
+        assert self.run(cursor.count()) == len(cursor.generator.values)
+        assert cursor.fetched_count == cursor.page_size
+
+    def test_async_iter(self, cursor):
+        async def collect():
+            return [val async for val in cursor]
+
+        assert self.run(collect()) == list(cursor.generator.values)
+        assert cursor.curr == 0
+
+    def test_async_prefetch(self):
+        generator = AsyncDummyGenerator()
+        cursor = AsyncCursor(generator=generator, page_size=generator.limit, prefetch=3)
+
+        async def collect():
+            return [val async for val in cursor]
+
+        assert self.run(collect()) == list(generator.values)
+        assert cursor._pending == {}
+
+    def test_index(self, cursor):
+        assert self.run(cursor.first()) == 0
+        assert self.run(cursor[-1]) == list(cursor.generator.values)[-1]
+        assert self.run(cursor[1:3]) == [1, 2]
+        assert self.run(cursor[20:]) == [20, 21, 22]
+
+        with pytest.raises(IndexError):
+            self.run(cursor[1000])
+
+
+class LimitedDummyGenerator:
+    """Accepts `_limit`, but fails on pages larger than `max_limit` items."""
+
+    def __init__(self, max_limit: int = 1000):
+        self.values = range(100)
+        self.max_limit = max_limit
+        self.requests = []
+
+    def __call__(self, _offset: int, _limit: int = 5):
+        self.requests.append((_offset, _limit))
+        if _limit > self.max_limit:
+            raise SilpoRequestException("Limit is too large")
+        return list(self.values[_offset : _offset + _limit]), len(self.values)
+
+
+class TestAdaptivePageSize:
+    def test_grow(self):
+        generator = LimitedDummyGenerator()
+        cursor = Cursor(generator=generator, page_size=5, page_sizer=AdaptivePageSize(step=5, max_limit=40))
+
+        assert list(cursor) == list(generator.values)
+        # The last request checks that there are no items beyond the reported total
+        assert generator.requests == [(0, 5), (5, 10), (15, 20), (35, 40), (75, 25), (100, 5)]
+        assert all(len(page) == 5 for page in cursor.pages.values())
+
+    def test_under_reported_total(self):
+        values = list(range(7))
+
+        def generator(_offset: int, _limit: int = 5):
+            return values[_offset : _offset + _limit], 5
+
+        cursor = Cursor(generator=generator, page_size=5, page_sizer=AdaptivePageSize(step=5))
+        assert list(cursor) == values
+
+    def test_back_off_on_errors(self):
+        generator = LimitedDummyGenerator(max_limit=15)
+        page_sizer = AdaptivePageSize(step=5, max_limit=40)
+        cursor = Cursor(generator=generator, page_size=5, page_sizer=page_sizer)
+
+        assert list(cursor) == list(generator.values)
+        assert (15, 20) in generator.requests
+        assert page_sizer.max_limit == 15
+        assert max(limit for _, limit in generator.requests[3:]) == 15
+
+    def test_ceiling_recovers(self):
+        page_sizer = AdaptivePageSize(step=5, max_limit=40, recover_after=3)
+        failures = [20]
+
+        def fetch(limit: int) -> int:
+            if limit in failures:
+                failures.remove(limit)
+                raise SilpoRequestException("Gateway timeout")
+            return limit
+
+        # 20 fails once, the ceiling of 15 is lifted after 3 successful requests
+        assert [page_sizer.call(fetch)[1] for _ in range(7)] == [5, 10, 10, 15, 15, 30, 40]
+
+    def test_back_off_on_slow_responses(self):
+        page_sizer = AdaptivePageSize(step=5, target_latency=0)
+        page_sizer.limit = 40
+
+        assert page_sizer.call(lambda limit: limit) == (40, 40)
+        assert page_sizer.limit == 20
+
+    def test_payload(self):
+        page_sizer = AdaptivePageSize(step=5, max_payload=100)
+        page_sizer.limit = 20
+
+        def fetch(limit: int) -> int:
+            page_sizer.record_payload(limit * 15)
+            return limit
+
+        # Pages of 5 items are larger than half of max_payload, so they don't grow
+        assert [page_sizer.call(fetch)[1] for _ in range(4)] == [20, 10, 5, 5]
+
+    def test_failure_on_smallest_page(self):
+        generator = LimitedDummyGenerator(max_limit=0)
+        cursor = Cursor(generator=generator, page_size=5, page_sizer=AdaptivePageSize(step=5))
+
+        with pytest.raises(SilpoRequestException):
+            cursor.first()
+
+    def test_async(self):
+        generator = LimitedDummyGenerator()
+
+        async def async_generator(_offset: int, _limit: int = 5):
+            return generator(_offset=_offset, _limit=_limit)
+
+        cursor = AsyncCursor(generator=async_generator, page_size=5, page_sizer=AdaptivePageSize(step=5))
+
+        async def collect():
+            return [value async for value in cursor]
+
+        assert asyncio.run(collect()) == list(generator.values)
+        assert len(generator.requests) == 6
+
+
 class TestSubtractMonths:
     """Test suite for the subtract_months function."""
 